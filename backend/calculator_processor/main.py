@@ -1,3 +1,4 @@
+import io
 import json
 import boto3
 import os
@@ -8,10 +9,10 @@ from bson.objectid import ObjectId
 import logging
 import time
 import threading
+from itertools import islice
 from fastapi import FastAPI, HTTPException
 import uvicorn
 import dotenv
-from collections import Counter
 
 dotenv.load_dotenv()
 
@@ -29,9 +30,11 @@ sqs_client = boto3.client("sqs")
 # Environment variables
 MONGODB_URI = os.environ.get("MONGODB_URL")
 QUEUE_URL = os.environ.get("SQS_QUEUE_URL")
+# Element rows are written to ec_elements with insert_many batches of this size
+ELEMENT_BATCH_SIZE = int(os.environ.get("ELEMENT_BATCH_SIZE", 1000))
 
 # Import calculation modules
-from utils import calculator
+from utils import calculator, calculator_utils, ec_table, element_index, embedding_cache
 
 # Global variables for worker state
 worker_running = False
@@ -66,6 +69,41 @@ def connect_to_mongodb():
     return client[db_name]
 
 
+def ensure_indexes(db):
+    """Create the indexes element rows are paged and filtered with"""
+    db.ec_elements.create_index([("ec_breakdown_id", 1), ("position", 1)])
+    db.ec_elements.create_index(
+        [("ec_breakdown_id", 1), ("element", 1), ("position", 1)]
+    )
+
+
+def element_documents(ec_breakdown_id, breakdown):
+    """Yield the element rows of a breakdown as ec_elements documents, in order"""
+    position = 0
+    for building_system in breakdown.get("ec_breakdown", []):
+        for element in building_system.get("elements", []):
+            yield {
+                "ec_breakdown_id": ec_breakdown_id,
+                "position": position,
+                "building_system": building_system["category"],
+                "units": ec_table.EXCEL_UNITS.get(element["element"], "kg"),
+                **element,
+            }
+            position += 1
+
+
+def insert_elements(db, documents):
+    """Insert element documents in ordered batches and return how many were inserted"""
+    documents = iter(documents)
+    count = 0
+    while True:
+        batch = list(islice(documents, ELEMENT_BATCH_SIZE))
+        if not batch:
+            return count
+        db.ec_elements.insert_many(batch, ordered=True)
+        count += len(batch)
+
+
 def transform_ec_data(data):
     # Initialize the new structure
     summary = {"by_building_system": {}, "by_material": {}, "by_element": {}}
@@ -111,8 +149,62 @@ def transform_ec_data(data):
     return {"summary": summary}
 
 
-def process_ifc_file(s3_path, enable_ai_material_matcher=False):
-    """Download and process IFC file, returning EC calculations"""
+def takeoff_s3_key(project_id, ifc_version, calculation_type):
+    """Return the S3 key of the takeoff stored for a calculation of an IFC version"""
+    return f"takeoffs/{project_id}/{ifc_version}_{calculation_type}.npz"
+
+
+def save_takeoff(bucket, key, takeoff):
+    """Upload a takeoff so material changes can be recalculated without the IFC"""
+    try:
+        buffer = io.BytesIO()
+        ec_table.save_takeoff(takeoff, buffer)
+        buffer.seek(0)
+        s3_client.upload_fileobj(buffer, bucket, key)
+        logger.info(f"Stored takeoff at s3://{bucket}/{key}")
+        return True
+    except Exception as e:
+        logger.error(f"Error storing takeoff: {str(e)}")
+        return False
+
+
+def recalculate_from_takeoff(s3_path, key):
+    """Recalculate EC from the stored takeoff of an IFC file.
+
+    Returns the same results as process_ifc_file, or None when there is no
+    usable takeoff and the IFC file has to be processed again.
+    """
+    bucket, _ = extract_s3_info(s3_path)
+    try:
+        buffer = io.BytesIO()
+        s3_client.download_fileobj(bucket, key, buffer)
+        buffer.seek(0)
+        takeoff = ec_table.load_takeoff(buffer)
+    except Exception as e:
+        logger.info(f"No usable takeoff at s3://{bucket}/{key}: {str(e)}")
+        return None
+
+    result = calculator.recalculate_embodied_carbon(takeoff, with_breakdown=True)
+    if result is None:
+        return None
+    total_ec, ec_data, summary_data, excel_data, all_matched_materials = result
+    logger.info(f"Recalculated EC from the takeoff at s3://{bucket}/{key}")
+    return (
+        total_ec,
+        takeoff["gfa"],
+        summary_data,
+        ec_data,
+        excel_data,
+        all_matched_materials,
+    )
+
+
+def process_ifc_file(s3_path, enable_ai_material_matcher=False, takeoff_key=None):
+    """Download and process IFC file, returning EC calculations.
+
+    When takeoff_key is given, the takeoff of the calculation is stored under
+    it in the bucket of the IFC file.
+    """
     try:
         bucket, key = extract_s3_info(s3_path)
 
@@ -123,10 +215,13 @@ def process_ifc_file(s3_path, enable_ai_material_matcher=False):
         # Download the file from S3
         s3_client.download_file(bucket, key, temp_path)
 
+        # Parse the model once and share the handle between EC and GFA
+        ifc_file = calculator_utils.open_ifc(temp_path)
+
         # Calculate embodied carbon
         print("calculating ec")
-        result = calculator.calculate_embodied_carbon(
-            temp_path, enable_ai_material_matcher, with_breakdown=True
+        result, takeoff = calculator.calculate_embodied_carbon(
+            ifc_file, enable_ai_material_matcher, with_breakdown=True, with_takeoff=True
         )
         if result is None:
             logger.error("calculator.calculate_embodied_carbon returned None")
@@ -139,11 +234,15 @@ def process_ifc_file(s3_path, enable_ai_material_matcher=False):
         #     raise ValueError("Failed to generate EC breakdown summary")
 
         print("calculating gfa")
-        total_gfa = calculator.calculate_gfa(temp_path)
+        total_gfa = calculator.calculate_gfa(ifc_file)
         if total_gfa is None:
             logger.error("calculator.calculate_gfa returned None")
             raise ValueError("Failed to calculate GFA")
 
+        if takeoff_key:
+            takeoff["gfa"] = total_gfa
+            save_takeoff(bucket, takeoff_key, takeoff)
+
         # Clean up
         os.unlink(temp_path)
 
@@ -159,6 +258,9 @@ def process_ifc_file(s3_path, enable_ai_material_matcher=False):
     except Exception as e:
         logger.error(f"Error processing IFC file: {str(e)}")
         raise
+    finally:
+        # The index is shared by the EC and GFA steps, not kept between jobs
+        element_index.release_model_index()
 
 
 def update_mongodb(
@@ -169,23 +271,49 @@ def update_mongodb(
     total_gfa,
     summary_data,
     ec_data,
-    excel_data,
     all_matched_materials,
     calculation_status_field,
     ec_breakdown_id_field,
     total_ec_field,
     material_counts,
 ):
-    """Update MongoDB with EC calculation results"""
+    """Update MongoDB with EC calculation results.
+
+    The element rows of the breakdown are stored in ec_elements, one document
+    per element, and the ec_breakdown document only keeps the summaries. The
+    excel rows are the element rows expanded per material, so they aren't
+    stored separately.
+    """
+    ec_breakdown_id = None
     try:
+        # The EC cube and material counts are stored next to the breakdown so
+        # that they can be queried without loading the breakdown
+        ec_cube = ec_data.get("ec_cube", [])
+        breakdown = {
+            key: value
+            for key, value in ec_data.items()
+            if key not in ("ec_cube", "material_counts")
+        }
+        breakdown["ec_breakdown"] = [
+            {**building_system, "elements": []}
+            for building_system in ec_data.get("ec_breakdown", [])
+        ]
+        element_count = sum(
+            len(building_system.get("elements", []))
+            for building_system in ec_data.get("ec_breakdown", [])
+        )
+        catalog_version = ec_data.get("material_catalog_version")
+
         # Insert EC breakdown data
         ec_breakdown_entry = {
             "project_id": ObjectId(project_id),
             "ifc_version": ifc_version,
             "total_ec": total_ec,
             "summary": summary_data,
-            "breakdown": ec_data,
-            "excel_data": excel_data,
+            "breakdown": breakdown,
+            "element_count": element_count,
+            "ec_cube": ec_cube,
+            "material_catalog_version": catalog_version,
             # "all_matched_materials": all_matched_materials,
             "material_counts": material_counts,
             "timestamp": datetime.now(),
@@ -193,6 +321,7 @@ def update_mongodb(
 
         ec_breakdown_result = db.ec_breakdown.insert_one(ec_breakdown_entry)
         ec_breakdown_id = ec_breakdown_result.inserted_id
+        insert_elements(db, element_documents(ec_breakdown_id, ec_data))
         logger.info(
             f"Updating MongoDB with: {total_gfa}, {total_ec}, {ec_breakdown_id}"
         )
@@ -215,6 +344,11 @@ def update_mongodb(
     except Exception as e:
         logger.error(f"Error updating MongoDB: {str(e)}")
 
+        # Don't leave a partial breakdown behind
+        if ec_breakdown_id is not None:
+            db.ec_elements.delete_many({"ec_breakdown_id": ec_breakdown_id})
+            db.ec_breakdown.delete_one({"_id": ec_breakdown_id})
+
         # Mark calculation as failed in database
         db.projects.update_one(
             {"_id": ObjectId(project_id)},
@@ -269,7 +403,15 @@ def process_sqs_message(db, message):
             },
         )
 
-        # Calculate EC
+        # Calculate EC. Adding a material only changes EC factors, so the
+        # stored takeoff of the version is joined with the new materials
+        # instead of processing the IFC file again
+        takeoff_key = takeoff_s3_key(project_id, ifc_version, calculation_type)
+        result = None
+        if message_body.get("trigger") == "material_added":
+            result = recalculate_from_takeoff(s3_path, takeoff_key)
+        if result is None:
+            result = process_ifc_file(s3_path, enable_ai_material_matcher, takeoff_key)
         (
             total_ec,
             total_gfa,
@@ -277,23 +419,10 @@ def process_sqs_message(db, message):
             ec_data,
             excel_data,
             all_matched_materials,
-        ) = process_ifc_file(s3_path, enable_ai_material_matcher)
-
-        material_counts = {}
-
-        # Extract all materials from the EC breakdown
-        if "ec_breakdown" in ec_data:
-            for category in ec_data["ec_breakdown"]:
-                if "elements" in category:
-                    for element in category["elements"]:
-                        if "materials" in element:
-                            for material in element["materials"]:
-                                if "material" in material:
-                                    material_name = material["material"]
-                                    if material_name in material_counts:
-                                        material_counts[material_name] += 1
-                                    else:
-                                        material_counts[material_name] = 1
+        ) = result
+
+        # Counted by the calculator while summarising the breakdown
+        material_counts = ec_data.get("material_counts", {})
 
         # Update MongoDB with results
         ec_breakdown_id = update_mongodb(
@@ -304,7 +433,6 @@ def process_sqs_message(db, message):
             total_gfa,
             summary_data,
             ec_data,
-            excel_data,
             all_matched_materials,
             calculation_status_field,
             ec_breakdown_id_field,
@@ -351,6 +479,7 @@ def poll_sqs_queue():
     # Connect to MongoDB
     try:
         db = connect_to_mongodb()
+        ensure_indexes(db)
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB: {str(e)}")
         worker_metrics["last_error"] = f"MongoDB connection error: {str(e)}"
@@ -469,6 +598,7 @@ async def get_metrics():
         "uptime_seconds": uptime_seconds,
         "queue": queue_stats,
         "metrics": worker_metrics,
+        "embedding_cache": embedding_cache.stats(),
     }
 
 
@@ -3,7 +3,6 @@ import time
 start_time = time.time()
 
 import ifcopenshell
-from ifcopenshell.util.element import get_psets
 from loguru import logger
 import sys
 import ifcopenshell
@@ -11,7 +10,12 @@ import ifcopenshell.geom
 import numpy as np
 import os
 import math
-
+import multiprocessing
+import hashlib
+import json
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 # Add a new handler that only shows INFO level and above
 logger.remove()
@@ -19,124 +23,95 @@ logger.add(sys.stderr, level="INFO")
 
 # import calculator_utils
 from . import calculator_utils
+from . import diagnostics
+from . import ec_table
+from . import element_cache
+from . import element_index
+from . import geometry
+from . import rebar
 
 MaterialList = calculator_utils.MaterialList
 MaterialsToIgnore = calculator_utils.MaterialsToIgnore
-material_embeddings = calculator_utils.material_embeddings
-material_data_df = calculator_utils.material_data_df
 
 MATERIAL_REAPLCE = False
 
+# Base quantity sets of the categories that fall back to geometry when
+# NetVolume (or the area used by layered elements) is missing
+GEOMETRY_FALLBACK_QTOS = {
+    "IfcSlab": "Qto_SlabBaseQuantities",
+    "IfcWall": "Qto_WallBaseQuantities",
+    "IfcStairFlight": "Qto_StairFlightBaseQuantities",
+    "IfcRailing": "Qto_RailingBaseQuantities",
+    "IfcMember": "Qto_MemberBaseQuantities",
+    "IfcPlate": "Qto_PlateBaseQuantities",
+}
+
+
+def has_quantity(index, element, *names):
+    """Check whether the element's fallback quantity set has any of the quantities"""
+    qto_name = GEOMETRY_FALLBACK_QTOS[element.is_a()]
+    return any(
+        index.get_quantity(element, qto_name, name) is not None for name in names
+    )
+
+
+def collect_geometry_fallbacks(index, elements):
+    """Return the elements whose volume or area has to come from their geometry"""
+    fallbacks = []
+    for element in elements:
+        if element.is_a() not in GEOMETRY_FALLBACK_QTOS:
+            continue
+
+        if element.is_a("IfcPlate"):
+            # Plates estimate their volume from NetArea before using geometry
+            needs_geometry = not has_quantity(index, element, "NetVolume", "NetArea")
+        elif element.is_a("IfcSlab"):
+            layers = sum(
+                len(material.layer_names) or 1
+                for material in index.get_materials(element)
+            )
+            needs_geometry = not has_quantity(index, element, "NetVolume") or (
+                layers > 1
+                and not has_quantity(
+                    index, element, "NetArea", "GrossArea", "NetSideArea"
+                )
+            )
+        else:
+            needs_geometry = not has_quantity(index, element, "NetVolume")
+
+        if needs_geometry:
+            fallbacks.append(element)
+    return fallbacks
 
-def calculate_beams(beams):
-    """Calculate embodied carbon for beams, using material matching if needed"""
-    total_ec = 0
-    beam_elements = []
+
+def calculate_beams(beams, index=None, table=None):
+    """Add the beams to the EC table, using material matching if needed"""
+    index = element_index.get_index(beams, index)
+    if table is None:
+        table = ec_table.ECTable()
     missing_materials = []
-    excel_data = []
     matched_materials = []
 
-    for beam in beams:
+    rebar_volumes = rebar.beam_volumes(beams, index)
+
+    for beam, rebar_vol in zip(beams, rebar_volumes.tolist()):
         current_quantity = None  # in volume
         current_material = None
 
-        psets = get_psets(beam)
-        rebar_set = psets.get("Rebar Set")
-        if rebar_set is None:
-            logger.error("Rebar set not found")
-        if rebar_set:
-            BL = rebar_set.get("BottomLeft")
-            BM = rebar_set.get("BottomMiddle")
-            BR = rebar_set.get("BottomRight")
-            TL = rebar_set.get("TopLeft")
-            TM = rebar_set.get("TopMiddle")
-            TR = rebar_set.get("TopRight")
-            if (
-                BL == None
-                or BM == None
-                or BR == None
-                or TL == None
-                or TM == None
-                or TR == None
-            ):
-                logger.error("Rebar part not found")
-            BLno, BLarea = BL.split("H")
-            BMno, BMarea = BM.split("H")
-            BRno, BRarea = BR.split("H")
-            TLno, TLarea = TL.split("H")
-            TMno, TMarea = TM.split("H")
-            TRno, TRarea = TR.split("H")
-
-        dimensions = psets.get("Dimensions")
-        if dimensions is None:
-            logger.error("Dimensions/Diameter not found")
-        if dimensions:
-            lengthmm = dimensions.get("Length")
-            if lengthmm is None:
-                logger.error("Length not found")
-            else:
-                length = lengthmm / 1000
-
-        if rebar_set:
-            rebar_vol = (
-                (
-                    (
-                        int(TLno) * 3.14 * ((int(TLarea) / 2000) ** 2)
-                        + int(BLno) * 3.14 * ((int(BLarea) / 2000) ** 2)
-                    )
-                    * (1 / 3)
-                    * length
-                )
-                + (
-                    (
-                        int(TMno) * 3.14 * ((int(TMarea) / 2000) ** 2)
-                        + int(BMno) * 3.14 * ((int(BMarea) / 2000) ** 2)
-                    )
-                    * (1 / 3)
-                    * length
-                )
-                + (
-                    (
-                        int(TRno) * 3.14 * ((int(TRarea) / 2000) ** 2)
-                        + int(BRno) * 3.14 * ((int(BRarea) / 2000) ** 2)
-                    )
-                    * (1 / 3)
-                    * length
-                )
-            )
+        rebar_set = index.get_psets(beam).get("Rebar Set")
 
-        if hasattr(beam, "IsDefinedBy"):
-            for definition in beam.IsDefinedBy:
-                if definition.is_a("IfcRelDefinesByProperties"):
-                    property_def = definition.RelatingPropertyDefinition
-                    if (
-                        property_def.is_a("IfcElementQuantity")
-                        and property_def.Name == "Qto_BeamBaseQuantities"
-                    ):
-                        for quantity in property_def.Quantities:
-                            if (
-                                quantity.is_a("IfcQuantityVolume")
-                                and quantity.Name == "NetVolume"
-                            ):
-                                logger.debug(
-                                    f"Found NetVolume for {beam.Name}: {quantity.VolumeValue}"
-                                )
-                                current_quantity = quantity.VolumeValue
-                                break
-                        if current_quantity is not None:
-                            break
+        current_quantity = index.get_quantity(
+            beam, "Qto_BeamBaseQuantities", "NetVolume"
+        )
+        if current_quantity is not None:
+            logger.debug("Found NetVolume for {}: {}", beam.Name, current_quantity)
 
         # Get material information
-        if hasattr(beam, "HasAssociations"):
-            for association in beam.HasAssociations:
-                if association.is_a("IfcRelAssociatesMaterial"):
-                    material = association.RelatingMaterial
-                    if material.is_a("IfcMaterial"):
-                        logger.debug(
-                            f"Found material '{material.Name}', as IfcMaterial"
-                        )
-                        current_material = material.Name
-                        break
+        for material in index.get_materials(beam):
+            if material.kind == "IfcMaterial":
+                logger.debug("Found material '{}', as IfcMaterial", material.name)
+                current_material = material.name
+                break
 
         # Check if material exists in our database
         current_material_ec = (
@@ -173,6 +148,7 @@ def calculate_beams(beams):
         if current_material_ec is None and MATERIAL_REAPLCE:
             # Use material matching instead of raising an error
             element_data = {
+                "element_id": beam.id(),
                 "element_type": beam.is_a(),
                 "element_name": beam.Name if hasattr(beam, "Name") else None,
                 "material_name": current_material,
@@ -187,8 +163,12 @@ def calculate_beams(beams):
             )
 
             if similar_material and similar_material in MaterialList:
-                logger.info(
-                    f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                diagnostics.report(
+                    "Beam",
+                    "Material replaced by a similar material",
+                    beam,
+                    similar_material,
+                    level="INFO",
                 )
                 matched_materials.append(
                     {
@@ -202,173 +182,71 @@ def calculate_beams(beams):
                 current_material = similar_material
                 current_material_ec = MaterialList.get(current_material)
             else:
-                logger.error(
-                    f"Material '{current_material}' not found and no similar material found. Skipping this beam."
+                diagnostics.report(
+                    "Beam", "Material not found", beam, current_material, level="ERROR"
                 )
                 continue
 
         if current_quantity is None:
-            logger.error(f"No volume found for beam {beam.Name}. Skipping.")
+            diagnostics.report("Beam", "No volume", beam, None, level="ERROR")
             missing_materials.append(beam.id())
             continue
 
-        material_ec_perkg, material_density = current_material_ec
-        materials_breakdown = []
-
-        if rebar_set == None:
-            concrete_ec = material_ec_perkg * material_density * current_quantity
-            materials_breakdown.append(
-                {
-                    "material": current_material,
-                    "material_mass": current_quantity * material_density,
-                    "ec": concrete_ec,
-                }
-            )
-            current_ec = concrete_ec
-        else:
-            concrete_ec = (
-                material_ec_perkg * material_density * (current_quantity - rebar_vol)
-            )
-            rebar_ec = rebar_vol * 2.510 * 7850
-
-            materials_breakdown.append(
-                {
-                    "material": current_material,
-                    "material_mass": current_quantity,
-                    "ec": concrete_ec,
-                }
-            )
-            materials_breakdown.append(
-                {"material": "Rebar", "material_mass": rebar_vol * 7850, "ec": rebar_ec}
-            )
-
-            logger.debug(f"EC for {beam.Name}'s rebars is {rebar_ec}")
-            current_ec = concrete_ec + rebar_ec
-
-        logger.debug(f"EC for {beam.Name} is {current_ec}")
-
-        beam_elements.append(
-            {"element": "Beam", "ec": current_ec, "materials": materials_breakdown}
-        )
-        for material_item in materials_breakdown:
-            excel_data.append(
-                [
-                    beam.id(),  # Element ID
-                    beam.is_a(),  # IFC Type
-                    "Beam",  # Element Type
-                    material_item["material"],  # Material
-                    material_item["ec"],  # Material EC
-                    material_item["material_mass"],  # Total material mass
-                    "kg",
-                ]
-            )
-        total_ec += current_ec
+        # The concrete volume excludes the reinforcement, for its EC and, as
+        # for columns, its mass. Before the takeoff table the mass of the
+        # concrete of reinforced beams was their gross volume.
+        row = table.add_element(beam, "Beam", rebar_volume=rebar_vol)
+        table.add_line(row, current_material, current_quantity - rebar_vol)
 
-    logger.debug(f"Total EC for beams is {total_ec}")
-    return total_ec, beam_elements, missing_materials, excel_data, matched_materials
+    return table, missing_materials, matched_materials
 
 
-def calculate_columns(columns):
-    """Calculate embodied carbon for columns, using material matching if needed"""
-    total_ec = 0
+def calculate_columns(columns, index=None, table=None):
+    """Add the columns to the EC table, using material matching if needed"""
+    index = element_index.get_index(columns, index)
+    if table is None:
+        table = ec_table.ECTable()
     quantities = {}
     materials = []
-    column_elements = []
     missing_materials = []
-    excel_data = []
     matched_materials = []
 
-    for column in columns:
+    rebar_volumes = rebar.column_volumes(columns, index)
+
+    for column, rebar_vol in zip(columns, rebar_volumes.tolist()):
         current_quantity = None
         current_material = None
-        rebar = None
-        height = None
-        rebar_vol = None
-        materials_breakdown = []
-
-        psets = get_psets(column)
-        rebar_set = psets.get("Rebar Set")
-
-        if rebar_set is None:
-            logger.error("Rebar set not found")
-        if rebar_set:
-            rebar = rebar_set.get("MainRebar")
-            if rebar is None:
-                logger.error("Rebar not found")
-
-        dimensions = psets.get("Dimensions")
-        if dimensions is None:
-            logger.error("Dimensions/Diameter not found")
-        if dimensions:
-            heightmm = dimensions.get("Height")
-            if heightmm is None:
-                heightmm = dimensions.get("Length")
-                if heightmm is None:
-                    logger.error("Height not found")
-                else:
-                    height = heightmm / 1000
-            else:
-                height = heightmm / 1000
-
-        if rebar and height:
-            rebar_no, area = rebar.split("H")
-            rebar_vol = height * int(rebar_no) * 3.14 * ((int(area) / 2000) ** 2)
-
-        if hasattr(column, "IsDefinedBy"):
-            for definition in column.IsDefinedBy:
-                if definition.is_a("IfcRelDefinesByProperties"):
-                    property_def = definition.RelatingPropertyDefinition
-                    if (
-                        property_def.is_a("IfcElementQuantity")
-                        and property_def.Name == "Qto_ColumnBaseQuantities"
-                    ):
-                        for quantity in property_def.Quantities:
-                            if (
-                                quantity.is_a("IfcQuantityVolume")
-                                and quantity.Name == "NetVolume"
-                            ):
-                                logger.debug(f"Found NetVolume for {column.Name}")
-                                quantities[quantity.Name] = quantity.VolumeValue
-                                current_quantity = quantity.VolumeValue
-                                break
-                        if current_quantity is not None:
-                            break
-
-        if hasattr(column, "HasAssociations"):
-            for association in column.HasAssociations:
-                if association.is_a("IfcRelAssociatesMaterial"):
-                    material = association.RelatingMaterial
-                    if material.is_a("IfcMaterial"):
-                        logger.debug(
-                            f"Found material '{material.Name}', as IfcMaterial"
-                        )
-                        materials.append(material.Name)
-                        current_material = material.Name
-                        break
-                    elif material.is_a("IfcMaterialLayerSetUsage"):
-                        for layer in material.ForLayerSet.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSetUsage"
-                            )
-                            materials.append(layer.Material.Name)
-                            current_material = layer.Material.Name
-                            break
-                    elif material.is_a("IfcMaterialLayerSet"):
-                        for layer in material.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSet"
-                            )
-                            materials.append(layer.Material.Name)
-                            current_material = layer.Material.Name
-                            break
+
+        rebar_set = index.get_psets(column).get("Rebar Set")
+
+        current_quantity = index.get_quantity(
+            column, "Qto_ColumnBaseQuantities", "NetVolume"
+        )
+        if current_quantity is not None:
+            logger.debug("Found NetVolume for {}", column.Name)
+            quantities["NetVolume"] = current_quantity
+
+        for material in index.get_materials(column):
+            if material.kind == "IfcMaterial":
+                logger.debug("Found material '{}', as IfcMaterial", material.name)
+                materials.append(material.name)
+                current_material = material.name
+                break
+            elif material.kind in ("IfcMaterialLayerSetUsage", "IfcMaterialLayerSet"):
+                for layer_name in material.layer_names[:1]:
+                    logger.debug(
+                        "Found material '{}', as {}", layer_name, material.kind
+                    )
+                    materials.append(layer_name)
+                    current_material = layer_name
 
         current_material_ec = (
             MaterialList.get(current_material, None) if current_material else None
         )
 
         if current_material_ec is None and current_material not in MaterialsToIgnore:
-            logger.error(
-                f"Material '{current_material}' not found and no similar material found. Skipping this column."
+            diagnostics.report(
+                "Column", "Material not found", column, current_material, level="ERROR"
             )
             missing_materials.append((column.id(), current_material))
             continue
@@ -401,6 +279,7 @@ def calculate_columns(columns):
         if current_material_ec is None and MATERIAL_REAPLCE:
             # Use material matching instead of raising an error
             element_data = {
+                "element_id": column.id(),
                 "element_type": column.is_a(),
                 "element_name": column.Name if hasattr(column, "Name") else None,
                 "material_name": current_material,
@@ -415,8 +294,12 @@ def calculate_columns(columns):
             )
 
             if similar_material and similar_material in MaterialList:
-                logger.info(
-                    f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                diagnostics.report(
+                    "Column",
+                    "Material replaced by a similar material",
+                    column,
+                    similar_material,
+                    level="INFO",
                 )
                 matched_materials.append(
                     {
@@ -430,80 +313,30 @@ def calculate_columns(columns):
                 current_material = similar_material
                 current_material_ec = MaterialList.get(current_material)
             else:
-                logger.warning(
-                    f"Material '{current_material}' not found and no similar material found. Skipping this column."
+                diagnostics.report(
+                    "Column", "Material not found", column, current_material
                 )
                 continue
 
         if current_quantity is None:
-            logger.error(f"No volume found for column {column.Name}. Skipping.")
+            diagnostics.report("Column", "No volume", column, None, level="ERROR")
             missing_materials.append(column.id())
             continue
 
-        material_ec_perkg, material_density = current_material_ec
-
-        if rebar_vol == None:
-            concrete_ec = material_ec_perkg * material_density * current_quantity
-            materials_breakdown.append(
-                {
-                    "material": current_material,
-                    "material_mass": material_density * current_quantity,
-                    "ec": concrete_ec,
-                }
-            )
-            current_ec = concrete_ec
-
-        else:
-            concrete_ec = (
-                material_ec_perkg * material_density * (current_quantity - rebar_vol)
-            )
-            rebar_ec = rebar_vol * 2.510 * 7850
-
-            materials_breakdown.append(
-                {
-                    "material": current_material,
-                    "material_mass": material_density * (current_quantity - rebar_vol),
-                    "ec": concrete_ec,
-                }
-            )
-
-            materials_breakdown.append(
-                {"material": "Rebar", "material_mass": rebar_vol * 7850, "ec": rebar_ec}
-            )
-
-            logger.debug(f"EC for {column.Name}'s rebars is {rebar_ec}")
-            current_ec = concrete_ec + rebar_ec
-
-        column_elements.append(
-            {"element": "Column", "ec": current_ec, "materials": materials_breakdown}
-        )
-        for material_item in materials_breakdown:
-            excel_data.append(
-                [
-                    column.id(),  # Element ID
-                    column.is_a(),  # IFC Type
-                    "Column",  # Element Type
-                    material_item["material"],  # Material
-                    material_item["ec"],  # Material EC
-                    material_item["material_mass"],  # Total material mass
-                    "kg",
-                ]
-            )
+        # The concrete volume excludes the reinforcement
+        row = table.add_element(column, "Column", rebar_volume=rebar_vol)
+        table.add_line(row, current_material, current_quantity - rebar_vol)
 
-        logger.debug(f"EC for {column.Name} is {current_ec}")
-        total_ec += current_ec
+    return table, missing_materials, matched_materials
 
-    logger.debug(f"Total EC for columns is {total_ec}")
-    return total_ec, column_elements, missing_materials, excel_data, matched_materials
 
-
-def calculate_slabs(slabs, to_ignore=[]):
-    """Calculate embodied carbon for slabs, using material matching if needed"""
-    total_ec = 0
+def calculate_slabs(slabs, to_ignore=[], index=None, table=None):
+    """Add the slabs to the EC table, using material matching if needed"""
+    index = element_index.get_index(slabs, index)
+    if table is None:
+        table = ec_table.ECTable()
     quantities = {}
-    slab_elements = []
     missing_materials = []
-    excel_data = []
     matched_materials = []
 
     for slab in slabs:
@@ -513,106 +346,74 @@ def calculate_slabs(slabs, to_ignore=[]):
         current_ec = None
         current_quantity = None
         current_material = None
-        materials_breakdown = []
 
         if slab.id() in to_ignore:
-            logger.info(f"Skipping slab {slab.id()} as its to be ignored")
+            diagnostics.report(
+                "Slab", "Skipped, listed in to_ignore", slab, None, level="INFO"
+            )
             continue
 
-        if hasattr(slab, "IsDefinedBy"):
-            for definition in slab.IsDefinedBy:
-                if definition.is_a("IfcRelDefinesByProperties"):
-                    property_def = definition.RelatingPropertyDefinition
-                    if (
-                        property_def.is_a("IfcElementQuantity")
-                        and property_def.Name == "Qto_SlabBaseQuantities"
-                    ):
-                        for quantity in property_def.Quantities:
-                            # For material constituent
-                            if quantity.is_a("IfcPhysicalComplexQuantity"):
-                                for sub_quantity in quantity.HasQuantities:
-                                    logger.debug(
-                                        f"Found subquantity {sub_quantity.Name} for {quantity.Name}: {sub_quantity.LengthValue}"
-                                    )
-                                    layer_thicknesses[quantity.Name] = (
-                                        sub_quantity.LengthValue
-                                    )
-
-                            elif quantity.is_a("IfcQuantityArea") and (
-                                quantity.Name == "NetArea"
-                                or quantity.Name == "GrossArea"
-                            ):
-                                logger.debug(
-                                    f"Found NetArea for {slab.Name}: {quantity.AreaValue}"
-                                )
-                                current_area = quantity.AreaValue
-
-                            elif (
-                                quantity.is_a("IfcQuantityVolume")
-                                and quantity.Name == "NetVolume"
-                            ):
-                                logger.debug(
-                                    f"Found NetVolume for {slab.Name}: {quantity.VolumeValue}"
-                                )
-                                quantities[quantity.Name] = quantity.VolumeValue
-                                current_quantity = quantity.VolumeValue
-                                break
-                        if current_quantity is not None:
-                            break
-
-        if hasattr(slab, "HasAssociations"):
-            for association in slab.HasAssociations:
-                if association.is_a("IfcRelAssociatesMaterial"):
-                    material = association.RelatingMaterial
-
-                    if material.is_a("IfcMaterial"):
-                        logger.debug(
-                            f"Found material '{material.Name}', as IfcMaterial"
-                        )
-                        material_layers.append(material.Name)
-                        current_material = material.Name
+        for quantity in index.get_quantities(slab, "Qto_SlabBaseQuantities"):
+            # For material constituent
+            if quantity.is_a("IfcPhysicalComplexQuantity"):
+                for sub_quantity in quantity.HasQuantities:
+                    logger.debug(
+                        "Found subquantity {} for {}: {}",
+                        sub_quantity.Name,
+                        quantity.Name,
+                        sub_quantity.LengthValue,
+                    )
+                    layer_thicknesses[quantity.Name] = sub_quantity.LengthValue
 
-                    elif material.is_a("IfcMaterialConstituentSet"):
-                        for layer in material.MaterialConstituents:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialConstituent"
-                            )
-                            material_layers.append(layer.Material.Name)
+            elif quantity.is_a("IfcQuantityArea") and (
+                quantity.Name == "NetArea" or quantity.Name == "GrossArea"
+            ):
+                logger.debug("Found NetArea for {}: {}", slab.Name, quantity.AreaValue)
+                current_area = quantity.AreaValue
 
-                    elif material.is_a("IfcMaterialLayerSetUsage"):
-                        for layer in material.ForLayerSet.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSetUsage"
-                            )
-                            material_layers.append(layer.Material.Name)
-                            current_material = layer.Material.Name
+            elif quantity.is_a("IfcQuantityVolume") and quantity.Name == "NetVolume":
+                logger.debug(
+                    "Found NetVolume for {}: {}", slab.Name, quantity.VolumeValue
+                )
+                quantities[quantity.Name] = quantity.VolumeValue
+                current_quantity = quantity.VolumeValue
+                break
 
-                    elif material.is_a("IfcMaterialLayerSet"):
-                        for layer in material.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSet"
-                            )
-                            material_layers.append(layer.Material.Name)
-                            current_material = layer.Material.Name
+        for material in index.get_materials(slab):
+            if material.kind == "IfcMaterial":
+                logger.debug("Found material '{}', as IfcMaterial", material.name)
+                material_layers.append(material.name)
+                current_material = material.name
+
+            elif material.kind == "IfcMaterialConstituentSet":
+                logger.debug(
+                    "Found materials {}, as {}", material.layer_names, material.kind
+                )
+                material_layers.extend(material.layer_names)
+
+            elif material.kind in ("IfcMaterialLayerSetUsage", "IfcMaterialLayerSet"):
+                logger.debug(
+                    "Found materials {}, as {}", material.layer_names, material.kind
+                )
+                material_layers.extend(material.layer_names)
+                if material.layer_names:
+                    current_material = material.layer_names[-1]
 
         if material_layers and len(material_layers) > 1:
             logger.debug("Processing layered slab")
             # Multi-material slab
-            slab_total_ec = 0
-            slab_materials = []
+            slab_layers = []
 
             for mat in material_layers:
                 mat_ec_data = MaterialList.get(mat)
                 thickness = layer_thicknesses.get(mat, None)
 
                 if thickness is None:
-                    logger.warning(
-                        f"'{mat}' layer thickness not found, skipping EC calculation, this is on {slab=}"
-                    )
+                    diagnostics.report("Slab", "Layer thickness not found", slab, mat)
                     continue
                 if thickness <= 0:
-                    logger.warning(
-                        f"'{mat}' layer thickness <= 0, skipping EC calculation, this is on {slab=}"
+                    diagnostics.report(
+                        "Slab", "Layer thickness not positive", slab, mat
                     )
                     continue
 
@@ -645,13 +446,12 @@ def calculate_slabs(slabs, to_ignore=[]):
                     missing_materials.append((slab.id(), mat))
 
                     if not MATERIAL_REAPLCE:
-                        logger.warning(
-                            f"Material '{mat}' not found. Skipping this layer."
-                        )
+                        diagnostics.report("Slab", "Material not found", slab, mat)
                         continue
 
                     # Try material matching
                     element_data = {
+                        "element_id": slab.id(),
                         "element_type": slab.is_a(),
                         "element_name": slab.Name if hasattr(slab, "Name") else None,
                         "material_name": mat,
@@ -667,8 +467,12 @@ def calculate_slabs(slabs, to_ignore=[]):
                     )
 
                     if similar_material and similar_material in MaterialList:
-                        logger.info(
-                            f"Material '{mat}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                        diagnostics.report(
+                            "Slab",
+                            "Material replaced by a similar material",
+                            slab,
+                            similar_material,
+                            level="INFO",
                         )
                         matched_materials.append(
                             {
@@ -683,79 +487,54 @@ def calculate_slabs(slabs, to_ignore=[]):
                         mat = similar_material
                         mat_ec_data = MaterialList.get(mat)
                     else:
-                        logger.warning(
-                            f"Material '{mat}' not found and no similar material found. Skipping this layer."
-                        )
+                        diagnostics.report("Slab", "Material not found", slab, mat)
                         continue
 
                 if current_area is None:
                     current_area = calculator_utils.get_element_area(slab)
-                    logger.warning(f"{mat} area not found, manually calculating.")
+                    diagnostics.report(
+                        "Slab", "Layer area not found, calculating it", slab, mat
+                    )
 
                 ec_per_kg, density = mat_ec_data
                 logger.debug(
-                    f"Layer info - thickness: {thickness}, area: {current_area}, ec_per_kg: {ec_per_kg}, density: {density}"
+                    "Layer info - thickness: {}, area: {}, ec_per_kg: {}, density: {}",
+                    thickness,
+                    current_area,
+                    ec_per_kg,
+                    density,
                 )
-                layer_ec = ec_per_kg * density * (thickness / 1000) * current_area
-
-                if layer_ec > 0:
-                    slab_materials.append(
-                        {
-                            "material": mat,
-                            "material_mass": density
-                            * (thickness / 1000)
-                            * current_area,
-                            "ec": layer_ec,
-                        }
-                    )
-                    slab_total_ec += layer_ec
-
-                logger.debug(f"EC for material '{mat}' in {slab.Name} is {current_ec}")
+                layer_volume = (thickness / 1000) * current_area
 
-            if slab_total_ec > 0 and slab_materials:
-                total_ec += slab_total_ec
-                slab_elements.append(
-                    {
-                        "element": "Slab",
-                        "ec": slab_total_ec,
-                        "materials": slab_materials,
-                    }
-                )
-                for material_item in slab_materials:
-                    excel_data.append(
-                        [
-                            slab.id(),  # Element ID
-                            slab.is_a(),  # IFC Type
-                            "Slab",  # Element Type
-                            material_item["material"],  # Material
-                            material_item["ec"],  # Material EC
-                            material_item["material_mass"],  # Material mass
-                            "kg",
-                        ]
-                    )
+                # Layers without any EC are left out of the breakdown
+                if ec_per_kg * density * layer_volume > 0:
+                    slab_layers.append((mat, layer_volume))
 
+            if slab_layers:
+                row = table.add_element(slab, "Slab")
+                for mat, layer_volume in slab_layers:
+                    table.add_line(row, mat, layer_volume)
                 continue
 
         if current_material is None:
-            logger.info("No materials found directly on slab, checking type definition")
-            if hasattr(slab, "IsTypedBy"):
-                for rel in slab.IsTypedBy:
-                    if rel.is_a("IfcRelDefinesByType"):
-                        type_obj = rel.RelatingType
-                        logger.info(f"Found type definition: {type_obj.Name}")
-
-                        # Look for materials in the type object
-                        if hasattr(type_obj, "HasAssociations"):
-                            for association in type_obj.HasAssociations:
-                                if association.is_a("IfcRelAssociatesMaterial"):
-                                    material = association.RelatingMaterial
-
-                                    # Now check each material type as before
-                                    if material.is_a("IfcMaterial"):
-                                        logger.info(
-                                            f"Found material '{material.Name}' in type"
-                                        )
-                                        current_material = material.Name
+            diagnostics.report(
+                "Slab",
+                "No material on the element, using its type",
+                slab,
+                None,
+                level="INFO",
+            )
+            # Look for materials in the type object
+            for material in index.get_type_materials(slab):
+                if material.kind == "IfcMaterial":
+                    diagnostics.report(
+                        "Slab",
+                        "Material found on the type",
+                        slab,
+                        material.name,
+                        level="DEBUG",
+                    )
+                    current_material = material.name
 
         if current_material is not None:
             # Single-material slab
@@ -766,6 +545,7 @@ def calculate_slabs(slabs, to_ignore=[]):
             if current_material_ec is None and MATERIAL_REAPLCE:
                 # Try material matching
                 element_data = {
+                    "element_id": slab.id(),
                     "element_type": slab.is_a(),
                     "element_name": slab.Name if hasattr(slab, "Name") else None,
                     "material_name": current_material,
@@ -779,8 +559,12 @@ def calculate_slabs(slabs, to_ignore=[]):
                 )
 
                 if similar_material and similar_material in MaterialList:
-                    logger.info(
-                        f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                    diagnostics.report(
+                        "Slab",
+                        "Material replaced by a similar material",
+                        slab,
+                        similar_material,
+                        level="INFO",
                     )
                     matched_materials.append(
                         {
@@ -794,54 +578,33 @@ def calculate_slabs(slabs, to_ignore=[]):
                     current_material = similar_material
                     current_material_ec = MaterialList.get(current_material)
                 else:
-                    logger.error(
-                        f"Material '{current_material}' not found and no similar material found. Skipping this slab."
+                    diagnostics.report(
+                        "Slab",
+                        "Material not found",
+                        slab,
+                        current_material,
+                        level="ERROR",
                     )
                     continue
             elif current_material_ec is None:
-                logger.warning(
-                    f"Material '{current_material}' not found and no similar material found. Skipping this slab."
-                )
+                diagnostics.report("Slab", "Material not found", slab, current_material)
                 missing_materials.append((slab.id(), current_material))
                 continue
-            material_ec_perkg, material_density = current_material_ec
-            current_ec = material_ec_perkg * material_density * current_quantity
-
-            materials_breakdown.append(
-                {
-                    "material": current_material,
-                    "material_mass": material_density * current_quantity,
-                    "ec": current_ec,
-                }
-            )
 
-            slab_elements.append(
-                {
-                    "element": "Slab",
-                    "ec": current_ec,
-                    "material_mass": material_density * current_quantity,
-                    "materials": materials_breakdown,
-                }
-            )
-            for material_item in materials_breakdown:
-                excel_data.append(
-                    [
-                        slab.id(),  # Element ID
-                        slab.is_a(),  # IFC Type
-                        "Slab",  # Element Type
-                        material_item["material"],  # Material
-                        material_item["ec"],  # Material EC
-                        material_item["material_mass"],  # Material mass
-                        "kg",
-                    ]
-                )
-            logger.debug(f"EC for {slab.Name} is {current_ec}")
-            total_ec += current_ec
+            if current_quantity is None:
+                current_quantity = calculator_utils.get_element_volume(slab)
+            if current_quantity is None:
+                diagnostics.report("Slab", "No volume", slab, None, level="ERROR")
+                missing_materials.append(slab.id())
+                continue
+
+            row = table.add_element(slab, "Slab")
+            table.add_line(row, current_material, current_quantity)
             continue
 
         if current_ec is None:
-            logger.warning(
-                f"EC calculation for slab failed, attempting manual volume method"
+            diagnostics.report(
+                "Slab", "EC calculation failed, using the manual volume method", slab
             )
             # Attempts to retrieve the "correct" material from material layer set. Works if able to filter down to one possible material.
             # Calculates EC using EC density * volume method.
@@ -853,19 +616,22 @@ def calculate_slabs(slabs, to_ignore=[]):
                 if material not in MaterialsToIgnore
             ]
             if len(MaterialList_filtered) > 1:
-                logger.warning(
-                    f"Unable to isolate to one material from material layer set. Using the first material found, {MaterialList_filtered[0]} for this slab {slab}"
+                diagnostics.report(
+                    "Slab",
+                    "Several layer materials, using the first",
+                    slab,
+                    MaterialList_filtered[0],
                 )
 
             elif len(MaterialList_filtered) == 0:
-                logger.error(f"No material found for this {slab=}")
+                diagnostics.report("Slab", "No material", slab, None, level="ERROR")
                 continue
 
             if current_quantity is None:
                 current_quantity = calculator_utils.get_element_volume(slab)
 
             current_material = MaterialList_filtered[0]
-            logger.debug(f"Using material {current_material}")
+            logger.debug("Using material {}", current_material)
             current_material_ec = (
                 MaterialList.get(current_material, None) if current_material else None
             )
@@ -874,6 +640,7 @@ def calculate_slabs(slabs, to_ignore=[]):
             if current_material_ec is None and MATERIAL_REAPLCE:
                 # Try material matching
                 element_data = {
+                    "element_id": slab.id(),
                     "element_type": slab.is_a(),
                     "element_name": slab.Name if hasattr(slab, "Name") else None,
                     "material_name": current_material,
@@ -886,8 +653,12 @@ def calculate_slabs(slabs, to_ignore=[]):
                 )
 
                 if similar_material and similar_material in MaterialList:
-                    logger.info(
-                        f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                    diagnostics.report(
+                        "Slab",
+                        "Material replaced by a similar material",
+                        slab,
+                        similar_material,
+                        level="INFO",
                     )
                     matched_materials.append(
                         {
@@ -902,50 +673,29 @@ def calculate_slabs(slabs, to_ignore=[]):
                     current_material = similar_material
                     current_material_ec = MaterialList.get(current_material)
                 else:
-                    logger.warning(
-                        f"Material '{current_material}' not found and no similar material found. Skipping this slab."
+                    diagnostics.report(
+                        "Slab", "Material not found", slab, current_material
                     )
                     continue
 
-            material_ec_perkg, material_density = current_material_ec
-            current_ec = material_ec_perkg * material_density * current_quantity
+            if current_quantity is None:
+                diagnostics.report("Slab", "No volume", slab, None, level="ERROR")
+                missing_materials.append(slab.id())
+                continue
 
-            materials_breakdown.append(
-                {
-                    "material": current_material,
-                    "material_mass": material_density * current_quantity,
-                    "ec": current_ec,
-                }
-            )
-            for material_item in materials_breakdown:
-                excel_data.append(
-                    [
-                        slab.id(),  # Element ID
-                        slab.is_a(),  # IFC Type
-                        "Slab",  # Element Type
-                        material_item["material"],  # Material
-                        material_item["ec"],  # Material EC
-                        material_item["material_mass"],  # material mass
-                        "kg",
-                    ]
-                )
             # Add this slab as an element
-            slab_elements.append(
-                {"element": "Slab", "ec": current_ec, "materials": materials_breakdown}
-            )
-            logger.debug(f"EC for {slab.Name} is {current_ec}")
-            total_ec += current_ec
+            row = table.add_element(slab, "Slab")
+            table.add_line(row, current_material, current_quantity)
 
-    logger.debug(f"Total EC for slabs is {total_ec}")
-    return total_ec, slab_elements, missing_materials, excel_data, matched_materials
+    return table, missing_materials, matched_materials
 
 
-def calculate_walls(walls):
-    """Calculate embodied carbon for walls, using material matching if needed"""
-    total_ec = 0
-    wall_elements = []
+def calculate_walls(walls, index=None, table=None):
+    """Add the walls to the EC table, using material matching if needed"""
+    index = element_index.get_index(walls, index)
+    if table is None:
+        table = ec_table.ECTable()
     missing_materials = []
-    excel_data = []
     matched_materials = []
 
     for wall in walls:
@@ -953,74 +703,59 @@ def calculate_walls(walls):
         current_material = None
         layer_thicknesses = {}
         layer_materials = []
-        current_ec = None
+        recorded = False
         current_area = None
-        materials_breakdown = []
-
-        if hasattr(wall, "IsDefinedBy"):
-            for definition in wall.IsDefinedBy:
-                if definition.is_a("IfcRelDefinesByProperties"):
-                    property_def = definition.RelatingPropertyDefinition
-                    if (
-                        property_def.is_a("IfcElementQuantity")
-                        and property_def.Name == "Qto_WallBaseQuantities"
-                    ):
-                        for quantity in property_def.Quantities:
-                            # For material constituent
-                            if quantity.Name in MaterialList.keys():
-                                for sub_quantity in quantity.HasQuantities:
-                                    logger.debug(
-                                        f"Found subquantity {sub_quantity.Name} for {quantity.Name}: {sub_quantity.LengthValue}"
-                                    )
-                                    layer_thicknesses[quantity.Name] = (
-                                        sub_quantity.LengthValue
-                                    )
-                            elif (
-                                quantity.is_a("IfcQuantityArea")
-                                and quantity.Name == "NetSideArea"
-                            ):
-                                logger.debug(
-                                    f"Found NetSideArea for {wall.Name}: {quantity.AreaValue}"
-                                )
-                                current_area = quantity.AreaValue
-
-                            # For single material
-                            elif (
-                                quantity.is_a("IfcQuantityVolume")
-                                and quantity.Name == "NetVolume"
-                            ):
-                                logger.debug(
-                                    f"Found NetVolume for {wall.Name}: {quantity.VolumeValue}"
-                                )
-                                # quantities[quantity.Name] = quantity.VolumeValue
-                                current_volume = quantity.VolumeValue
-
-        if hasattr(wall, "HasAssociations"):
-            for association in wall.HasAssociations:
-                if association.is_a("IfcRelAssociatesMaterial"):
-                    material = association.RelatingMaterial
-                    if material.is_a("IfcMaterial"):
-                        logger.debug(
-                            f"Found material '{material.Name}', as IfcMaterial"
-                        )
-                        current_material = material.Name
-                    elif material.is_a("IfcMaterialConstituentSet"):
-                        for layer in material.MaterialConstituents:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialConstituent"
-                            )
-                            layer_materials.append(layer.Material.Name)
+
+        for quantity in index.get_quantities(wall, "Qto_WallBaseQuantities"):
+            # For material constituent
+            if quantity.Name in MaterialList.keys():
+                for sub_quantity in quantity.HasQuantities:
+                    logger.debug(
+                        "Found subquantity {} for {}: {}",
+                        sub_quantity.Name,
+                        quantity.Name,
+                        sub_quantity.LengthValue,
+                    )
+                    layer_thicknesses[quantity.Name] = sub_quantity.LengthValue
+            elif quantity.is_a("IfcQuantityArea") and quantity.Name == "NetSideArea":
+                logger.debug(
+                    "Found NetSideArea for {}: {}", wall.Name, quantity.AreaValue
+                )
+                current_area = quantity.AreaValue
+
+            # For single material
+            elif quantity.is_a("IfcQuantityVolume") and quantity.Name == "NetVolume":
+                logger.debug(
+                    "Found NetVolume for {}: {}", wall.Name, quantity.VolumeValue
+                )
+                current_volume = quantity.VolumeValue
+
+        for material in index.get_materials(wall):
+            if material.kind == "IfcMaterial":
+                logger.debug("Found material '{}', as IfcMaterial", material.name)
+                current_material = material.name
+            elif material.kind == "IfcMaterialConstituentSet":
+                logger.debug(
+                    "Found materials {}, as {}", material.layer_names, material.kind
+                )
+                layer_materials.extend(material.layer_names)
+
+        # Walls without NetVolume fall back to their geometry, looked up once
+        wall_volume = current_volume
+        if wall_volume is None:
+            wall_volume = calculator_utils.get_element_volume(wall)
 
         if layer_materials:
             logger.debug("Processing layered wall")
             # Multi-material wall
+            wall_layers = []
             for mat in layer_materials:
                 mat_ec_data = MaterialList.get(mat)
                 thickness = layer_thicknesses.get(mat, 0)
 
                 if thickness <= 0:
-                    logger.warning(
-                        f"'{mat}' layer thickness <= 0, skipping EC calculation"
+                    diagnostics.report(
+                        "Wall", "Layer thickness not positive", wall, mat
                     )
                     continue
 
@@ -1028,13 +763,12 @@ def calculate_walls(walls):
 
                     missing_materials.append((wall.id(), mat))
                     if not MATERIAL_REAPLCE:
-                        logger.warning(
-                            f"Material '{mat}' not found. Skipping this layer."
-                        )
+                        diagnostics.report("Wall", "Material not found", wall, mat)
                         continue
 
                     # Try material matching
                     element_data = {
+                        "element_id": wall.id(),
                         "element_type": wall.is_a(),
                         "element_name": wall.Name if hasattr(wall, "Name") else None,
                         "material_name": mat,
@@ -1050,8 +784,12 @@ def calculate_walls(walls):
                     )
 
                     if similar_material and similar_material in MaterialList:
-                        logger.info(
-                            f"Material '{mat}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                        diagnostics.report(
+                            "Wall",
+                            "Material replaced by a similar material",
+                            wall,
+                            similar_material,
+                            level="INFO",
                         )
                         matched_materials.append(
                             {
@@ -1066,44 +804,24 @@ def calculate_walls(walls):
                         mat = similar_material
                         mat_ec_data = MaterialList.get(mat)
                     else:
-                        logger.warning(
-                            f"Material '{mat}' not found and no similar material found. Skipping this layer."
-                        )
+                        diagnostics.report("Wall", "Material not found", wall, mat)
                         continue
 
                 ec_per_kg, density = mat_ec_data
                 logger.debug(
-                    f"Layer info - thickness: {thickness}, area: {current_area}, ec_per_kg: {ec_per_kg}, density: {density}"
-                )
-                layer_ec = ec_per_kg * density * (thickness / 1000) * current_area
-
-                materials_breakdown.append(
-                    {
-                        "material": mat,
-                        "material_mass": density * (thickness / 1000) * current_area,
-                        "ec": layer_ec,
-                    }
+                    "Layer info - thickness: {}, area: {}, ec_per_kg: {}, density: {}",
+                    thickness,
+                    current_area,
+                    ec_per_kg,
+                    density,
                 )
-                logger.debug(f"EC for material '{mat}' in {wall.Name} is {layer_ec}")
-                current_ec += layer_ec
-
-            total_ec += current_ec
-            wall_elements.append(
-                {"element": "Wall", "ec": current_ec, "materials": materials_breakdown}
-            )
+                wall_layers.append((mat, (thickness / 1000) * current_area))
 
-            for material_item in materials_breakdown:
-                excel_data.append(
-                    [
-                        wall.id(),  # Element ID
-                        wall.is_a(),  # IFC Type
-                        "Wall",  # Element Type
-                        material_item["material"],  # Material
-                        material_item["ec"],  # Material EC
-                        material_item["material_mass"],  # material mass
-                        "kg",
-                    ]
-                )
+            if wall_layers:
+                row = table.add_element(wall, "Wall")
+                for mat, layer_volume in wall_layers:
+                    table.add_line(row, mat, layer_volume)
+                recorded = True
         elif current_material:
             # Single-material wall
             mat_ec_data = MaterialList.get(current_material)
@@ -1112,12 +830,13 @@ def calculate_walls(walls):
 
                 missing_materials.append((wall.id(), current_material))
                 if not MATERIAL_REAPLCE:
-                    logger.warning(
-                        f"Material '{current_material}' not found. Skipping this element)"
+                    diagnostics.report(
+                        "Wall", "Material not found", wall, current_material
                     )
                     continue
                 # Try material matching
                 element_data = {
+                    "element_id": wall.id(),
                     "element_type": wall.is_a(),
                     "element_name": wall.Name if hasattr(wall, "Name") else None,
                     "material_name": current_material,
@@ -1130,8 +849,12 @@ def calculate_walls(walls):
                 )
 
                 if similar_material and similar_material in MaterialList:
-                    logger.info(
-                        f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                    diagnostics.report(
+                        "Wall",
+                        "Material replaced by a similar material",
+                        wall,
+                        similar_material,
+                        level="INFO",
                     )
                     matched_materials.append(
                         {
@@ -1145,70 +868,38 @@ def calculate_walls(walls):
                     current_material = similar_material
                     mat_ec_data = MaterialList.get(current_material)
                 else:
-                    logger.warning(
-                        f"Material '{current_material}' not found and no similar material found. Skipping this wall."
+                    diagnostics.report(
+                        "Wall", "Material not found", wall, current_material
                     )
                     continue
 
+            current_volume = wall_volume
             if current_volume is None:
-                current_volume = calculator_utils.get_element_volume(wall)
-                if current_volume is None:
-                    logger.error(
-                        f"Failed to calculate volume for wall {wall.Name}. Skipping."
-                    )
-                    continue
-
-            ec_per_kg, density = mat_ec_data
-            current_ec = ec_per_kg * density * current_volume
-
-            materials_breakdown.append(
-                {
-                    "material": current_material,
-                    "material_mass": density * current_volume,
-                    "ec": current_ec,
-                }
-            )
-            wall_elements.append(
-                {"element": "Wall", "ec": current_ec, "materials": materials_breakdown}
-            )
-            for material_item in materials_breakdown:
-                excel_data.append(
-                    [
-                        wall.id(),  # Element ID
-                        wall.is_a(),  # IFC Type
-                        "Wall",  # Element Type
-                        material_item["material"],  # Material
-                        material_item["ec"],  # Material EC
-                        material_item["material_mass"],  # Material mass
-                        "kg",
-                    ]
-                )
+                diagnostics.report("Wall", "No volume", wall, None, level="ERROR")
+                continue
 
-            logger.debug(f"EC for {wall.Name} is {current_ec}")
-            total_ec += current_ec
+            row = table.add_element(wall, "Wall")
+            table.add_line(row, current_material, current_volume)
+            recorded = True
 
-        if current_ec is None:
+        if not recorded:
             # Use material matching with volume estimation
             if not layer_materials:
-                logger.warning(
-                    f"No material information for wall {wall.Name}. Skipping."
-                )
+                diagnostics.report("Wall", "No material", wall)
                 continue
 
             # Use the most common material in layers
             if layer_materials:
                 current_material = max(set(layer_materials), key=layer_materials.count)
 
+            current_volume = wall_volume
             if current_volume is None:
-                current_volume = calculator_utils.get_element_volume(wall)
-                if current_volume is None:
-                    logger.error(
-                        f"Failed to calculate volume for wall {wall.Name}. Skipping."
-                    )
-                    continue
+                diagnostics.report("Wall", "No volume", wall, None, level="ERROR")
+                continue
 
             # Try to find a similar material
             element_data = {
+                "element_id": wall.id(),
                 "element_type": wall.is_a(),
                 "element_name": wall.Name if hasattr(wall, "Name") else None,
                 "material_name": current_material,
@@ -1222,8 +913,12 @@ def calculate_walls(walls):
             )
 
             if similar_material and similar_material in MaterialList:
-                logger.info(
-                    f"Using material '{similar_material}' (similarity: {similarity:.3f}) for wall {wall.Name}"
+                diagnostics.report(
+                    "Wall",
+                    "Material replaced by a similar material",
+                    wall,
+                    similar_material,
+                    level="INFO",
                 )
                 matched_materials.append(
                     {
@@ -1235,88 +930,37 @@ def calculate_walls(walls):
                     }
                 )
                 current_material = similar_material
-                mat_ec_data = MaterialList.get(current_material)
-
-                ec_per_kg, density = mat_ec_data
-                current_ec = ec_per_kg * density * current_volume
-
-                materials_breakdown.append(
-                    {
-                        "material": current_material,
-                        "material_mass": density * current_volume,
-                        "ec": current_ec,
-                    }
-                )
 
                 # Add this wall to elements
-                wall_elements.append(
-                    {
-                        "element": "Wall",
-                        "ec": current_ec,
-                        "materials": materials_breakdown,
-                    }
-                )
-                for material_item in materials_breakdown:
-                    excel_data.append(
-                        [
-                            wall.id(),  # Element ID
-                            wall.is_a(),  # IFC Type
-                            "Wall",  # Element Type
-                            material_item["material"],  # Material
-                            material_item["ec"],  # Material EC
-                            material_item["material_mass"],  # material mass
-                            "kg",
-                        ]
-                    )
-
-                logger.debug(f"EC for {wall.Name} is {current_ec}")
-                total_ec += current_ec
+                row = table.add_element(wall, "Wall")
+                table.add_line(row, current_material, current_volume)
             else:
-                logger.warning(
-                    f"No suitable material found for wall {wall.Name}. Skipping."
-                )
+                diagnostics.report("Wall", "No material", wall)
                 continue
 
-    logger.debug(f"Total EC for walls is {total_ec}")
-    return total_ec, wall_elements, missing_materials, excel_data, matched_materials
+    return table, missing_materials, matched_materials
 
 
-def calculate_windows(windows):
-    """Calculate embodied carbon for windows, using material matching if needed"""
-    total_ec = 0
+def calculate_windows(windows, index=None, table=None):
+    """Add the windows to the EC table, using material matching if needed"""
+    index = element_index.get_index(windows, index)
+    if table is None:
+        table = ec_table.ECTable()
     quantities = {}
-    window_elements = []
-    excel_data = []
 
     for window in windows:
         current_quantity = None
         current_material = None
-        materials_breakdown = []
         missing_materials = []
 
-        if hasattr(window, "IsDefinedBy"):
-            for definition in window.IsDefinedBy:
-                if definition.is_a("IfcRelDefinesByProperties"):
-                    property_def = definition.RelatingPropertyDefinition
-                    if (
-                        property_def.is_a("IfcElementQuantity")
-                        and property_def.Name == "Qto_WindowBaseQuantities"
-                    ):
-                        for quantity in property_def.Quantities:
-                            if (
-                                quantity.is_a("IfcQuantityArea")
-                                and quantity.Name == "Area"
-                            ):
-                                logger.debug(
-                                    f"Found Area for {window.Name}: {quantity.AreaValue}"
-                                )
-                                quantities[quantity.Name] = quantity.AreaValue
-                                current_quantity = quantity.AreaValue
-                                break
-                        if current_quantity is not None:
-                            break
-
-        psets = get_psets(window)
+        current_quantity = index.get_quantity(
+            window, "Qto_WindowBaseQuantities", "Area"
+        )
+        if current_quantity is not None:
+            logger.debug("Found Area for {}: {}", window.Name, current_quantity)
+            quantities["Area"] = current_quantity
+
+        psets = index.get_psets(window)
         if "Pset_WindowCommon" in psets and "Reference" in psets["Pset_WindowCommon"]:
             current_material = psets["Pset_WindowCommon"]["Reference"]
 
@@ -1329,6 +973,7 @@ def calculate_windows(windows):
         if current_material_ec is None and MATERIAL_REAPLCE:
             # Try material matching for windows
             element_data = {
+                "element_id": window.id(),
                 "element_type": window.is_a(),
                 "element_name": window.Name if hasattr(window, "Name") else None,
                 "material_name": current_material,
@@ -1341,106 +986,57 @@ def calculate_windows(windows):
             )
 
             if similar_material and similar_material in MaterialList:
-                logger.info(
-                    f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                diagnostics.report(
+                    "Window",
+                    "Material replaced by a similar material",
+                    window,
+                    similar_material,
+                    level="INFO",
                 )
                 current_material = similar_material
                 current_material_ec = MaterialList.get(current_material)
             else:
-                logger.warning(
-                    f"Material '{current_material}' not found and no similar material found. Skipping this window."
+                diagnostics.report(
+                    "Window", "Material not found", window, current_material
                 )
                 continue
 
         if current_quantity is None:
-            logger.error(f"No area found for window {window.Name}. Skipping.")
+            diagnostics.report("Window", "No area", window, None, level="ERROR")
             missing_materials.append(window.id())
             continue
 
+        row = table.add_element(window, "Window")
         # Window EC is per area (m²)
         if isinstance(current_material_ec, (int, float)):
-            material_ec_per_m2 = current_material_ec
-            current_ec = material_ec_per_m2 * current_quantity
-            material_quantity = current_quantity
+            table.add_line(row, current_material, current_quantity, ec_table.AREA)
         else:
             # Handle case where material EC is in standard [EC per kg, density] format
-            material_ec_perkg, material_density = current_material_ec
             # Assume a standard thickness for windows (e.g., 25mm = 0.025m)
             standard_thickness = 0.025
-            current_ec = (
-                material_ec_perkg
-                * material_density
-                * standard_thickness
-                * current_quantity
-            )
-            material_quantity = material_density * standard_thickness * current_quantity
-
-        materials_breakdown.append(
-            {
-                "material": current_material,
-                "material_mass": material_quantity,
-                "ec": current_ec,
-            }
-        )
-        window_elements.append(
-            {"element": "Window", "ec": current_ec, "materials": materials_breakdown}
-        )
-
-        logger.debug(f"EC for {window.Name} is {current_ec}")
-        total_ec += current_ec
-        for material_item in materials_breakdown:
-            excel_data.append(
-                [
-                    window.id(),  # Element ID
-                    window.is_a(),  # IFC Type
-                    "Window",  # Element Type
-                    material_item["material"],  # Material
-                    material_item["ec"],  # Material EC
-                    material_item["material_mass"],  # Total Element EC
-                    "m2",
-                ]
-            )
+            table.add_line(row, current_material, standard_thickness * current_quantity)
 
-    logger.debug(f"Total EC for windows is {total_ec}")
-    return total_ec, window_elements, missing_materials, excel_data
+    return table, missing_materials, []
 
 
-def calculate_doors(doors):
-    """Calculate embodied carbon for doors, using material matching if needed"""
-    total_ec = 0
+def calculate_doors(doors, index=None, table=None):
+    """Add the doors to the EC table, using material matching if needed"""
+    index = element_index.get_index(doors, index)
+    if table is None:
+        table = ec_table.ECTable()
     quantities = {}
-    door_elements = []
     missing_materials = []
-    excel_data = []
 
     for door in doors:
         current_quantity = None
         current_material = None
-        materials_breakdown = []
-
-        if hasattr(door, "IsDefinedBy"):
-            for definition in door.IsDefinedBy:
-                if definition.is_a("IfcRelDefinesByProperties"):
-                    property_def = definition.RelatingPropertyDefinition
-                    if (
-                        property_def.is_a("IfcElementQuantity")
-                        and property_def.Name == "Qto_DoorBaseQuantities"
-                    ):
-                        for quantity in property_def.Quantities:
-                            if (
-                                quantity.is_a("IfcQuantityArea")
-                                and quantity.Name == "Area"
-                            ):
-                                logger.debug(
-                                    f"Found Area for {door.Name}: {quantity.AreaValue}"
-                                )
-                                quantities[quantity.Name] = quantity.AreaValue
-                                current_quantity = quantity.AreaValue
-                                break
-                        if current_quantity is not None:
-                            break
-
-        psets = get_psets(door)
+
+        current_quantity = index.get_quantity(door, "Qto_DoorBaseQuantities", "Area")
+        if current_quantity is not None:
+            logger.debug("Found Area for {}: {}", door.Name, current_quantity)
+            quantities["Area"] = current_quantity
+
+        psets = index.get_psets(door)
         if "Pset_DoorCommon" in psets and "Reference" in psets["Pset_DoorCommon"]:
             current_material = psets["Pset_DoorCommon"]["Reference"]
 
@@ -1454,6 +1050,7 @@ def calculate_doors(doors):
         if current_material_ec is None and MATERIAL_REAPLCE:
             # Try material matching for doors
             element_data = {
+                "element_id": door.id(),
                 "element_type": door.is_a(),
                 "element_name": door.Name if hasattr(door, "Name") else None,
                 "material_name": current_material,
@@ -1466,87 +1063,51 @@ def calculate_doors(doors):
             )
 
             if similar_material and similar_material in MaterialList:
-                logger.info(
-                    f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                diagnostics.report(
+                    "Door",
+                    "Material replaced by a similar material",
+                    door,
+                    similar_material,
+                    level="INFO",
                 )
                 current_material = similar_material
                 current_material_ec = MaterialList.get(current_material)
             else:
-                logger.warning(
-                    f"Material '{current_material}' not found and no similar material found. Skipping this door."
-                )
+                diagnostics.report("Door", "Material not found", door, current_material)
                 continue
 
         if current_material_ec is None:
-            logger.warning(
-                f"Material '{current_material}' not found. Skipping this door."
-            )
+            diagnostics.report("Door", "Material not found", door, current_material)
             continue
 
         if current_quantity is None:
-            logger.error(f"No area found for door {door.Name}. Skipping.")
+            diagnostics.report("Door", "No area", door, None, level="ERROR")
             missing_materials.append(door.id())
             continue
 
+        row = table.add_element(door, "Door")
         # Door EC is per area (m²)
         if isinstance(current_material_ec, (int, float)):
-            material_ec_per_m2 = current_material_ec
-            current_ec = material_ec_per_m2 * current_quantity
-            material_quantity = current_quantity
+            table.add_line(row, current_material, current_quantity, ec_table.AREA)
         else:
             # Handle case where material EC is in standard [EC per kg, density] format
-            material_ec_perkg, material_density = current_material_ec
             # Assume a standard thickness for doors (e.g., 40mm = 0.04m)
             standard_thickness = 0.04
-            current_ec = (
-                material_ec_perkg
-                * material_density
-                * standard_thickness
-                * current_quantity
-            )
-            material_quantity = material_density * standard_thickness * current_quantity
-
-        materials_breakdown.append(
-            {
-                "material": current_material,
-                "material_mass": material_quantity,
-                "ec": current_ec,
-            }
-        )
-        door_elements.append(
-            {"element": "Door", "ec": current_ec, "materials": materials_breakdown}
-        )
-        for material_item in materials_breakdown:
-            excel_data.append(
-                [
-                    door.id(),  # Element ID
-                    door.is_a(),  # IFC Type
-                    "Door",  # Element Type
-                    material_item["material"],  # Material
-                    material_item["ec"],  # Material EC
-                    material_item["material_mass"],  # Total Element EC
-                    "m2",
-                ]
-            )
-        logger.debug(f"EC for {door.Name} is {current_ec}")
-        total_ec += current_ec
+            table.add_line(row, current_material, standard_thickness * current_quantity)
 
-    logger.debug(f"Total EC for doors is {total_ec}")
-    return total_ec, door_elements, missing_materials, excel_data
+    return table, missing_materials, []
 
 
-def calculate_roofs(roofs):
-    """Calculate embodied carbon for roofs, using material matching if needed"""
-    total_ec = 0
-    roof_elements = []
+def calculate_roofs(roofs, index=None, table=None):
+    """Add the roofs to the EC table, using material matching if needed"""
+    index = element_index.get_index(roofs, index)
+    if table is None:
+        table = ec_table.ECTable()
     missing_materials = []
-    excel_data = []
     matched_materials = []
 
     for roof in roofs:
         slabs = []
-        roof_ec = 0
-        current_ec = 0
         roof_materials = []
 
         if hasattr(roof, "IsDecomposedBy"):
@@ -1554,82 +1115,59 @@ def calculate_roofs(roofs):
                 if rel.is_a("IfcRelAggregates"):
                     for slab in rel.RelatedObjects:
                         if slab.is_a("IfcSlab"):
-                            logger.debug(f"Found Slab: {slab.Name}")
+                            logger.debug("Found Slab: {}", slab.Name)
                             slabs.append(slab)
 
         for slab in slabs:
             layer_thicknesses = {}
             material_layers = []
             current_area = None
-            current_ec = None
+            recorded = False
             current_quantity = None
             current_material = None
             slab_materials = []
 
-            if hasattr(slab, "IsDefinedBy"):
-                for definition in slab.IsDefinedBy:
-                    if definition.is_a("IfcRelDefinesByProperties"):
-                        property_def = definition.RelatingPropertyDefinition
-                        if (
-                            property_def.is_a("IfcElementQuantity")
-                            and property_def.Name == "Qto_SlabBaseQuantities"
-                        ):
-                            for quantity in property_def.Quantities:
-                                # For material constituent
-                                if quantity.is_a("IfcPhysicalComplexQuantity"):
-                                    for sub_quantity in quantity.HasQuantities:
-                                        logger.debug(
-                                            f"Found subquantity {sub_quantity.Name} for {quantity.Name}: {sub_quantity.LengthValue}"
-                                        )
-                                        layer_thicknesses[quantity.Name] = (
-                                            sub_quantity.LengthValue
-                                        )
-                                elif quantity.is_a("IfcQuantityArea") and (
-                                    quantity.Name == "NetSideArea"
-                                    or quantity.Name == "GrossArea"
-                                ):
-                                    logger.debug(
-                                        f"Found Area for {slab.Name}: {quantity.AreaValue}"
-                                    )
-                                    current_area = quantity.AreaValue
-
-                                # For single material
-                                elif (
-                                    quantity.is_a("IfcQuantityVolume")
-                                    and quantity.Name == "NetVolume"
-                                ):
-                                    logger.debug(
-                                        f"Found NetVolume for {slab.Name}: {quantity.VolumeValue / len(slabs)}"
-                                    )
-                                    current_quantity = quantity.VolumeValue / len(slabs)
-
-            if hasattr(slab, "HasAssociations"):
-                for association in slab.HasAssociations:
-                    if association.is_a("IfcRelAssociatesMaterial"):
-                        material = association.RelatingMaterial
-                        if material.is_a("IfcMaterial"):
-                            logger.debug(
-                                f"Found material '{material.Name}', as IfcMaterial"
-                            )
-                            current_material = material.Name
-                        elif material.is_a("IfcMaterialConstituentSet"):
-                            for layer in material.MaterialConstituents:
-                                logger.debug(
-                                    f"Found material '{layer.Material.Name}', as IfcMaterialConstituent"
-                                )
-                                material_layers.append(layer.Material.Name)
-                        elif material.is_a("IfcMaterialLayerSetUsage"):
-                            for layer in material.ForLayerSet.MaterialLayers:
-                                logger.debug(
-                                    f"Found material '{layer.Material.Name}', as IfcMaterialLayerSetUsage"
-                                )
-                                material_layers.append(layer.Material.Name)
-                        elif material.is_a("IfcMaterialLayerSet"):
-                            for layer in material.MaterialLayers:
-                                logger.debug(
-                                    f"Found material '{layer.Material.Name}', as IfcMaterialLayerSet"
-                                )
-                                material_layers.append(layer.Material.Name)
+            for quantity in index.get_quantities(slab, "Qto_SlabBaseQuantities"):
+                # For material constituent
+                if quantity.is_a("IfcPhysicalComplexQuantity"):
+                    for sub_quantity in quantity.HasQuantities:
+                        logger.debug(
+                            "Found subquantity {} for {}: {}",
+                            sub_quantity.Name,
+                            quantity.Name,
+                            sub_quantity.LengthValue,
+                        )
+                        layer_thicknesses[quantity.Name] = sub_quantity.LengthValue
+                elif quantity.is_a("IfcQuantityArea") and (
+                    quantity.Name == "NetSideArea" or quantity.Name == "GrossArea"
+                ):
+                    logger.debug("Found Area for {}: {}", slab.Name, quantity.AreaValue)
+                    current_area = quantity.AreaValue
+
+                # For single material
+                elif (
+                    quantity.is_a("IfcQuantityVolume") and quantity.Name == "NetVolume"
+                ):
+                    logger.debug(
+                        "Found NetVolume for {}: {}",
+                        slab.Name,
+                        quantity.VolumeValue / len(slabs),
+                    )
+                    current_quantity = quantity.VolumeValue / len(slabs)
+
+            for material in index.get_materials(slab):
+                if material.kind == "IfcMaterial":
+                    logger.debug("Found material '{}', as IfcMaterial", material.name)
+                    current_material = material.name
+                elif material.kind in (
+                    "IfcMaterialConstituentSet",
+                    "IfcMaterialLayerSetUsage",
+                    "IfcMaterialLayerSet",
+                ):
+                    logger.debug(
+                        "Found materials {}, as {}", material.layer_names, material.kind
+                    )
+                    material_layers.extend(material.layer_names)
 
             if material_layers:
                 logger.debug("Processing layered slab in roof")
@@ -1639,13 +1177,13 @@ def calculate_roofs(roofs):
                     thickness = layer_thicknesses.get(mat, None)
 
                     if thickness is None:
-                        logger.warning(
-                            f"'{mat}' layer thickness not found, skipping EC calculation"
+                        diagnostics.report(
+                            "Roof", "Layer thickness not found", roof, mat
                         )
                         continue
                     if thickness <= 0:
-                        logger.warning(
-                            f"'{mat}' layer thickness <= 0, skipping EC calculation"
+                        diagnostics.report(
+                            "Roof", "Layer thickness not positive", roof, mat
                         )
                         continue
 
@@ -1679,6 +1217,7 @@ def calculate_roofs(roofs):
                     if mat_ec_data is None and mat not in MaterialsToIgnore:
                         # Try material matching
                         element_data = {
+                            "element_id": roof.id(),
                             "element_type": slab.is_a(),
                             "element_name": (
                                 slab.Name if hasattr(slab, "Name") else None
@@ -1696,8 +1235,12 @@ def calculate_roofs(roofs):
                         )
 
                         if similar_material and similar_material in MaterialList:
-                            logger.info(
-                                f"Material '{mat}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                            diagnostics.report(
+                                "Roof",
+                                "Material replaced by a similar material",
+                                roof,
+                                similar_material,
+                                level="INFO",
                             )
                             matched_materials.append(
                                 {
@@ -1712,35 +1255,24 @@ def calculate_roofs(roofs):
                             mat = similar_material
                             mat_ec_data = MaterialList.get(mat)
                         else:
-                            logger.warning(
-                                f"Material '{mat}' not found and no similar material found. Skipping this layer."
-                            )
+                            diagnostics.report("Roof", "Material not found", roof, mat)
                             continue
 
                     if current_area is None:
                         current_area = calculator_utils.get_element_area(slab)
-                        logger.warning(f"{mat} area not found, manually calculating.")
+                        diagnostics.report(
+                            "Roof", "Layer area not found, calculating it", roof, mat
+                        )
 
                     ec_per_kg, density = mat_ec_data
                     logger.debug(
-                        f"Layer info - thickness: {thickness}, area: {current_area}, ec_per_kg: {ec_per_kg}, density: {density}"
-                    )
-                    layer_ec = ec_per_kg * density * (thickness / 1000) * current_area
-
-                    slab_materials.append(
-                        {
-                            "material": mat,
-                            "material_mass": density
-                            * (thickness / 1000)
-                            * current_area,
-                            "ec": layer_ec,
-                        }
-                    )
-
-                    logger.debug(
-                        f"EC for material '{mat}' in {slab.Name} is {current_ec}"
+                        "Layer info - thickness: {}, area: {}, ec_per_kg: {}, density: {}",
+                        thickness,
+                        current_area,
+                        ec_per_kg,
+                        density,
                     )
-                    roof_ec += layer_ec
+                    slab_materials.append((mat, (thickness / 1000) * current_area))
 
             elif current_material:
                 # Single-material slab
@@ -1754,6 +1286,7 @@ def calculate_roofs(roofs):
                 if current_material_ec is None and MATERIAL_REAPLCE:
                     # Try material matching
                     element_data = {
+                        "element_id": roof.id(),
                         "element_type": slab.is_a(),
                         "element_name": slab.Name if hasattr(slab, "Name") else None,
                         "material_name": current_material,
@@ -1767,8 +1300,12 @@ def calculate_roofs(roofs):
                     )
 
                     if similar_material and similar_material in MaterialList:
-                        logger.info(
-                            f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                        diagnostics.report(
+                            "Roof",
+                            "Material replaced by a similar material",
+                            roof,
+                            similar_material,
+                            level="INFO",
                         )
                         matched_materials.append(
                             {
@@ -1782,32 +1319,23 @@ def calculate_roofs(roofs):
                         current_material = similar_material
                         current_material_ec = MaterialList.get(current_material)
                     else:
-                        logger.warning(
-                            f"Material '{current_material}' not found and no similar material found. Skipping this roof slab."
+                        diagnostics.report(
+                            "Roof", "Material not found", roof, current_material
                         )
                         continue
 
                 if current_material_ec is None:
-                    logger.warning(
-                        f"Material '{current_material}' not foundd. Skipping this roof slab."
+                    diagnostics.report(
+                        "Roof", "Material not found", roof, current_material
                     )
                     continue
-                material_ec_perkg, material_density = current_material_ec
-                current_ec = material_ec_perkg * material_density * current_quantity
-
-                slab_materials.append(
-                    {
-                        "material": current_material,
-                        "material_mass": material_density * current_quantity,
-                        "ec": current_ec,
-                    }
-                )
-
-                logger.debug(f"EC for {slab.Name} is {current_ec}")
-                roof_ec += current_ec
-            if current_ec is None:
-                logger.warning(
-                    f"EC calculation for slab in roof failed, attempting manual volume method"
+                slab_materials.append((current_material, current_quantity))
+                recorded = True
+            if not recorded:
+                diagnostics.report(
+                    "Roof",
+                    "EC calculation failed, using the manual volume method",
+                    roof,
                 )
                 # Attempts to retrieve the "correct" material from material layer set. Works if able to filter down to one possible material.
                 # Calculates EC using EC density * volume method.
@@ -1819,18 +1347,22 @@ def calculate_roofs(roofs):
                     if material not in MaterialsToIgnore
                 ]
                 if len(MaterialList_filtered) > 1:
-                    logger.error(
-                        f"Unable to isolate to one material from material layer set. Using the first material found, {MaterialList_filtered[0]} for this slab {slab}"
+                    diagnostics.report(
+                        "Roof",
+                        "Several layer materials, using the first",
+                        roof,
+                        MaterialList_filtered[0],
+                        level="ERROR",
                     )
                 elif len(MaterialList_filtered) == 0:
-                    logger.error(f"No material found for this {slab=}")
+                    diagnostics.report("Roof", "No material", roof, None, level="ERROR")
                     continue
 
                 if current_quantity is None:
                     current_quantity = calculator_utils.get_element_volume(slab)
 
                 current_material = MaterialList_filtered[0]
-                logger.debug(f"Using material {current_material}")
+                logger.debug("Using material {}", current_material)
                 current_material_ec = (
                     MaterialList.get(current_material, None)
                     if current_material
@@ -1841,6 +1373,7 @@ def calculate_roofs(roofs):
                 if current_material_ec is None and MATERIAL_REAPLCE:
                     # Try material matching
                     element_data = {
+                        "element_id": roof.id(),
                         "element_type": slab.is_a(),
                         "element_name": slab.Name if hasattr(slab, "Name") else None,
                         "material_name": current_material,
@@ -1853,8 +1386,12 @@ def calculate_roofs(roofs):
                     )
 
                     if similar_material and similar_material in MaterialList:
-                        logger.info(
-                            f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                        diagnostics.report(
+                            "Roof",
+                            "Material replaced by a similar material",
+                            roof,
+                            similar_material,
+                            level="INFO",
                         )
                         matched_materials.append(
                             {
@@ -1868,119 +1405,61 @@ def calculate_roofs(roofs):
                         current_material = similar_material
                         current_material_ec = MaterialList.get(current_material)
                     else:
-                        logger.warning(
-                            f"Material '{current_material}' not found and no similar material found. Skipping this roof slab."
+                        diagnostics.report(
+                            "Roof", "Material not found", roof, current_material
                         )
                         continue
 
-                material_ec_perkg, material_density = current_material_ec
-                current_ec = material_ec_perkg * material_density * current_quantity
-
-                slab_materials.append(
-                    {
-                        "material": current_material,
-                        "material_mass": material_density * current_quantity,
-                        "ec": current_ec,
-                    }
-                )
-
-                logger.debug(f"EC for {slab.Name} is {current_ec}")
-                roof_ec += current_ec
+                slab_materials.append((current_material, current_quantity))
 
             roof_materials.extend(slab_materials)
 
-        roof_elements.append(
-            {"element": "Roof", "ec": roof_ec, "materials": roof_materials}
-        )
-        for material_item in roof_materials:
-            excel_data.append(
-                [
-                    roof.id(),  # Element ID
-                    roof.is_a(),  # IFC Type
-                    "Roof",  # Element Type
-                    material_item["material"],  # Material
-                    material_item["ec"],  # Material EC
-                    material_item["material_mass"],  # material mass
-                    "kg",
-                ]
-            )
-        logger.debug(f"EC for {roof.Name} is {roof_ec}")
-        total_ec += roof_ec
+        # Roofs are always in superstructure
+        row = table.add_element(roof, "Roof", substructure=False)
+        for material, volume in roof_materials:
+            table.add_line(row, material, volume)
 
-    logger.debug(f"Total EC for roofs is {total_ec}")
-    return total_ec, roof_elements, missing_materials, excel_data, matched_materials
+    return table, missing_materials, matched_materials
 
 
-def calculate_stairs(stairs):
-    """Calculate embodied carbon for stairs, using material matching if needed"""
-    total_ec = 0
-    stair_elements = []
+def calculate_stairs(stairs, index=None, table=None):
+    """Add the stair flights to the EC table, using material matching if needed"""
+    index = element_index.get_index(stairs, index)
+    if table is None:
+        table = ec_table.ECTable()
     missing_elements = []
-    excel_data = []
     matched_materials = []
 
     for stair in stairs:
         current_quantity = None
         current_material = None
         current_area = None
-        current_ec = None
         layer_thicknesses = {}
         material_layers = []
         material_breakdown = []
-        stair_total_ec = 0
 
         # Get volume information
-        if hasattr(stair, "IsDefinedBy"):
-            for definition in stair.IsDefinedBy:
-                if definition.is_a("IfcRelDefinesByProperties"):
-                    property_def = definition.RelatingPropertyDefinition
-                    if (
-                        property_def.is_a("IfcElementQuantity")
-                        and property_def.Name == "Qto_StairFlightBaseQuantities"
-                    ):
-                        for quantity in property_def.Quantities:
-                            if (
-                                quantity.is_a("IfcQuantityVolume")
-                                and quantity.Name == "NetVolume"
-                            ):
-                                logger.debug(
-                                    f"Found NetVolume for {stair.Name}: {quantity.VolumeValue}"
-                                )
-                                current_quantity = quantity.VolumeValue
-                                break
-                        if current_quantity is not None:
-                            break
+        current_quantity = index.get_quantity(
+            stair, "Qto_StairFlightBaseQuantities", "NetVolume"
+        )
+        if current_quantity is not None:
+            logger.debug("Found NetVolume for {}: {}", stair.Name, current_quantity)
 
         # Get material information
-        if hasattr(stair, "HasAssociations"):
-            for association in stair.HasAssociations:
-                if association.is_a("IfcRelAssociatesMaterial"):
-                    material = association.RelatingMaterial
-
-                    if material.is_a("IfcMaterial"):
-                        logger.debug(
-                            f"Found material '{material.Name}', as IfcMaterial"
-                        )
-                        material_layers.append(material.Name)
-                        current_material = material.Name
-                    elif material.is_a("IfcMaterialConstituentSet"):
-                        for layer in material.MaterialConstituents:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialConstituent"
-                            )
-                            material_layers.append(layer.Material.Name)
-                    elif material.is_a("IfcMaterialLayerSetUsage"):
-                        for layer in material.ForLayerSet.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSetUsage"
-                            )
-                            material_layers.append(layer.Material.Name)
-                    elif material.is_a("IfcMaterialLayerSet"):
-                        for layer in material.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSet"
-                            )
-                            material_layers.append(layer.Material.Name)
+        for material in index.get_materials(stair):
+            if material.kind == "IfcMaterial":
+                logger.debug("Found material '{}', as IfcMaterial", material.name)
+                material_layers.append(material.name)
+                current_material = material.name
+            elif material.kind in (
+                "IfcMaterialConstituentSet",
+                "IfcMaterialLayerSetUsage",
+                "IfcMaterialLayerSet",
+            ):
+                logger.debug(
+                    "Found materials {}, as {}", material.layer_names, material.kind
+                )
+                material_layers.extend(material.layer_names)
 
         if material_layers:
             logger.debug("Processing layered stair")
@@ -2017,11 +1496,10 @@ def calculate_stairs(stairs):
                     # Try material matching
                     missing_elements.append((stair.id(), mat))
                     if not MATERIAL_REAPLCE:
-                        logger.warning(
-                            f"Material '{mat}' not found. Skipping this layer."
-                        )
+                        diagnostics.report("Stair", "Material not found", stair, mat)
                         continue
                     element_data = {
+                        "element_id": stair.id(),
                         "element_type": stair.is_a(),
                         "element_name": stair.Name if hasattr(stair, "Name") else None,
                         "material_name": mat,
@@ -2037,8 +1515,12 @@ def calculate_stairs(stairs):
                     )
 
                     if similar_material and similar_material in MaterialList:
-                        logger.info(
-                            f"Material '{mat}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                        diagnostics.report(
+                            "Stair",
+                            "Material replaced by a similar material",
+                            stair,
+                            similar_material,
+                            level="INFO",
                         )
                         matched_materials.append(
                             {
@@ -2052,60 +1534,29 @@ def calculate_stairs(stairs):
                         mat = similar_material
                         mat_ec_data = MaterialList.get(mat)
                     else:
-                        logger.warning(
-                            f"Material '{mat}' not found and no similar material found. Skipping this layer."
-                        )
+                        diagnostics.report("Stair", "Material not found", stair, mat)
                         continue
 
                 # If we have material but no volume, skip
                 if current_quantity is None:
-                    logger.warning(
-                        f"No volume found for stair {stair.Name} with material {mat}. Attempting to calculate."
+                    diagnostics.report(
+                        "Stair", "No volume quantity, calculating it", stair, mat
                     )
                     current_quantity = calculator_utils.get_element_volume(stair)
                     if current_quantity is None:
-                        logger.error(
-                            f"Failed to calculate volume for stair {stair.Name}. Skipping."
+                        diagnostics.report(
+                            "Stair", "No volume", stair, None, level="ERROR"
                         )
                         missing_elements.append(stair.id())
                         continue
 
-                material_ec_perkg, material_density = mat_ec_data
                 # For layered materials, divide the volume by the number of materials
                 volume_per_material = current_quantity / len(material_layers)
-                layer_ec = material_ec_perkg * material_density * volume_per_material
-
-                material_breakdown.append(
-                    {
-                        "material": mat,
-                        "material_mass": material_density * volume_per_material,
-                        "ec": layer_ec,
-                    }
-                )
-
-                logger.debug(f"EC for material '{mat}' in {stair.Name} is {layer_ec}")
-                stair_total_ec += layer_ec
+                material_breakdown.append((mat, volume_per_material))
 
-            stair_elements.append(
-                {
-                    "element": "Stair",
-                    "ec": stair_total_ec,
-                    "materials": material_breakdown,
-                }
-            )
-            total_ec += stair_total_ec
-            for material_item in material_breakdown:
-                excel_data.append(
-                    [
-                        stair.id(),  # Element ID
-                        stair.is_a(),  # IFC Type
-                        "Stair",  # Element Type
-                        material_item["material"],  # Material
-                        material_item["ec"],  # Material EC
-                        material_item["material_mass"],  # Total Element EC
-                        "kg",
-                    ]
-                )
+            row = table.add_element(stair, "Stair")
+            for mat, volume_per_material in material_breakdown:
+                table.add_line(row, mat, volume_per_material)
 
         elif current_material:
             # Single-material stair
@@ -2116,6 +1567,7 @@ def calculate_stairs(stairs):
             if current_material_ec is None and MATERIAL_REAPLCE:
                 # Try material matching
                 element_data = {
+                    "element_id": stair.id(),
                     "element_type": stair.is_a(),
                     "element_name": stair.Name if hasattr(stair, "Name") else None,
                     "material_name": current_material,
@@ -2128,8 +1580,12 @@ def calculate_stairs(stairs):
                 )
 
                 if similar_material and similar_material in MaterialList:
-                    logger.info(
-                        f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                    diagnostics.report(
+                        "Stair",
+                        "Material replaced by a similar material",
+                        stair,
+                        similar_material,
+                        level="INFO",
                     )
                     matched_materials.append(
                         {
@@ -2143,72 +1599,45 @@ def calculate_stairs(stairs):
                     current_material = similar_material
                     current_material_ec = MaterialList.get(current_material)
                 else:
-                    logger.warning(
-                        f"Material '{current_material}' not found and no similar material found. Skipping this stair."
+                    diagnostics.report(
+                        "Stair", "Material not found", stair, current_material
                     )
                     continue
             if current_material_ec is None:
-                logger.warning(
-                    f"Material '{current_material}' not found and no similar material found. Skipping this stair."
+                diagnostics.report(
+                    "Stair", "Material not found", stair, current_material
                 )
                 missing_elements.append((stair.id(), current_material))
                 continue
 
             if current_quantity is None:
-                logger.warning(
-                    f"No volume found for stair {stair.Name}. Attempting to calculate."
-                )
+                diagnostics.report("Stair", "No volume quantity, calculating it", stair)
                 current_quantity = calculator_utils.get_element_volume(stair)
                 if current_quantity is None:
-                    logger.error(
-                        f"Failed to calculate volume for stair {stair.Name}. Skipping."
-                    )
+                    diagnostics.report("Stair", "No volume", stair, None, level="ERROR")
                     continue
 
-            material_ec_perkg, material_density = current_material_ec
-            current_ec = material_ec_perkg * material_density * current_quantity
+            row = table.add_element(stair, "Stair")
+            table.add_line(row, current_material, current_quantity)
 
-            material_breakdown.append(
-                {
-                    "material": mat,
-                    "material_mass": material_density * current_quantity,
-                    "ec": layer_ec,
-                }
-            )
-            stair_elements.append(
-                {"element": "Stair", "ec": current_ec, "materials": material_breakdown}
-            )
-            for material_item in material_breakdown:
-                excel_data.append(
-                    [
-                        stair.id(),  # Element ID
-                        stair.is_a(),  # IFC Type
-                        "Stair",  # Element Type
-                        material_item["material"],  # Material
-                        material_item["ec"],  # Material EC
-                        material_item["material_mass"],  # Total Element EC
-                        "kg",
-                    ]
-                )
-            logger.debug(f"EC for {stair.Name} is {current_ec}")
-            total_ec += current_ec
-
-        else:
-            logger.warning(
-                f"EC calculation for stair failed, attempting manual volume method"
+        else:
+            diagnostics.report(
+                "Stair", "EC calculation failed, using the manual volume method", stair
             )
             # Handle case where no material information is available
             if len(material_layers) == 0:
-                logger.warning(
-                    f"No material information found for stair {stair.Name}. Using concrete as default."
-                )
+                diagnostics.report("Stair", "No material, using a default", stair)
                 default_material = "CONCRETE"
                 if default_material in MaterialList:
                     current_material = default_material
                     current_material_ec = MaterialList.get(current_material)
                 else:
-                    logger.error(
-                        f"Default material '{default_material}' not found. Skipping this stair."
+                    diagnostics.report(
+                        "Stair",
+                        "Default material not found",
+                        stair,
+                        default_material,
+                        level="ERROR",
                     )
                     continue
             else:
@@ -2228,6 +1657,7 @@ def calculate_stairs(stairs):
                     if current_material_ec is None and MATERIAL_REAPLCE:
                         # Try material matching
                         element_data = {
+                            "element_id": stair.id(),
                             "element_type": stair.is_a(),
                             "element_name": (
                                 stair.Name if hasattr(stair, "Name") else None
@@ -2242,8 +1672,12 @@ def calculate_stairs(stairs):
                         )
 
                         if similar_material and similar_material in MaterialList:
-                            logger.info(
-                                f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                            diagnostics.report(
+                                "Stair",
+                                "Material replaced by a similar material",
+                                stair,
+                                similar_material,
+                                level="INFO",
                             )
                             matched_materials.append(
                                 {
@@ -2257,124 +1691,63 @@ def calculate_stairs(stairs):
                             current_material = similar_material
                             current_material_ec = MaterialList.get(current_material)
                         else:
-                            logger.warning(
-                                f"Material '{current_material}' not found and no similar material found. Skipping this stair."
+                            diagnostics.report(
+                                "Stair", "Material not found", stair, current_material
                             )
                             continue
                 else:
-                    logger.error(
-                        f"No suitable material found for stair {stair.Name}. Skipping."
+                    diagnostics.report(
+                        "Stair", "No material", stair, None, level="ERROR"
                     )
                     continue
 
             if current_quantity is None:
                 current_quantity = calculator_utils.get_element_volume(stair)
                 if current_quantity is None:
-                    logger.error(
-                        f"Failed to calculate volume for stair {stair.Name}. Skipping."
-                    )
+                    diagnostics.report("Stair", "No volume", stair, None, level="ERROR")
                     missing_elements.append(stair.id())
                     continue
 
-            material_ec_perkg, material_density = current_material_ec
-            current_ec = material_ec_perkg * material_density * current_quantity
-
-            material_breakdown.append(
-                {
-                    "material": mat,
-                    "material_mass": material_density * current_quantity,
-                    "ec": layer_ec,
-                }
-            )
-            stair_elements.append(
-                {"element": "Stair", "ec": current_ec, "materials": material_breakdown}
-            )
-
-            for material_item in material_breakdown:
-                excel_data.append(
-                    [
-                        stair.id(),  # Element ID
-                        stair.is_a(),  # IFC Type
-                        "Stair",  # Element Type
-                        material_item["material"],  # Material
-                        material_item["ec"],  # Material EC
-                        material_item["material_mass"],  # Total Element EC
-                        "kg",
-                    ]
-                )
-
-            logger.debug(f"EC for {stair.Name} is {current_ec}")
-            total_ec += current_ec
+            row = table.add_element(stair, "Stair")
+            table.add_line(row, current_material, current_quantity)
 
-    logger.debug(f"Total EC for stairs is {total_ec}")
-    return total_ec, stair_elements, missing_elements, excel_data, matched_materials
+    return table, missing_elements, matched_materials
 
 
-def calculate_railings(railings):
-    """Calculate embodied carbon for railings, using material matching if needed"""
-    total_ec = 0
-    railing_elements = []
+def calculate_railings(railings, index=None, table=None):
+    """Add the railings to the EC table, using material matching if needed"""
+    index = element_index.get_index(railings, index)
+    if table is None:
+        table = ec_table.ECTable()
     missing_materials = []
-    excel_data = []
 
     for railing in railings:
         current_quantity = None
         current_material = None
-        current_ec = None
         material_layers = []
-        materials_breakdown = []
 
         # Get volume information
-        if hasattr(railing, "IsDefinedBy"):
-            for definition in railing.IsDefinedBy:
-                if definition.is_a("IfcRelDefinesByProperties"):
-                    property_def = definition.RelatingPropertyDefinition
-                    if (
-                        property_def.is_a("IfcElementQuantity")
-                        and property_def.Name == "Qto_RailingBaseQuantities"
-                    ):
-                        for quantity in property_def.Quantities:
-                            if (
-                                quantity.is_a("IfcQuantityVolume")
-                                and quantity.Name == "NetVolume"
-                            ):
-                                logger.debug(
-                                    f"Found NetVolume for {railing.Name}: {quantity.VolumeValue}"
-                                )
-                                current_quantity = quantity.VolumeValue
-                                break
-                        if current_quantity is not None:
-                            break
+        current_quantity = index.get_quantity(
+            railing, "Qto_RailingBaseQuantities", "NetVolume"
+        )
+        if current_quantity is not None:
+            logger.debug("Found NetVolume for {}: {}", railing.Name, current_quantity)
 
         # Get material information
-        if hasattr(railing, "HasAssociations"):
-            for association in railing.HasAssociations:
-                if association.is_a("IfcRelAssociatesMaterial"):
-                    material = association.RelatingMaterial
-                    if material.is_a("IfcMaterial"):
-                        logger.debug(
-                            f"Found material '{material.Name}', as IfcMaterial"
-                        )
-                        material_layers.append(material.Name)
-                        current_material = material.Name
-                    elif material.is_a("IfcMaterialConstituentSet"):
-                        for layer in material.MaterialConstituents:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialConstituent"
-                            )
-                            material_layers.append(layer.Material.Name)
-                    elif material.is_a("IfcMaterialLayerSetUsage"):
-                        for layer in material.ForLayerSet.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSetUsage"
-                            )
-                            material_layers.append(layer.Material.Name)
-                    elif material.is_a("IfcMaterialLayerSet"):
-                        for layer in material.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSet"
-                            )
-                            material_layers.append(layer.Material.Name)
+        for material in index.get_materials(railing):
+            if material.kind == "IfcMaterial":
+                logger.debug("Found material '{}', as IfcMaterial", material.name)
+                material_layers.append(material.name)
+                current_material = material.name
+            elif material.kind in (
+                "IfcMaterialConstituentSet",
+                "IfcMaterialLayerSetUsage",
+                "IfcMaterialLayerSet",
+            ):
+                logger.debug(
+                    "Found materials {}, as {}", material.layer_names, material.kind
+                )
+                material_layers.extend(material.layer_names)
 
         # Handle the material calculations
         if material_layers:
@@ -2386,8 +1759,8 @@ def calculate_railings(railings):
             ]
 
             if len(MaterialList_filtered) == 0:
-                logger.error(
-                    f"No usable materials found for railing {railing.Name}. Skipping."
+                diagnostics.report(
+                    "Railing", "No material", railing, None, level="ERROR"
                 )
                 continue
 
@@ -2395,13 +1768,14 @@ def calculate_railings(railings):
             current_material = max(
                 set(MaterialList_filtered), key=MaterialList_filtered.count
             )
-            logger.debug(f"Using material {current_material} for railing")
+            logger.debug("Using material {} for railing", current_material)
 
             current_material_ec = MaterialList.get(current_material, None)
 
             if current_material_ec is None and MATERIAL_REAPLCE:
                 # Try material matching
                 element_data = {
+                    "element_id": railing.id(),
                     "element_type": railing.is_a(),
                     "element_name": railing.Name if hasattr(railing, "Name") else None,
                     "material_name": current_material,
@@ -2414,8 +1788,12 @@ def calculate_railings(railings):
                 )
 
                 if similar_material and similar_material in MaterialList:
-                    logger.info(
-                        f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                    diagnostics.report(
+                        "Railing",
+                        "Material replaced by a similar material",
+                        railing,
+                        similar_material,
+                        level="INFO",
                     )
                     current_material = similar_material
                     current_material_ec = MaterialList.get(current_material)
@@ -2430,35 +1808,44 @@ def calculate_railings(railings):
                         )
                         current_material_ec = MaterialList.get(current_material)
                         if current_material_ec:
-                            logger.warning(
-                                f"Using alternative material '{current_material}' for railing"
+                            diagnostics.report(
+                                "Railing",
+                                "Using an alternative material",
+                                railing,
+                                current_material,
                             )
                         else:
-                            logger.error(
-                                f"No suitable material found for railing {railing.Name}. Skipping."
+                            diagnostics.report(
+                                "Railing", "No material", railing, None, level="ERROR"
                             )
                             continue
                     else:
-                        logger.error(
-                            f"No suitable material found for railing {railing.Name}. Skipping."
+                        diagnostics.report(
+                            "Railing", "No material", railing, None, level="ERROR"
                         )
                         continue
         else:
-            logger.warning(
-                f"No material information for railing {railing.Name}. Assuming steel."
-            )
+            diagnostics.report("Railing", "No material, using a default", railing)
             # Default to steel for railings if no material is specified
             if "STEEL" in MaterialList:
                 current_material = "STEEL"
                 current_material_ec = MaterialList.get(current_material)
             else:
-                logger.error(
-                    f"Default steel material not found in MaterialList. Skipping this railing."
+                diagnostics.report(
+                    "Railing",
+                    "Default material not found",
+                    railing,
+                    None,
+                    level="ERROR",
                 )
                 continue
         if current_material_ec is None:
-            logger.error(
-                f"Material '{current_material}' not found and no similar material found. Skipping this railing."
+            diagnostics.report(
+                "Railing",
+                "Material not found",
+                railing,
+                current_material,
+                level="ERROR",
             )
             missing_materials.append((railing.id(), current_material))
             continue
@@ -2466,114 +1853,52 @@ def calculate_railings(railings):
         if current_quantity is None:
             current_quantity = calculator_utils.get_element_volume(railing)
             if current_quantity is None or current_quantity <= 0:
-                logger.error(
-                    f"Failed to calculate positive volume for railing {railing.Name}. Skipping."
-                )
+                diagnostics.report("Railing", "No volume", railing, None, level="ERROR")
                 missing_materials.append(railing.id())
                 continue
 
-        material_ec_perkg, material_density = current_material_ec
-        current_ec = material_ec_perkg * material_density * current_quantity
-
-        materials_breakdown.append(
-            {
-                "material": current_material,
-                "material_mass": material_density * current_quantity,
-                "ec": current_ec,
-            }
-        )
-
         # Add this railing as an element
-        railing_elements.append(
-            {"element": "Railing", "ec": current_ec, "materials": materials_breakdown}
-        )
-
-        logger.debug(
-            f"EC for {railing.Name} is {current_ec}, volume is {current_quantity}"
-        )
-        total_ec += current_ec
-        for material_item in materials_breakdown:
-            excel_data.append(
-                [
-                    railing.id(),  # Element ID
-                    railing.is_a(),  # IFC Type
-                    "Railing",  # Element Type
-                    material_item["material"],  # Material
-                    material_item["ec"],  # Material EC
-                    material_item["material_mass"],  # Total Element EC
-                    "kg",
-                ]
-            )
+        row = table.add_element(railing, "Railing")
+        table.add_line(row, current_material, current_quantity)
 
-    logger.debug(f"Total EC for railings is {total_ec}")
-    return total_ec, railing_elements, missing_materials, excel_data
+    return table, missing_materials, []
 
 
-def calculate_members(members):
-    """Calculate embodied carbon for structural members, using material matching if needed"""
-    total_ec = 0
-    member_elements = []
+def calculate_members(members, index=None, table=None):
+    """Add the structural members to the EC table, using material matching if needed"""
+    index = element_index.get_index(members, index)
+    if table is None:
+        table = ec_table.ECTable()
     missing_elements = []
-    excel_data = []
     matched_materials = []
 
     for member in members:
         current_quantity = None
         current_material = None
         material_layers = []
-        materials_breakdown = []
 
         # Get volume information
-        if hasattr(member, "IsDefinedBy"):
-            for definition in member.IsDefinedBy:
-                if definition.is_a("IfcRelDefinesByProperties"):
-                    property_def = definition.RelatingPropertyDefinition
-                    if (
-                        property_def.is_a("IfcElementQuantity")
-                        and property_def.Name == "Qto_MemberBaseQuantities"
-                    ):
-                        for quantity in property_def.Quantities:
-                            if (
-                                quantity.is_a("IfcQuantityVolume")
-                                and quantity.Name == "NetVolume"
-                            ):
-                                logger.debug(
-                                    f"Found NetVolume for {member.Name}: {quantity.VolumeValue}"
-                                )
-                                current_quantity = quantity.VolumeValue
-                                break
-                        if current_quantity is not None:
-                            break
+        current_quantity = index.get_quantity(
+            member, "Qto_MemberBaseQuantities", "NetVolume"
+        )
+        if current_quantity is not None:
+            logger.debug("Found NetVolume for {}: {}", member.Name, current_quantity)
 
         # Get material information
-        if hasattr(member, "HasAssociations"):
-            for association in member.HasAssociations:
-                if association.is_a("IfcRelAssociatesMaterial"):
-                    material = association.RelatingMaterial
-                    if material.is_a("IfcMaterial"):
-                        logger.debug(
-                            f"Found material '{material.Name}', as IfcMaterial"
-                        )
-                        material_layers.append(material.Name)
-                        current_material = material.Name
-                    elif material.is_a("IfcMaterialLayerSetUsage"):
-                        for layer in material.ForLayerSet.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSetUsage"
-                            )
-                            material_layers.append(layer.Material.Name)
-                    elif material.is_a("IfcMaterialLayerSet"):
-                        for layer in material.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSet"
-                            )
-                            material_layers.append(layer.Material.Name)
-                    elif material.is_a("IfcMaterialConstituentSet"):
-                        for layer in material.MaterialConstituents:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialConstituent"
-                            )
-                            material_layers.append(layer.Material.Name)
+        for material in index.get_materials(member):
+            if material.kind == "IfcMaterial":
+                logger.debug("Found material '{}', as IfcMaterial", material.name)
+                material_layers.append(material.name)
+                current_material = material.name
+            elif material.kind in (
+                "IfcMaterialConstituentSet",
+                "IfcMaterialLayerSetUsage",
+                "IfcMaterialLayerSet",
+            ):
+                logger.debug(
+                    "Found materials {}, as {}", material.layer_names, material.kind
+                )
+                material_layers.extend(material.layer_names)
 
         # Store this material in our database for future reference
         if current_material and current_material not in MaterialsToIgnore:
@@ -2606,6 +1931,7 @@ def calculate_members(members):
                     )
 
             element_data = {
+                "element_id": member.id(),
                 "element_type": member.is_a(),
                 "element_name": member.Name if hasattr(member, "Name") else None,
                 "material_name": current_material,
@@ -2618,8 +1944,12 @@ def calculate_members(members):
             )
 
             if similar_material and similar_material in MaterialList:
-                logger.info(
-                    f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                diagnostics.report(
+                    "Member",
+                    "Material replaced by a similar material",
+                    member,
+                    similar_material,
+                    level="INFO",
                 )
                 matched_materials.append(
                     {
@@ -2635,19 +1965,17 @@ def calculate_members(members):
             else:
                 # Try with a common default if nothing else works
                 if "STEEL" in MaterialList:
-                    logger.warning(
-                        f"No suitable material found for member {member.Name}. Using STEEL as default."
-                    )
+                    diagnostics.report("Member", "No material, using a default", member)
                     current_material = "STEEL"
                     current_material_ec = MaterialList.get(current_material)
                 else:
-                    logger.error(
-                        f"No suitable material found for member {member.Name}. Skipping."
+                    diagnostics.report(
+                        "Member", "No material", member, None, level="ERROR"
                     )
                     continue
         if current_material_ec is None:
-            logger.error(
-                f"Material '{current_material}' not found and no similar material found. Skipping this member."
+            diagnostics.report(
+                "Member", "Material not found", member, current_material, level="ERROR"
             )
             missing_elements.append((member.id(), current_material))
             continue
@@ -2655,52 +1983,22 @@ def calculate_members(members):
         if current_quantity is None:
             current_quantity = calculator_utils.get_element_volume(member)
             if current_quantity is None or current_quantity <= 0:
-                logger.error(
-                    f"Failed to calculate positive volume for member {member.Name}. Skipping."
-                )
+                diagnostics.report("Member", "No volume", member, None, level="ERROR")
                 missing_elements.append(member.id())
                 continue
 
-        material_ec_perkg, material_density = current_material_ec
-        current_ec = material_ec_perkg * material_density * current_quantity
+        row = table.add_element(member, "Member")
+        table.add_line(row, current_material, current_quantity)
 
-        materials_breakdown.append(
-            {
-                "material": current_material,
-                "material_mass": material_density * current_quantity,
-                "ec": current_ec,
-            }
-        )
-
-        member_elements.append(
-            {"element": "Member", "ec": current_ec, "materials": materials_breakdown}
-        )
-
-        logger.debug(f"EC for {member.Name} is {current_ec}")
-        total_ec += current_ec
-        for material_item in materials_breakdown:
-            excel_data.append(
-                [
-                    member.id(),  # Element ID
-                    member.is_a(),  # IFC Type
-                    "Member",  # Element Type
-                    material_item["material"],  # Material
-                    material_item["ec"],  # Material EC
-                    material_item["material_mass"],  # Total Element EC
-                    "kg",
-                ]
-            )
-
-    logger.debug(f"Total EC for members is {total_ec}")
-    return total_ec, member_elements, missing_elements, excel_data, matched_materials
+    return table, missing_elements, matched_materials
 
 
-def calculate_plates(plates):
-    """Calculate embodied carbon for plates, using material matching if needed"""
-    total_ec = 0
-    plate_elements = []
+def calculate_plates(plates, index=None, table=None):
+    """Add the plates to the EC table, using material matching if needed"""
+    index = element_index.get_index(plates, index)
+    if table is None:
+        table = ec_table.ECTable()
     missing_elements = []
-    excel_data = []
     matched_materials = []
 
     for plate in plates:
@@ -2708,78 +2006,36 @@ def calculate_plates(plates):
         current_material = None
         current_area = None
         material_layers = []
-        materials_breakdown = []
 
         # Get volume/area information
-        if hasattr(plate, "IsDefinedBy"):
-            for definition in plate.IsDefinedBy:
-                if definition.is_a("IfcRelDefinesByProperties"):
-                    property_def = definition.RelatingPropertyDefinition
-                    if (
-                        property_def.is_a("IfcElementQuantity")
-                        and property_def.Name == "Qto_PlateBaseQuantities"
-                    ):
-                        for quantity in property_def.Quantities:
-                            if (
-                                quantity.is_a("IfcQuantityVolume")
-                                and quantity.Name == "NetVolume"
-                            ):
-                                logger.debug(
-                                    f"Found NetVolume for {plate.Name}: {quantity.VolumeValue}"
-                                )
-                                current_quantity = quantity.VolumeValue
-                            elif (
-                                quantity.is_a("IfcQuantityArea")
-                                and quantity.Name == "NetArea"
-                            ):
-                                logger.debug(
-                                    f"Found NetArea for {plate.Name}: {quantity.AreaValue}"
-                                )
-                                current_area = quantity.AreaValue
-                        if current_quantity is not None:
-                            break
+        for quantity in index.get_quantities(plate, "Qto_PlateBaseQuantities"):
+            if quantity.is_a("IfcQuantityVolume") and quantity.Name == "NetVolume":
+                logger.debug(
+                    "Found NetVolume for {}: {}", plate.Name, quantity.VolumeValue
+                )
+                current_quantity = quantity.VolumeValue
+            elif quantity.is_a("IfcQuantityArea") and quantity.Name == "NetArea":
+                logger.debug("Found NetArea for {}: {}", plate.Name, quantity.AreaValue)
+                current_area = quantity.AreaValue
 
         # Get material information
-        if hasattr(plate, "HasAssociations"):
-            for association in plate.HasAssociations:
-                if association.is_a("IfcRelAssociatesMaterial"):
-                    material = association.RelatingMaterial
-                    if material.is_a("IfcMaterial"):
-                        logger.debug(
-                            f"Found material '{material.Name}', as IfcMaterial"
-                        )
-                        material_layers.append(material.Name)
-                        current_material = material.Name
-                    elif material.is_a("IfcMaterialLayerSetUsage"):
-                        for layer in material.ForLayerSet.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSetUsage"
-                            )
-                            material_layers.append(layer.Material.Name)
-                            if (
-                                not current_material
-                            ):  # Use the first layer as the primary material
-                                current_material = layer.Material.Name
-                    elif material.is_a("IfcMaterialLayerSet"):
-                        for layer in material.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSet"
-                            )
-                            material_layers.append(layer.Material.Name)
-                            if (
-                                not current_material
-                            ):  # Use the first layer as the primary material
-                                current_material = layer.Material.Name
-                    elif material.is_a("IfcMaterialConstituentSet"):
-                        for layer in material.MaterialConstituents:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialConstituent"
-                            )
-                            material_layers.append(layer.Material.Name)
-                            if (
-                                not current_material
-                            ):  # Use the first constituent as the primary material
-                                current_material = layer.Material.Name
+        for material in index.get_materials(plate):
+            if material.kind == "IfcMaterial":
+                logger.debug("Found material '{}', as IfcMaterial", material.name)
+                material_layers.append(material.name)
+                current_material = material.name
+            elif material.kind in (
+                "IfcMaterialLayerSetUsage",
+                "IfcMaterialLayerSet",
+                "IfcMaterialConstituentSet",
+            ):
+                logger.debug(
+                    "Found materials {}, as {}", material.layer_names, material.kind
+                )
+                material_layers.extend(material.layer_names)
+                if not current_material and material.layer_names:
+                    # Use the first layer as the primary material
+                    current_material = material.layer_names[0]
 
         # Store this material in our database for future reference
         if current_material and current_material not in MaterialsToIgnore:
@@ -2813,6 +2069,7 @@ def calculate_plates(plates):
                     )
 
             element_data = {
+                "element_id": plate.id(),
                 "element_type": plate.is_a(),
                 "element_name": plate.Name if hasattr(plate, "Name") else None,
                 "material_name": current_material,
@@ -2826,8 +2083,12 @@ def calculate_plates(plates):
             )
 
             if similar_material and similar_material in MaterialList:
-                logger.info(
-                    f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                diagnostics.report(
+                    "Plate",
+                    "Material replaced by a similar material",
+                    plate,
+                    similar_material,
+                    level="INFO",
                 )
                 matched_materials.append(
                     {
@@ -2844,20 +2105,20 @@ def calculate_plates(plates):
                 # For plates, try common materials like steel or glass if no match found
                 for default_material in ["STEEL", "GLASS", "ALUMINIUM"]:
                     if default_material in MaterialList:
-                        logger.warning(
-                            f"No suitable material found for plate {plate.Name}. Using {default_material} as default."
+                        diagnostics.report(
+                            "Plate", "No material, using a default", plate
                         )
                         current_material = default_material
                         current_material_ec = MaterialList.get(current_material)
                         break
                 else:
-                    logger.error(
-                        f"No suitable material found for plate {plate.Name}. Skipping."
+                    diagnostics.report(
+                        "Plate", "No material", plate, None, level="ERROR"
                     )
                     continue
         if current_material_ec is None:
-            logger.error(
-                f"Material '{current_material}' not found and no similar material found. Skipping this plate."
+            diagnostics.report(
+                "Plate", "Material not found", plate, current_material, level="ERROR"
             )
             missing_elements.append((plate.id(), current_material))
             continue
@@ -2868,145 +2129,66 @@ def calculate_plates(plates):
                 # Assume a typical thickness for plates (e.g., 10mm = 0.01m)
                 estimated_thickness = 0.01  # meters
                 current_quantity = current_area * estimated_thickness
-                logger.warning(
-                    f"Estimating volume for plate {plate.Name} based on area: {current_quantity}"
+                diagnostics.report(
+                    "Plate", "Volume estimated from area", plate, current_quantity
                 )
             else:
                 # Try to calculate volume directly
                 current_quantity = calculator_utils.get_element_volume(plate)
 
             if current_quantity is None or current_quantity <= 0:
-                logger.error(
-                    f"Failed to calculate positive volume for plate {plate.Name}. Skipping."
-                )
+                diagnostics.report("Plate", "No volume", plate, None, level="ERROR")
                 missing_elements.append(plate.id())
                 continue
 
-        material_ec_perkg, material_density = current_material_ec
-        current_ec = material_ec_perkg * material_density * current_quantity
-        materials_breakdown.append(
-            {
-                "material": current_material,
-                "material_mass": material_density * current_quantity,
-                "ec": current_ec,
-            }
-        )
+        row = table.add_element(plate, "Plate")
+        table.add_line(row, current_material, current_quantity)
 
-        plate_elements.append(
-            {"element": "Plate", "ec": current_ec, "materials": materials_breakdown}
-        )
-        logger.debug(f"EC for {plate.Name} is {current_ec}")
-        total_ec += current_ec
-        for material_item in materials_breakdown:
-            excel_data.append(
-                [
-                    plate.id(),  # Element ID
-                    plate.is_a(),  # IFC Type
-                    "Plate",  # Element Type
-                    material_item["material"],  # Material
-                    material_item["ec"],  # Material EC
-                    material_item["material_mass"],  # Total Element EC
-                    "kg",
-                ]
-            )
+    return table, missing_elements, matched_materials
 
-    logger.debug(f"Total EC for plates is {total_ec}")
 
-    return total_ec, plate_elements, missing_elements, excel_data, matched_materials
-
-
-def calculate_piles(piles):
-    """Calculate embodied carbon for piles, using material matching if needed"""
-    total_ec = 0
+def calculate_piles(piles, index=None, table=None):
+    """Add the piles to the EC table, using material matching if needed"""
+    index = element_index.get_index(piles, index)
+    if table is None:
+        table = ec_table.ECTable()
     quantities = {}
-    pile_elements = []
     missing_elements = []
     current_quantity = None
     current_material = None
-    rebar = None
-    excel_data = []
     matched_materials = []  # Track materials that were matched
+    rebar_volumes = rebar.pile_volumes(piles, index)
 
-    for pile in piles:
+    for pile, rebar_vol in zip(piles, rebar_volumes.tolist()):
         materials = []
-        material_breakdown = []
-        psets = get_psets(pile)
-        rebar_set = psets.get("Rebar Set")
-        if rebar_set is None:
-            logger.error("Rebar set not found")
-        if rebar_set:
-            rebar = rebar_set.get("MainRebar")
-            if rebar is None:
-                logger.error("Rebar not found")
-
-        dimensions = psets.get("Dimensions")
-        if dimensions is None:
-            logger.error("Dimensions/Diameter not found")
-        if dimensions:
-            lengthmm = dimensions.get("Length")
-            if lengthmm is None:
-                logger.error("Length not found")
-            else:
-                length = lengthmm / 1000
-                logger.info(f"Length is: {length}")
-
-        if rebar:
-            rebar_no, area = rebar.split("H")
-            rebar_vol = length * int(rebar_no) * 3.14 * ((int(area) / 2000) ** 2)
-
-        if hasattr(pile, "IsDefinedBy"):
-            for definition in pile.IsDefinedBy:
-                if definition.is_a("IfcRelDefinesByProperties"):
-                    property_def = definition.RelatingPropertyDefinition
-                    if (
-                        property_def.is_a("IfcElementQuantity")
-                        and property_def.Name == "Qto_PileBaseQuantities"
-                    ):
-                        for quantity in property_def.Quantities:
-                            if (
-                                quantity.is_a("IfcQuantityVolume")
-                                and quantity.Name == "NetVolume"
-                            ):
-                                logger.debug(
-                                    f"Found NetVolume  for {pile.Name}: {quantity.VolumeValue}"
-                                )
-                                quantities[quantity.Name] = quantity.VolumeValue
-                                current_quantity = quantity.VolumeValue
-                                break
-                        if current_quantity is not None:
-                            break
-
-        if hasattr(pile, "HasAssociations"):
-            for association in pile.HasAssociations:
-                if association.is_a("IfcRelAssociatesMaterial"):
-                    material = association.RelatingMaterial
-                    if material.is_a("IfcMaterial"):
-                        logger.debug(
-                            f"Found material '{material.Name}', as IfcMaterial"
-                        )
-                        materials.append(material.Name)
-                        current_material = material.Name
-                        break
-                    elif material.is_a("IfcMaterialLayerSetUsage"):
-                        for layer in material.ForLayerSet.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSetUsage"
-                            )
-                            materials.append(layer.Material.Name)
-                            current_material = material.Name
-                            break
-                    elif material.is_a("IfcMaterialLayerSet"):
-                        for layer in material.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSet"
-                            )
-                            materials.append(layer.Material.Name)
-                            current_material = material.Name
-                            break
+        rebar_set = index.get_psets(pile).get("Rebar Set")
+
+        current_quantity = index.get_quantity(
+            pile, "Qto_PileBaseQuantities", "NetVolume"
+        )
+        if current_quantity is not None:
+            logger.debug("Found NetVolume  for {}: {}", pile.Name, current_quantity)
+            quantities["NetVolume"] = current_quantity
+
+        for material in index.get_materials(pile):
+            if material.kind == "IfcMaterial":
+                logger.debug("Found material '{}', as IfcMaterial", material.name)
+                materials.append(material.name)
+                current_material = material.name
+                break
+            elif material.kind in ("IfcMaterialLayerSetUsage", "IfcMaterialLayerSet"):
+                for layer_name in material.layer_names[:1]:
+                    logger.debug(
+                        "Found material '{}', as {}", layer_name, material.kind
+                    )
+                    materials.append(layer_name)
+                    current_material = material.name
 
-        logger.info(materials)
+        logger.debug("Materials of pile {}: {}", pile.Name, materials)
         if len(materials) > 1:
-            logger.error("Material Layers code not implemented")
+            diagnostics.report(
+                "Pile", "Material layer sets not supported", pile, None, level="ERROR"
+            )
             continue
 
         current_material_ec = (
@@ -3047,6 +2229,7 @@ def calculate_piles(piles):
             if MATERIAL_REAPLCE:
                 # Use material matching instead of raising an error
                 element_data = {
+                    "element_id": pile.id(),
                     "element_type": pile.is_a(),
                     "element_name": pile.Name if hasattr(pile, "Name") else None,
                     "material_name": current_material,
@@ -3060,8 +2243,12 @@ def calculate_piles(piles):
                 )
 
                 if similar_material and similar_material in MaterialList:
-                    logger.info(
-                        f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                    diagnostics.report(
+                        "Pile",
+                        "Material replaced by a similar material",
+                        pile,
+                        similar_material,
+                        level="INFO",
                     )
                     # Add to matched materials list
                     matched_materials.append(
@@ -3076,281 +2263,70 @@ def calculate_piles(piles):
                     current_material = similar_material
                     current_material_ec = MaterialList.get(current_material)
                 else:
-                    logger.error(
-                        f"Material '{current_material}' not found and no similar material found. Skipping this pile."
+                    diagnostics.report(
+                        "Pile",
+                        "Material not found",
+                        pile,
+                        current_material,
+                        level="ERROR",
                     )
                     continue
             else:
-                logger.error(f"Could not find Material {current_material}")
+                diagnostics.report(
+                    "Pile", "Material not found", pile, current_material, level="ERROR"
+                )
                 continue
 
         if current_quantity is None:
-            logger.error(f"Failed to get volume for pile {pile.Name}. Skipping.")
+            diagnostics.report("Pile", "No volume", pile, None, level="ERROR")
             missing_elements.append(pile.id())
             continue
 
-        material_ec_perkg, material_density = current_material_ec
-
-        if rebar == None:
-            current_ec = material_ec_perkg * material_density * current_quantity
-            material_breakdown.append(
-                {
-                    "material": current_material,
-                    "material_mass": material_density * current_quantity,
-                    "ec": current_ec,
-                }
-            )
-        else:
-            current_ec = (
-                material_ec_perkg * material_density * (current_quantity - rebar_vol)
-            )
-            rebar_ec = rebar_vol * 2.510 * 7850
-            logger.debug(
-                f"EC for {pile.Name}'s rebars is {rebar_ec} for volume of {rebar_vol}"
-            )
-            material_breakdown.append(
-                {
-                    "material": current_material,
-                    "material_mass": material_density * (current_quantity - rebar_vol),
-                    "ec": current_ec,
-                }
-            )
-            material_breakdown.append(
-                {"material": "Rebar", "material_mass": rebar_vol * 7850, "ec": rebar_ec}
-            )
-            total_ec += rebar_ec
-
-        pile_elements.append(
-            {"element": "Pile", "ec": current_ec, "materials": material_breakdown}
-        )
-        logger.debug(f"EC for {pile.Name} is {current_ec}")
-        total_ec += current_ec
-        for material_item in material_breakdown:
-            excel_data.append(
-                [
-                    pile.id(),  # Element ID
-                    pile.is_a(),  # IFC Type
-                    "Pile",  # Element Type
-                    material_item["material"],  # Material
-                    material_item["ec"],  # Material EC
-                    material_item["material_mass"],  # Total Element EC
-                    "kg",
-                ]
-            )
-
-    logger.debug(f"Total EC for piles is {total_ec}")
+        # The concrete volume excludes the reinforcement
+        row = table.add_element(pile, "Pile", rebar_volume=rebar_vol)
+        table.add_line(row, current_material, current_quantity - rebar_vol)
 
-    # Updated return statement to include matched_materials
-    return total_ec, pile_elements, missing_elements, excel_data, matched_materials
+    return table, missing_elements, matched_materials
 
 
-def calculate_footings(footings):
-    """Calculate embodied carbon for footings, using material matching if needed"""
-    total_ec = 0
+def calculate_footings(footings, index=None, table=None):
+    """Add the footings to the EC table, using material matching if needed"""
+    index = element_index.get_index(footings, index)
+    if table is None:
+        table = ec_table.ECTable()
     quantities = {}
-    footing_elements = []
     missing_elements = []
     current_quantity = None
     current_material = None
-    rebar = None
-    excel_data = []
     matched_materials = []  # Added matched_materials list
+    rebar_volumes = rebar.footing_volumes(footings, index)
 
-    for footing in footings:
+    for footing, rebar_vol in zip(footings, rebar_volumes.tolist()):
         materials = []
-        material_breakdown = []
-        psets = get_psets(footing)
-        rebar_set = psets.get("Rebar Set")
-        if rebar_set is None:
-            logger.error("Rebar set not found")
-        if rebar_set:
-            BD = rebar_set.get("BottomDistribution")
-            BM = rebar_set.get("BottomMain")
-            sidebar = rebar_set.get("SideBar")
-            stirrups = rebar_set.get("Stirrups")
-            TD = rebar_set.get("TopDistribution")
-            TM = rebar_set.get("TopMain")
-            if (
-                BD == None
-                or BM == None
-                or sidebar == None
-                or stirrups == None
-                or TM == None
-                or TD == None
-            ):
-                logger.error("Rebar part not found")
-
-            # Get diameter and spacing
-            BDdiameter, BDspacing = BD.split("-")
-            BDdiameter = BDdiameter[1:3]
-            BMdiameter, BMspacing = BM.split("-")
-            BMdiameter = BMdiameter[1:3]
-            sidebar_diameter, sidebar_spacing = sidebar.split("-")
-            sidebar_diameter = sidebar_diameter[1:3]
-            stirrups_diameter, stirrups_spacing, ignore = stirrups.split("-")
-            stirrups_diameter = stirrups_diameter[1:3]
-            TDdiameter, TDspacing = TD.split("-")
-            TDdiameter = TDdiameter[1:3]
-            TMdiameter, TMspacing = TM.split("-")
-            TMdiameter = TMdiameter[1:3]
-
-        # Get width and length
-        dimensions = psets.get("Dimensions")
-        if dimensions is None:
-            logger.error("Dimensions/Diameter not found")
-        if dimensions:
-            lengthmm = dimensions.get("Length")
-            if lengthmm is None:
-                logger.error("Length not found")
-            else:
-                length = lengthmm / 1000
-
-            widthmm = dimensions.get("Width")
-            if widthmm is None:
-                logger.error("Width not found")
-            else:
-                width = widthmm / 1000
-
-            heightmm = dimensions.get("Foundation Thickness")
-            if heightmm is None:
-                logger.error("Height not found")
-            else:
-                height = heightmm / 1000
-
-        if rebar_set:
-            rebar_length = length - (2 * (50 / 1000))
-            rebar_breadth = width - (2 * (50 / 1000))
-            rebar_height = height - (2 * (50 / 1000))
-            # Bottom
-
-            length_rebarsno = math.floor(rebar_length / (int(BDspacing) / 1000)) + 1
-            breadth_rebarsno = math.floor(rebar_breadth / (int(BMspacing) / 1000)) + 1
-
-            bottom_vol = (
-                breadth_rebarsno
-                * rebar_length
-                * (3.14 * ((int(BDdiameter) / 2000) ** 2))
-            ) + (
-                length_rebarsno
-                * rebar_breadth
-                * (3.14 * ((int(BMdiameter) / 2000) ** 2))
-            )
-
-            # Top
-            length_rebarsno = math.floor(rebar_length / (int(TDspacing) / 1000)) + 1
-            breadth_rebarsno = math.floor(rebar_breadth / (int(TMspacing) / 1000)) + 1
-
-            top_vol = (
-                breadth_rebarsno
-                * rebar_length
-                * (3.14 * ((int(TDdiameter) / 2000) ** 2))
-            ) + (
-                length_rebarsno
-                * rebar_breadth
-                * (3.14 * ((int(TMdiameter) / 2000) ** 2))
-            )
-
-            # Side
-            length_rebarsno = math.floor(rebar_length / (int(TDspacing) / 1000)) + 1
-            breadth_rebarsno = math.floor(rebar_breadth / (int(TMspacing) / 1000)) + 1
-            height_rebarsno = (
-                math.floor(rebar_height / (int(sidebar_spacing) / 1000)) + 1
-            )
+        rebar_set = index.get_psets(footing).get("Rebar Set")
 
-            # side_vol = (length * height) + (breadth * height) + (height * length) + (height * breadth)
-            side_vol = (
-                (
-                    2
-                    * (
-                        length_rebarsno
-                        * rebar_height
-                        * (3.14 * ((int(sidebar_diameter) / 2000) ** 2))
-                    )
-                )
-                + (
-                    2
-                    * (
-                        breadth_rebarsno
-                        * rebar_height
-                        * (3.14 * ((int(sidebar_diameter) / 2000) ** 2))
-                    )
-                )
-                + (
-                    2
-                    * (
-                        height_rebarsno
-                        * rebar_length
-                        * (3.14 * ((int(sidebar_diameter) / 2000) ** 2))
-                    )
-                )
-                + (
-                    2
-                    * (
-                        height_rebarsno
-                        * rebar_breadth
-                        * (3.14 * ((int(sidebar_diameter) / 2000) ** 2))
+        for quantity in index.get_quantities(footing, "Qto_FootingBaseQuantities"):
+            if quantity.is_a("IfcQuantityVolume") and (
+                quantity.Name == "NetVolume" or quantity.Name == "GrossVolume"
+            ):
+                logger.debug("Found NetVolume  for {}", footing.Name)
+                quantities[quantity.Name] = quantity.VolumeValue
+                current_quantity = quantity.VolumeValue
+                break
+
+        for material in index.get_materials(footing):
+            if material.kind == "IfcMaterial":
+                logger.debug("Found material '{}', as IfcMaterial", material.name)
+                materials.append(material.name)
+                current_material = material.name
+                break
+            elif material.kind in ("IfcMaterialLayerSetUsage", "IfcMaterialLayerSet"):
+                for layer_name in material.layer_names[:1]:
+                    logger.debug(
+                        "Found material '{}', as {}", layer_name, material.kind
                     )
-                )
-            )
-
-            # Stirrups
-            perimeter = (2 * rebar_breadth) + (2 * rebar_height)
-            length_rebarsno = (
-                math.floor(rebar_length / (int(stirrups_spacing) / 1000)) + 1
-            )
-            stirrups_vol = (
-                length_rebarsno
-                * perimeter
-                * (3.14 * ((int(stirrups_diameter) / 2000) ** 2))
-            )
-
-        if hasattr(footing, "IsDefinedBy"):
-            for definition in footing.IsDefinedBy:
-                if definition.is_a("IfcRelDefinesByProperties"):
-                    property_def = definition.RelatingPropertyDefinition
-                    if (
-                        property_def.is_a("IfcElementQuantity")
-                        and property_def.Name == "Qto_FootingBaseQuantities"
-                    ):
-                        for quantity in property_def.Quantities:
-                            if quantity.is_a("IfcQuantityVolume") and (
-                                quantity.Name == "NetVolume"
-                                or quantity.Name == "GrossVolume"
-                            ):
-                                logger.debug(f"Found NetVolume  for {footing.Name}")
-                                quantities[quantity.Name] = quantity.VolumeValue
-                                current_quantity = quantity.VolumeValue
-                                break
-                        if current_quantity is not None:
-                            break
-
-        if hasattr(footing, "HasAssociations"):
-            for association in footing.HasAssociations:
-                if association.is_a("IfcRelAssociatesMaterial"):
-                    material = association.RelatingMaterial
-                    if material.is_a("IfcMaterial"):
-                        logger.debug(
-                            f"Found material '{material.Name}', as IfcMaterial"
-                        )
-                        materials.append(material.Name)
-                        current_material = material.Name
-                        break
-                    elif material.is_a("IfcMaterialLayerSetUsage"):
-                        for layer in material.ForLayerSet.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSetUsage"
-                            )
-                            materials.append(layer.Material.Name)
-                            current_material = material.Name
-                            break
-                    elif material.is_a("IfcMaterialLayerSet"):
-                        for layer in material.MaterialLayers:
-                            logger.debug(
-                                f"Found material '{layer.Material.Name}', as IfcMaterialLayerSet"
-                            )
-                            materials.append(layer.Material.Name)
-                            current_material = material.Name
-                            break
+                    materials.append(layer_name)
+                    current_material = material.name
 
         current_material_ec = (
             MaterialList.get(current_material, None) if current_material else None
@@ -3390,6 +2366,7 @@ def calculate_footings(footings):
             if MATERIAL_REAPLCE:
                 # Use material matching instead of raising an error
                 element_data = {
+                    "element_id": footing.id(),
                     "element_type": footing.is_a(),
                     "element_name": footing.Name if hasattr(footing, "Name") else None,
                     "material_name": current_material,
@@ -3403,8 +2380,12 @@ def calculate_footings(footings):
                 )
 
                 if similar_material and similar_material in MaterialList:
-                    logger.info(
-                        f"Material '{current_material}' not found. Using similar material '{similar_material}' (similarity: {similarity:.3f})"
+                    diagnostics.report(
+                        "Footing",
+                        "Material replaced by a similar material",
+                        footing,
+                        similar_material,
+                        level="INFO",
                     )
                     # Add to matched materials list
                     matched_materials.append(
@@ -3419,112 +2400,347 @@ def calculate_footings(footings):
                     current_material = similar_material
                     current_material_ec = MaterialList.get(current_material)
                 else:
-                    logger.error(
-                        f"Material '{current_material}' not found and no similar material found. Skipping this footing."
+                    diagnostics.report(
+                        "Footing",
+                        "Material not found",
+                        footing,
+                        current_material,
+                        level="ERROR",
                     )
                     continue
             else:
-                logger.error(f"Could not find Material {current_material}")
+                diagnostics.report(
+                    "Footing",
+                    "Material not found",
+                    footing,
+                    current_material,
+                    level="ERROR",
+                )
                 continue
 
         if current_quantity is None:
-            logger.error(f"Failed to get volume for footing {footing.Name}. Skipping.")
+            diagnostics.report("Footing", "No volume", footing, None, level="ERROR")
             missing_elements.append(footing.id())
             continue
 
-        material_ec_perkg, material_density = current_material_ec
+        # The concrete volume excludes the reinforcement
+        row = table.add_element(footing, "Footing", rebar_volume=rebar_vol)
+        table.add_line(row, current_material, current_quantity - rebar_vol)
+
+    return table, missing_elements, matched_materials
+
+
+# Worker processes for the category calculators, 1 runs them in this process
+CALCULATOR_WORKERS = int(os.environ.get("CALCULATOR_WORKERS", 1))
+# Elements per calculator run, so large categories are spread over the workers
+CALCULATOR_SHARD_SIZE = int(os.environ.get("CALCULATOR_SHARD_SIZE", 2000))
+
+# Category calculators in report order: IFC type, breakdown label, summary key
+CATEGORIES = [
+    ("IfcColumn", "Column", "Columns", calculate_columns),
+    ("IfcBeam", "Beam", "Beam", calculate_beams),
+    ("IfcSlab", "Slab", "Slabs", calculate_slabs),
+    ("IfcWall", "Wall", "Walls", calculate_walls),
+    ("IfcWindow", "Window", "Windows", calculate_windows),
+    ("IfcDoor", "Door", "Doors", calculate_doors),
+    ("IfcRoof", "Roof", "Roofs", calculate_roofs),
+    ("IfcStairFlight", "Stair", "Stairs", calculate_stairs),
+    ("IfcRailing", "Railing", "Railings", calculate_railings),
+    ("IfcMember", "Member", "Members", calculate_members),
+    ("IfcPlate", "Plate", "Plates", calculate_plates),
+    ("IfcPile", "Pile", "Piles", calculate_piles),
+    ("IfcFooting", "Footing", "Footings", calculate_footings),
+]
+
+# Categories that are always recalculated: roofs are computed from their slabs
+UNCACHED_TYPES = {"IfcRoof"}
+
+# Bump when the calculators change the results they produce for an element
+ELEMENT_RESULTS_VERSION = 3
+
+
+def element_cache_context():
+    """Return a key of the job settings that element results depend on"""
+    key = json.dumps(
+        [ELEMENT_RESULTS_VERSION, MATERIAL_REAPLCE, MaterialList],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def element_fingerprints(index, parts, geometry_results):
+    """Return {element id: (GlobalId, fingerprint)} of the elements that can be cached"""
+    if not element_cache.ELEMENT_CACHE_ENABLED:
+        return {}
+    elements = [
+        element
+        for ifc_type, _, elements in parts
+        if ifc_type not in UNCACHED_TYPES
+        for element in elements
+    ]
+    # GlobalIds shared by several elements can't be told apart in the cache
+    global_ids = Counter(element.GlobalId for element in elements)
+    return {
+        element.id(): (
+            element.GlobalId,
+            index.fingerprint(element, geometry_results.get(element.id())),
+        )
+        for element in elements
+        if global_ids[element.GlobalId] == 1
+    }
 
-        if rebar_set == None:
-            current_ec = material_ec_perkg * material_density * current_quantity
-            material_breakdown.append(
-                {
-                    "material": current_material,
-                    "material_mass": material_density * current_quantity,
-                    "ec": current_ec,
-                }
-            )
 
+def split_element_results(elements, table, missing_mats, matched_mats, issues):
+    """Split the output of a calculator run into a record per element.
+
+    Records hold the element's takeoff rows, its missing and matched
+    material entries without its element id and the issues reported for it,
+    so they can be reused for the same element in another version of the
+    model.
+    """
+    records = {
+        element.id(): {"takeoffs": [], "missing": [], "matched": [], "issues": []}
+        for element in elements
+    }
+    for element_id, element_issues in issues.element_issues().items():
+        if element_id in records:
+            records[element_id]["issues"] = element_issues
+    for row, takeoff in enumerate(table.takeoffs()):
+        records[table.element_ids[row]]["takeoffs"].append(takeoff)
+
+    for entry in missing_mats:
+        if isinstance(entry, tuple):
+            records[entry[0]]["missing"].append(["tuple", *entry[1:]])
+        elif isinstance(entry, dict):
+            rest = {k: v for k, v in entry.items() if k != "element_id"}
+            records[entry["element_id"]]["missing"].append(["dict", rest])
         else:
-            rebar_vol = top_vol + bottom_vol + side_vol + stirrups_vol
-            # print(rebar_vol)
-            current_ec = (
-                material_ec_perkg * material_density * (current_quantity - rebar_vol)
-            )
-            rebar_ec = rebar_vol * 2.510 * 7850
-            material_breakdown.append(
-                {
-                    "material": current_material,
-                    "material_mass": material_density * (current_quantity - rebar_vol),
-                    "ec": current_ec,
-                }
-            )
-            material_breakdown.append(
-                {"material": "Rebar", "material_mass": rebar_vol * 7850, "ec": rebar_ec}
-            )
-            logger.debug(f"EC for {footing.Name}'s rebars is {rebar_ec}")
-            total_ec += rebar_ec
+            records[entry]["missing"].append(["id"])
+
+    for entry in matched_mats:
+        rest = {k: v for k, v in entry.items() if k != "element_id"}
+        records[entry["element_id"]]["matched"].append(rest)
+    return records
+
+
+def _entry_element_id(entry):
+    """Return the element id of a missing material entry"""
+    if isinstance(entry, tuple):
+        return entry[0]
+    if isinstance(entry, dict):
+        return entry["element_id"]
+    return entry
+
+
+def select_element_results(elements, *results):
+    """Return the results of elements from calculator runs, in element order.
+
+    results are (table, missing, matched) of runs over disjoint sets of
+    elements; what they hold for other elements is left out.
+    """
+    table = ec_table.ECTable()
+    rows = defaultdict(list)
+    missing_by_element = defaultdict(list)
+    matched_by_element = defaultdict(list)
+    for part_table, missing_mats, matched_mats in results:
+        for row, element_id in enumerate(part_table.element_ids, len(table)):
+            rows[element_id].append(row)
+        table.extend(part_table)
+        for entry in missing_mats:
+            missing_by_element[_entry_element_id(entry)].append(entry)
+        for entry in matched_mats:
+            matched_by_element[entry["element_id"]].append(entry)
+
+    element_ids = [element.id() for element in elements]
+    return (
+        table.take([row for element_id in element_ids for row in rows[element_id]]),
+        [
+            entry
+            for element_id in element_ids
+            for entry in missing_by_element[element_id]
+        ],
+        [
+            entry
+            for element_id in element_ids
+            for entry in matched_by_element[element_id]
+        ],
+    )
+
+
+def calculate_part(calculator, elements, index, substructure_ids):
+    """Run a category calculator on some of its elements.
 
-        footing_elements.append(
-            {"element": "Footing", "ec": current_ec, "materials": material_breakdown}
+    Issues are collected apart and returned with the result. With material
+    replacement on, the similarity searches the calculator needs are only
+    recorded and find no match; once match_materials has answered the queries
+    of every part in one batch, calculate_deferred calculates the elements
+    whose searches found a match again.
+    Returns (table, missing, matched, issues, queries).
+    """
+    issues_collected = diagnostics.current()
+    issues = diagnostics.collect(track_elements=True)
+    queries = calculator_utils.collect_material_queries() if MATERIAL_REAPLCE else []
+    result = calculator(elements, index=index, table=ec_table.ECTable(substructure_ids))
+    diagnostics.resume(issues_collected)
+    return (*result, issues, queries)
+
+
+def calculate_deferred(
+    calculator, elements, result, issues, queries, index, substructure_ids
+):
+    """Calculate the elements whose searches calculate_part deferred and
+    found a match in material_matches again, and replace their results and
+    issues. The others keep those of calculate_part, which found no match."""
+    deferred = {element_data["element_id"] for element_data in queries}
+    matched = {
+        element_data["element_id"]
+        for element_data in queries
+        if calculator_utils.has_material_match(element_data)
+    }
+    if deferred:
+        logger.info(
+            f"Calculating {len(matched)} of {len(deferred)} elements with "
+            f"material searches again, with their matched materials"
         )
-        logger.debug(f"EC for {footing.Name} is {current_ec}")
-        total_ec += current_ec
-        for material_item in material_breakdown:
-            excel_data.append(
-                [
-                    footing.id(),  # Element ID
-                    footing.is_a(),  # IFC Type
-                    "Footing",  # Element Type
-                    material_item["material"],  # Material
-                    material_item["ec"],  # Material EC
-                    material_item["material_mass"],  # Total Element EC
-                    "kg",
-                ]
-            )
+    if not matched:
+        return result
+    again, kept = element_index.partition(elements, matched)
+    issues.forget(matched)
+    issues_collected = diagnostics.current()
+    diagnostics.resume(issues)
+    again_result = calculator(
+        again, index=index, table=ec_table.ECTable(substructure_ids)
+    )
+    diagnostics.resume(issues_collected)
+    return select_element_results(
+        elements, select_element_results(kept, result), again_result
+    )
+
+
+def add_element_results(element, record, table, missing_mats, matched_mats):
+    """Add a record made by split_element_results for the given element"""
+    for takeoff in record["takeoffs"]:
+        table.add_takeoff(element, takeoff)
+
+    for kind, *rest in record["missing"]:
+        if kind == "tuple":
+            missing_mats.append((element.id(), *rest))
+        elif kind == "dict":
+            missing_mats.append({"element_id": element.id(), **rest[0]})
+        else:
+            missing_mats.append(element.id())
 
-    logger.debug(f"Total EC for footings is {total_ec}")
+    for rest in record["matched"]:
+        matched_mats.append({"element_id": element.id(), **rest})
 
-    # Updated return statement to include matched_materials
-    return total_ec, footing_elements, missing_elements, excel_data, matched_materials
 
+# Model and index of a worker process, set up by _init_worker
+_worker_model = None
+_worker_index = None
 
-from collections import defaultdict
+
+def _init_worker(path, material_list, material_replace, geometry_results):
+    """Parse the model and restore the job settings in a worker process"""
+    global MATERIAL_REAPLCE, MaterialList, _worker_model, _worker_index
+
+    MATERIAL_REAPLCE = material_replace
+    MaterialList = calculator_utils.MaterialList = material_list
+
+    _worker_model = ifcopenshell.open(path)
+    _worker_index = element_index.ElementIndex(_worker_model)
+    geometry.preload(_worker_model, geometry_results)
+
+
+def _calculate_part(ifc_type, element_ids, substructure_ids):
+    """Run a category calculator on some of its elements in a worker process"""
+    calculator = next(c for t, _, _, c in CATEGORIES if t == ifc_type)
+    elements = [_worker_model.by_id(element_id) for element_id in element_ids]
+    # The parent applies the database additions, so workers don't overwrite
+    # each other's uploads
+    additions = calculator_utils.defer_material_additions()
+    table, missing_mats, matched_mats, issues, queries = calculate_part(
+        calculator, elements, _worker_index, substructure_ids
+    )
+    return table, missing_mats, matched_mats, additions, issues, queries
+
+
+def calculate_parts_in_pool(parts, path, substructure_ids, geometry_results, workers):
+    """Run category calculator parts in worker processes.
+
+    Each worker parses its own copy of the model at path; the geometry
+    computed by the parent is handed over. Returns (table, missing, matched,
+    issues, queries) of calculate_part per part in the order of parts,
+    whatever order they finish in.
+    """
+    logger.info(f"Running {len(parts)} calculator parts in {workers} processes")
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(parts)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(
+            path,
+            MaterialList,
+            MATERIAL_REAPLCE,
+            geometry_results,
+        ),
+    ) as pool:
+        # Largest parts first so a big category doesn't start last
+        futures = {}
+        for i in sorted(range(len(parts)), key=lambda i: -len(parts[i][2])):
+            ifc_type, _, elements = parts[i]
+            futures[i] = pool.submit(
+                _calculate_part,
+                ifc_type,
+                [e.id() for e in elements],
+                [e.id() for e in elements if e.id() in substructure_ids],
+            )
+
+        results = []
+        for i in range(len(parts)):
+            *result, additions, issues, queries = futures[i].result()
+            for element_data in additions:
+                calculator_utils.add_material_to_database(element_data)
+            results.append((*result, issues, queries))
+    return results
 
 
 def calculate_embodied_carbon(
-    filepath, enable_ai_material_matcher=False, with_breakdown=False
+    filepath,
+    enable_ai_material_matcher=False,
+    with_breakdown=False,
+    workers=None,
+    with_takeoff=False,
 ):
+    """Calculate the embodied carbon of a model.
+
+    filepath may be a path or an already parsed ifcopenshell model; pass the
+    model when the caller also needs it for other steps (e.g. calculate_gfa)
+    so the file is only parsed once.
 
+    With more than one worker (CALCULATOR_WORKERS by default) the category
+    calculators run in a process pool, on shards of at most
+    CALCULATOR_SHARD_SIZE elements; this needs a model opened from a path.
+
+    With with_takeoff, returns (result, takeoff); the takeoff can be stored
+    with ec_table.save_takeoff and recalculated with recalculate_embodied_carbon.
+    """
     global MATERIAL_REAPLCE
     global MaterialList
 
     MATERIAL_REAPLCE = enable_ai_material_matcher
 
     MaterialList = calculator_utils.refresh_materials_list()
-    slabs_to_ignore = []
+    issues = diagnostics.collect()
     all_missing_materials = defaultdict(list)
-    all_excel_data = []
-    total_ec = columns_ec = beams_ec = slabs_ec = walls_ec = windows_ec = roofs_ec = (
-        doors_ec
-    ) = stairs_ec = railings_ec = members_ec = plates_ec = piles_ec = footings_ec = 0
-    ec_by_elements = {}
     all_matched_materials = defaultdict(list)
-    # Create data structure for EC breakdown
-    ec_data = {
-        "total_ec": 0,
-        "ec_breakdown": [
-            {"category": "Substructure", "total_ec": 0, "elements": []},
-            {"category": "Superstructure", "total_ec": 0, "elements": []},
-        ],
-    }
-
-    ifc_file = ifcopenshell.open(filepath)
 
-    # Get elements by level
-    substructure_elements = calculator_utils.get_substructure_elements(filepath)
+    ifc_file = calculator_utils.open_ifc(filepath)
+    index = element_index.get_model_index(ifc_file)
 
-    # Create sets for quick lookup
-    substructure_ids = {elem.id() for elem in substructure_elements}
+    # Ids of the elements on substructure levels, from the spatial index
+    substructure_ids = index.substructure_ids()
+    logger.info(f"Total elements found in substructure levels: {len(substructure_ids)}")
 
     # Get all elements from the model
     columns = ifc_file.by_type("IfcColumn")
@@ -3584,526 +2800,258 @@ def calculate_embodied_carbon(
     # logger.info(f"Total piles found {len(piles)}")
     # logger.info(f"Total footings found {len(footings)}")
 
-    # Identify which slabs to ignore (those part of roofs)
-    if roofs:
-        for roof in roofs:
-            if hasattr(roof, "IsDecomposedBy"):
-                for rel in roof.IsDecomposedBy:
-                    if rel.is_a("IfcRelAggregates"):
-                        for part in rel.RelatedObjects:
-                            if part.is_a("IfcSlab"):
-                                slabs_to_ignore.append(part.id())
-
-    # Split elements into substructure and superstructure based on ID
-    # Columns
-    if columns:
-        substructure_columns = [c for c in columns if c.id() in substructure_ids]
-        superstructure_columns = [c for c in columns if c.id() not in substructure_ids]
-        if substructure_columns:
-            (
-                sub_columns_ec,
-                sub_columns_elements,
-                missing_mats,
-                columns_excel_data,
-                matched_mats,
-            ) = calculate_columns(substructure_columns)
-            all_excel_data.extend(columns_excel_data)
-            all_missing_materials["IfcColumn"].extend(missing_mats)
-            ec_data["ec_breakdown"][0]["elements"].extend(sub_columns_elements)
-            all_matched_materials["IfcColumn"].extend(
-                matched_mats
-            )  # Add matched materials
-            ec_data["ec_breakdown"][0]["total_ec"] += sub_columns_ec
-            columns_ec += sub_columns_ec
-
-        if superstructure_columns:
-            (
-                super_columns_ec,
-                super_columns_elements,
-                missing_mats,
-                columns_excel_data,
-                matched_mats,
-            ) = calculate_columns(superstructure_columns)
-            all_missing_materials["IfcColumn"].extend(missing_mats)
-            all_excel_data.extend(columns_excel_data)
-            all_matched_materials["IfcColumn"].extend(
-                matched_mats
-            )  # Add matched materials
-            ec_data["ec_breakdown"][1]["elements"].extend(super_columns_elements)
-            ec_data["ec_breakdown"][1]["total_ec"] += super_columns_ec
-            columns_ec += super_columns_ec
-        ec_by_elements["Columns"] = columns_ec
-    # Beams
-    if beams:
-        substructure_beams = [b for b in beams if b.id() in substructure_ids]
-        superstructure_beams = [b for b in beams if b.id() not in substructure_ids]
-        all_missing_materials["IfcBeam"] = []
-
-        if substructure_beams:
-            (
-                sub_beams_ec,
-                sub_beams_elements,
-                missing_mats,
-                beam_excel_data,
-                matched_mats,
-            ) = calculate_beams(substructure_beams)
-            all_missing_materials["IfcBeam"].extend(missing_mats)
-            all_excel_data.extend(beam_excel_data)
-            all_matched_materials["IfcBeam"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][0]["elements"].extend(sub_beams_elements)
-            ec_data["ec_breakdown"][0]["total_ec"] += sub_beams_ec
-            beams_ec += sub_beams_ec
-
-        if superstructure_beams:
-            (
-                super_beams_ec,
-                super_beams_elements,
-                missing_mats,
-                beam_excel_data,
-                matched_mats,
-            ) = calculate_beams(superstructure_beams)
-            all_missing_materials["IfcBeam"].extend(missing_mats)
-            all_excel_data.extend(beam_excel_data)
-            all_matched_materials["IfcBeam"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][1]["elements"].extend(super_beams_elements)
-            ec_data["ec_breakdown"][1]["total_ec"] += super_beams_ec
-            beams_ec += super_beams_ec
-        ec_by_elements["Beam"] = beams_ec
-
-    # Slabs
-    if slabs:
-        valid_slabs = [s for s in slabs if s.id() not in slabs_to_ignore]
-        substructure_slabs = [s for s in valid_slabs if s.id() in substructure_ids]
-        superstructure_slabs = [
-            s for s in valid_slabs if s.id() not in substructure_ids
-        ]
-        all_missing_materials["IfcSlab"] = []
-        if substructure_slabs:
-            (
-                sub_slabs_ec,
-                sub_slabs_elements,
-                missing_mats,
-                slab_excel_data,
-                matched_mats,
-            ) = calculate_slabs(substructure_slabs)
-            all_missing_materials["IfcSlab"].extend(missing_mats)
-            all_excel_data.extend(slab_excel_data)
-            all_matched_materials["IfcSlab"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][0]["elements"].extend(sub_slabs_elements)
-            ec_data["ec_breakdown"][0]["total_ec"] += sub_slabs_ec
-            slabs_ec += sub_slabs_ec
-
-        if superstructure_slabs:
-            (
-                super_slabs_ec,
-                super_slabs_elements,
-                missing_mats,
-                slab_excel_data,
-                matched_mats,
-            ) = calculate_slabs(superstructure_slabs)
-            all_missing_materials["IfcSlab"].extend(missing_mats)
-            all_excel_data.extend(slab_excel_data)
-            all_matched_materials["IfcSlab"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][1]["elements"].extend(super_slabs_elements)
-            ec_data["ec_breakdown"][1]["total_ec"] += super_slabs_ec
-            slabs_ec += super_slabs_ec
-        ec_by_elements["Slabs"] = slabs_ec
-
-    # Walls
-    if walls:
-        substructure_walls = [w for w in walls if w.id() in substructure_ids]
-        superstructure_walls = [w for w in walls if w.id() not in substructure_ids]
-        all_missing_materials["IfcWall"] = []
-        if substructure_walls:
-            (
-                sub_walls_ec,
-                sub_walls_elements,
-                missing_mats,
-                wall_excel_data,
-                matched_mats,
-            ) = calculate_walls(substructure_walls)
-            all_missing_materials["IfcWall"].extend(missing_mats)
-            all_excel_data.extend(wall_excel_data)
-            all_matched_materials["IfcWall"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][0]["elements"].extend(sub_walls_elements)
-            ec_data["ec_breakdown"][0]["total_ec"] += sub_walls_ec
-            walls_ec += sub_walls_ec
-
-        if superstructure_walls:
-            (
-                super_walls_ec,
-                super_walls_elements,
-                missing_mats,
-                wall_excel_data,
-                matched_mats,
-            ) = calculate_walls(superstructure_walls)
-            all_missing_materials["IfcWall"].extend(missing_mats)
-            all_excel_data.extend(wall_excel_data)
-            all_matched_materials["IfcWall"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][1]["elements"].extend(super_walls_elements)
-            ec_data["ec_breakdown"][1]["total_ec"] += super_walls_ec
-            walls_ec += super_walls_ec
-        ec_by_elements["Walls"] = walls_ec
-
-    # Windows - can be in both, so check against substructure IDs
-    if windows:
-        substructure_windows = [w for w in windows if w.id() in substructure_ids]
-        superstructure_windows = [w for w in windows if w.id() not in substructure_ids]
-        all_missing_materials["IfcWindow"] = []
-        if substructure_windows:
-            sub_windows_ec, sub_windows_elements, missing_mats, window_excel_data = (
-                calculate_windows(substructure_windows)
-            )
-            all_missing_materials["IfcWindow"].extend(missing_mats)
-            all_excel_data.extend(window_excel_data)
-            ec_data["ec_breakdown"][0]["elements"].extend(sub_windows_elements)
-            ec_data["ec_breakdown"][0]["total_ec"] += sub_windows_ec
-            windows_ec += sub_windows_ec
+    # Tessellate every element that will need a geometric fallback in one batch
+    geometry_results = geometry.prefetch(
+        ifc_file,
+        collect_geometry_fallbacks(
+            index, [*slabs, *walls, *stairs, *railings, *members, *plates]
+        ),
+        content_hash=getattr(ifc_file, "content_hash", None),
+    )
 
-        if superstructure_windows:
-            (
-                super_windows_ec,
-                super_windows_elements,
-                missing_mats,
-                window_excel_data,
-            ) = calculate_windows(superstructure_windows)
-            all_missing_materials["IfcWindow"].extend(missing_mats)
-            all_excel_data.extend(window_excel_data)
-            ec_data["ec_breakdown"][1]["elements"].extend(super_windows_elements)
-            ec_data["ec_breakdown"][1]["total_ec"] += super_windows_ec
-            windows_ec += super_windows_ec
-
-        total_ec += windows_ec
-        ec_by_elements["Windows"] = windows_ec
-
-    # Doors - can be in both, so check against substructure IDs
-    if doors:
-        substructure_doors = [d for d in doors if d.id() in substructure_ids]
-        superstructure_doors = [d for d in doors if d.id() not in substructure_ids]
-        all_missing_materials["IfcDoor"] = []
-        if substructure_doors:
-            sub_doors_ec, sub_doors_elements, missing_mats, door_excel_data = (
-                calculate_doors(substructure_doors)
-            )
-            all_missing_materials["IfcDoor"].extend(missing_mats)
-            all_excel_data.extend(door_excel_data)
-            ec_data["ec_breakdown"][0]["elements"].extend(sub_doors_elements)
-            ec_data["ec_breakdown"][0]["total_ec"] += sub_doors_ec
-            doors_ec += sub_doors_ec
-
-        if superstructure_doors:
-            super_doors_ec, super_doors_elements, missing_mats, door_excel_data = (
-                calculate_doors(superstructure_doors)
-            )
-            all_missing_materials["IfcDoor"].extend(missing_mats)
-            all_excel_data.extend(door_excel_data)
-
-            ec_data["ec_breakdown"][1]["elements"].extend(super_doors_elements)
-            ec_data["ec_breakdown"][1]["total_ec"] += super_doors_ec
-            doors_ec += super_doors_ec
-        ec_by_elements["Doors"] = doors_ec
-
-    # Roofs are always in superstructure
-    if roofs:
-        roofs_ec, roofs_elements, missing_mats, roof_excel_data, matched_mats = (
-            calculate_roofs(roofs)
+    elements_by_type = {
+        "IfcColumn": columns,
+        "IfcBeam": beams,
+        "IfcSlab": slabs,
+        "IfcWall": walls,
+        "IfcWindow": windows,
+        "IfcDoor": doors,
+        "IfcRoof": roofs,
+        "IfcStairFlight": stairs,
+        "IfcRailing": railings,
+        "IfcMember": members,
+        "IfcPlate": plates,
+        "IfcPile": piles,
+        "IfcFooting": footings,
+    }
+    categories = [
+        (ifc_type, label, summary_key, calculator, elements_by_type[ifc_type])
+        for ifc_type, label, summary_key, calculator in CATEGORIES
+    ]
+
+    # Calculator runs in report and element order: (IFC type, calculator, elements)
+    parts = []
+    for ifc_type, _, _, calculator, elements in categories:
+        if not elements:
+            continue
+        all_missing_materials[ifc_type] = []
+
+        if ifc_type == "IfcRoof":
+            # Roofs are always in superstructure
+            split = [elements]
+        else:
+            if ifc_type == "IfcSlab":
+                # Slabs that are part of a roof are calculated with the roof
+                _, elements = element_index.partition(elements, index.roof_parts)
+            # Split elements into substructure and superstructure based on ID
+            split = element_index.partition(elements, substructure_ids)
+
+        for part in split:
+            for start in range(0, len(part), CALCULATOR_SHARD_SIZE):
+                shard = part[start : start + CALCULATOR_SHARD_SIZE]
+                parts.append((ifc_type, calculator, shard))
+
+    # Elements unchanged since an earlier run (e.g. the previous version of
+    # the model) reuse its results, only added or changed ones are calculated
+    cache_context = element_cache_context()
+    fingerprints = element_fingerprints(index, parts, geometry_results)
+    cached = element_cache.load(cache_context, dict(fingerprints.values()))
+    reused = {
+        element_id
+        for element_id, (global_id, _) in fingerprints.items()
+        if global_id in cached
+    }
+    runs = [
+        (ifc_type, calculator, [e for e in elements if e.id() not in reused])
+        for ifc_type, calculator, elements in parts
+    ]
+    pending = [run for run in runs if run[2]]
+    logger.info(
+        f"Reusing the results of {len(reused)} unchanged elements, calculating "
+        f"{sum(len(elements) for _, _, elements in pending)}"
+    )
+
+    calculator_utils.material_matches = {}
+    if workers is None:
+        workers = CALCULATOR_WORKERS
+    path = getattr(ifc_file, "source_path", None)
+    if workers > 1 and len(pending) > 1 and path:
+        results = calculate_parts_in_pool(
+            pending, path, substructure_ids, geometry_results, workers
         )
-        all_missing_materials["IfcRoof"] = missing_mats
-        ec_data["ec_breakdown"][1]["elements"].extend(roofs_elements)
-        all_excel_data.extend(roof_excel_data)
-        all_matched_materials["IfcRoof"].extend(matched_mats)
-        ec_data["ec_breakdown"][1]["total_ec"] += roofs_ec
-        total_ec += roofs_ec
-        ec_by_elements["Roofs"] = roofs_ec
-
-    # Stairs
-    if stairs:
-        substructure_stairs = [s for s in stairs if s.id() in substructure_ids]
-        superstructure_stairs = [s for s in stairs if s.id() not in substructure_ids]
-        all_missing_materials["IfcStairFlight"] = []
-        if substructure_stairs:
-            (
-                sub_stairs_ec,
-                sub_stairs_elements,
-                missing_mats,
-                stair_excel_data,
-                matched_mats,
-            ) = calculate_stairs(substructure_stairs)
-            all_missing_materials["IfcStairFlight"].extend(missing_mats)
-            ec_data["ec_breakdown"][0]["elements"].extend(sub_stairs_elements)
-            all_excel_data.extend(stair_excel_data)
-            all_matched_materials["IfcStairFlight"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][0]["total_ec"] += sub_stairs_ec
-            stairs_ec += sub_stairs_ec
-
-        if superstructure_stairs:
-            (
-                super_stairs_ec,
-                super_stairs_elements,
-                missing_mats,
-                stair_excel_data,
-                matched_mats,
-            ) = calculate_stairs(superstructure_stairs)
-            all_missing_materials["IfcStairFlight"].extend(missing_mats)
-            ec_data["ec_breakdown"][1]["elements"].extend(super_stairs_elements)
-            all_excel_data.extend(stair_excel_data)
-            all_matched_materials["IfcStairFlight"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][1]["total_ec"] += super_stairs_ec
-            stairs_ec += super_stairs_ec
-        ec_by_elements["Stairs"] = stairs_ec
-
-    # Railings
-    if railings:
-        substructure_railings = [r for r in railings if r.id() in substructure_ids]
-        superstructure_railings = [
-            r for r in railings if r.id() not in substructure_ids
+    else:
+        if workers > 1 and not path:
+            logger.warning("Model wasn't opened from a file, calculating serially")
+        results = [
+            calculate_part(calculator, elements, index, substructure_ids)
+            for _, calculator, elements in pending
         ]
-        all_missing_materials["IfcRailing"] = []
-        if substructure_railings:
-            sub_railings_ec, sub_railings_elements, missing_mats, railing_excel_data = (
-                calculate_railings(substructure_railings)
-            )
-            all_missing_materials["IfcRailing"].extend(missing_mats)
-            ec_data["ec_breakdown"][0]["elements"].extend(sub_railings_elements)
-            all_excel_data.extend(railing_excel_data)
-            ec_data["ec_breakdown"][0]["total_ec"] += sub_railings_ec
-            railings_ec += sub_railings_ec
 
-        if superstructure_railings:
-            (
-                super_railings_ec,
-                super_railings_elements,
-                missing_mats,
-                railing_excel_data,
-            ) = calculate_railings(superstructure_railings)
-            all_missing_materials["IfcRailing"].extend(missing_mats)
-            ec_data["ec_breakdown"][1]["elements"].extend(super_railings_elements)
-            all_excel_data.extend(railing_excel_data)
-            ec_data["ec_breakdown"][1]["total_ec"] += super_railings_ec
-            railings_ec += super_railings_ec
-        ec_by_elements["Railings"] = railings_ec
-
-    # Members
-    if members:
-        substructure_members = [m for m in members if m.id() in substructure_ids]
-        superstructure_members = [m for m in members if m.id() not in substructure_ids]
-        all_missing_materials["IfcMember"] = []
-
-        if substructure_members:
-            (
-                sub_members_ec,
-                sub_members_elements,
-                missing_mats,
-                member_excel_data,
-                matched_mats,
-            ) = calculate_members(substructure_members)
-            all_missing_materials["IfcMember"].extend(missing_mats)
-            ec_data["ec_breakdown"][0]["elements"].extend(sub_members_elements)
-            all_excel_data.extend(member_excel_data)
-            all_matched_materials["IfcMember"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][0]["total_ec"] += sub_members_ec
-            members_ec += sub_members_ec
-
-        if superstructure_members:
-            (
-                super_members_ec,
-                super_members_elements,
-                missing_mats,
-                member_excel_data,
-                matched_mats,
-            ) = calculate_members(superstructure_members)
-            all_missing_materials["IfcMember"].extend(missing_mats)
-            ec_data["ec_breakdown"][1]["elements"].extend(super_members_elements)
-            all_excel_data.extend(member_excel_data)
-            all_matched_materials["IfcMember"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][1]["total_ec"] += super_members_ec
-            members_ec += super_members_ec
-        ec_by_elements["Members"] = members_ec
-
-    # Plates
-    if plates:
-        substructure_plates = [p for p in plates if p.id() in substructure_ids]
-        superstructure_plates = [p for p in plates if p.id() not in substructure_ids]
-        all_missing_materials["IfcPlate"] = []
-
-        if substructure_plates:
-            (
-                sub_plates_ec,
-                sub_plates_elements,
-                missing_mats,
-                plate_excel_data,
-                matched_mats,
-            ) = calculate_plates(substructure_plates)
-            all_missing_materials["IfcPlate"].extend(missing_mats)
-            ec_data["ec_breakdown"][0]["elements"].extend(sub_plates_elements)
-            all_excel_data.extend(plate_excel_data)
-            all_matched_materials["IfcPlate"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][0]["total_ec"] += sub_plates_ec
-            plates_ec += sub_plates_ec
-
-        if superstructure_plates:
-            (
-                super_plates_ec,
-                super_plates_elements,
-                missing_mats,
-                plate_excel_data,
-                matched_mats,
-            ) = calculate_plates(superstructure_plates)
-            all_missing_materials["IfcPlate"].extend(missing_mats)
-            ec_data["ec_breakdown"][1]["elements"].extend(super_plates_elements)
-            all_excel_data.extend(plate_excel_data)
-            all_matched_materials["IfcPlate"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][1]["total_ec"] += super_plates_ec
-            plates_ec += super_plates_ec
-        ec_by_elements["Plates"] = plates_ec
-
-    # Piles and footings are always in substructure by definition
-    if piles:
-        substructure_piles = [p for p in piles if p.id() in substructure_ids]
-        superstructure_piles = [p for p in piles if p.id() not in substructure_ids]
-        all_missing_materials["IfcPile"] = []
-
-        if substructure_piles:
-            (
-                sub_piles_ec,
-                sub_piles_elements,
-                missing_mats,
-                pile_excel_data,
-                matched_mats,
-            ) = calculate_piles(substructure_piles)
-            all_missing_materials["IfcPile"].extend(missing_mats)
-            ec_data["ec_breakdown"][0]["elements"].extend(sub_piles_elements)
-            all_excel_data.extend(pile_excel_data)
-            all_matched_materials["IfcPile"].extend(
-                matched_mats
-            )  # Add matched materials
-
-            ec_data["ec_breakdown"][0]["total_ec"] += sub_piles_ec
-            piles_ec += sub_piles_ec
-
-        if superstructure_piles:
-            (
-                super_piles_ec,
-                super_piles_elements,
-                missing_mats,
-                pile_excel_data,
-                matched_mats,
-            ) = calculate_piles(superstructure_piles)
-            all_missing_materials["IfcPile"].extend(missing_mats)
-            ec_data["ec_breakdown"][1]["elements"].extend(super_piles_elements)
-            all_excel_data.extend(pile_excel_data)
-            all_matched_materials["IfcPile"].extend(
-                matched_mats
-            )  # Add matched materials
-            ec_data["ec_breakdown"][1]["total_ec"] += super_piles_ec
-            piles_ec += super_piles_ec
-        ec_by_elements["Piles"] = piles_ec
-
-    if footings:
-        substructure_footings = [f for f in footings if f.id() in substructure_ids]
-        superstructure_footings = [f for f in piles if f.id() not in substructure_ids]
-        all_missing_materials["IfcFooting"] = []
-
-        if substructure_footings:
-            (
-                sub_footings_ec,
-                sub_footings_elements,
-                missing_mats,
-                footing_excel_data,
-                matched_mats,
-            ) = calculate_footings(substructure_footings)
-            all_missing_materials["IfcFooting"].extend(missing_mats)
-            ec_data["ec_breakdown"][0]["elements"].extend(sub_footings_elements)
-            all_excel_data.extend(footing_excel_data)
-            all_matched_materials["IfcFooting"].extend(
-                matched_mats
-            )  # Add matched materials
-            ec_data["ec_breakdown"][0]["total_ec"] += sub_footings_ec
-            footings_ec += sub_footings_ec
-
-        if superstructure_footings:
+    if MATERIAL_REAPLCE:
+        # The similarity searches of all parts are encoded and searched in
+        # batches, then only the elements that needed one are calculated again
+        calculator_utils.match_materials(
+            [element_data for *_, queries in results for element_data in queries]
+        )
+    results = iter(
+        [
             (
-                super_footings_ec,
-                super_footings_elements,
-                missing_mats,
-                footing_excel_data,
-                matched_mats,
-            ) = calculate_footings(superstructure_footings)
-            all_missing_materials["IfcFooting"].extend(missing_mats)
-            ec_data["ec_breakdown"][1]["elements"].extend(super_footings_elements)
-            all_excel_data.extend(footing_excel_data)
-            all_matched_materials["IfcFooting"].extend(
-                matched_mats
-            )  # Add matched materials
-            ec_data["ec_breakdown"][1]["total_ec"] += super_footings_ec
-            footings_ec += super_footings_ec
-        ec_by_elements["Footings"] = footings_ec
-    print(all_matched_materials)
-    # Calculate total EC by summing individual categories
-    total_ec = (
-        columns_ec
-        + beams_ec
-        + slabs_ec
-        + walls_ec
-        + windows_ec
-        + doors_ec
-        + stairs_ec
-        + railings_ec
-        + roofs_ec
-        + members_ec
-        + plates_ec
-        + piles_ec
-        + footings_ec
+                *calculate_deferred(
+                    calculator,
+                    elements,
+                    result,
+                    part_issues,
+                    queries,
+                    index,
+                    substructure_ids,
+                ),
+                part_issues,
+            )
+            for (_, calculator, elements), (*result, part_issues, queries) in zip(
+                pending, results
+            )
+        ]
     )
+
+    # The calculators only add materials and quantities to the table, the EC
+    # of every element is computed in one pass once they are all done.
+    # Merged in report order so the output doesn't depend on the worker count.
+    table = ec_table.ECTable(substructure_ids)
+    new_results = {}
+    for (ifc_type, _, elements), (_, _, calculated) in zip(parts, runs):
+        if calculated:
+            part_table, missing_mats, matched_mats, part_issues = next(results)
+            issues.merge(part_issues)
+        else:
+            part_table, missing_mats, matched_mats = ec_table.ECTable(), [], []
+            part_issues = diagnostics.Diagnostics(track_elements=True)
+
+        if not any(element.id() in fingerprints for element in elements):
+            table.extend(part_table)
+            all_missing_materials[ifc_type].extend(missing_mats)
+            if matched_mats:
+                all_matched_materials[ifc_type].extend(matched_mats)
+            continue
+
+        # Interleave reused and new results in element order
+        records = split_element_results(
+            calculated, part_table, missing_mats, matched_mats, part_issues
+        )
+        part_matched = []
+        for element in elements:
+            global_id, fingerprint = fingerprints.get(element.id(), (None, None))
+            if element.id() in reused:
+                record = cached[global_id]
+                # Issues of calculated elements came with part_issues
+                for category, issue, level in record["issues"]:
+                    issues.report(category, issue, element, level=level)
+            else:
+                record = records[element.id()]
+                if fingerprint:
+                    new_results[global_id] = (fingerprint, record)
+            add_element_results(
+                element,
+                record,
+                table,
+                all_missing_materials[ifc_type],
+                part_matched,
+            )
+        if part_matched:
+            all_matched_materials[ifc_type].extend(part_matched)
+    element_cache.store(cache_context, new_results)
+    # Upload the materials the calculators added, once per calculation
+    calculator_utils.flush_material_database()
+    table.assign_storeys(index.element_storey_names)
+
+    takeoff = {
+        "table": table,
+        "missing_materials": all_missing_materials,
+        "matched_materials": all_matched_materials,
+        "element_type_skipped": element_type_skipped,
+        # Those of evaluating the table are added by evaluate_takeoff
+        "diagnostics": issues.summary(),
+    }
+    result = evaluate_takeoff(takeoff, with_breakdown)
+    if with_takeoff:
+        return result, takeoff
+    return result
+
+
+def recalculate_embodied_carbon(takeoff, with_breakdown=False):
+    """Recalculate a stored takeoff against the current materials, without the model.
+
+    Returns None when materials that were missing from the takeoff are now in
+    the material list: their elements were never measured, so the model has
+    to be calculated again.
+    """
+    global MaterialList
+
+    MaterialList = calculator_utils.refresh_materials_list()
+    added = {
+        entry[1]
+        for entries in takeoff["missing_materials"].values()
+        for entry in entries
+        if isinstance(entry, tuple)
+        and len(entry) > 1
+        and isinstance(entry[1], str)
+        and entry[1] in MaterialList
+    }
+    if added:
+        logger.info(
+            f"Missing materials {sorted(added)} are now available, the takeoff can't be reused"
+        )
+        return None
+    return evaluate_takeoff(takeoff, with_breakdown)
+
+
+def evaluate_takeoff(takeoff, with_breakdown=False):
+    """Compute the EC results of a takeoff with the current MaterialList"""
+    table = takeoff["table"]
+    all_missing_materials = takeoff["missing_materials"]
+    all_matched_materials = takeoff["matched_materials"]
+    element_type_skipped = takeoff["element_type_skipped"]
+
+    # Create data structure for EC breakdown
+    ec_data = {
+        "total_ec": 0,
+        "ec_breakdown": [
+            {"category": "Substructure", "total_ec": 0, "elements": []},
+            {"category": "Superstructure", "total_ec": 0, "elements": []},
+        ],
+    }
+
+    # Issues of the run that made the takeoff, and those of evaluating it
+    issues = diagnostics.Diagnostics.from_summary(takeoff.get("diagnostics", []))
+    issues_collected = diagnostics.current()
+    diagnostics.resume(issues)
+    table.evaluate(MaterialList)
+    diagnostics.resume(issues_collected)
+    issues.log_summary()
+    total_ec = table.total_ec()
+    # Every summary comes from the same reduction of the table
+    summaries = table.summarize(categorize_material)
+    substructure_ec, superstructure_ec = summaries["by_building_system"]
     ec_data["total_ec"] = total_ec
+    ec_data["ec_breakdown"][0]["total_ec"] = substructure_ec
+    ec_data["ec_breakdown"][0]["elements"] = table.breakdown(substructure=True)
+    ec_data["ec_breakdown"][1]["total_ec"] = superstructure_ec
+    ec_data["ec_breakdown"][1]["elements"] = table.breakdown(substructure=False)
+    all_excel_data = table.excel_rows()
+
+    # Every category the model has elements of, including those without EC
+    ec_by_category = summaries["by_category"]
+    ec_by_elements = {
+        summary_key: ec_by_category.get(label, 0)
+        for ifc_type, label, summary_key, _ in CATEGORIES
+        if ifc_type in all_missing_materials
+    }
     logger.info(f"Total EC calculated: {total_ec}")
-    logger.info(
-        f"Breakdown:\n {columns_ec=}\n {beams_ec=}\n {slabs_ec=}\n\
-{walls_ec=}\n {windows_ec=}\n {doors_ec=}\n {stairs_ec=} \n \
-{railings_ec=}\n {roofs_ec=}\n {members_ec=}\n {plates_ec=}\n \
-{piles_ec=}\n {footings_ec=}"
-    )
+
     ec_by_building_system = {}
-    ec_by_building_system["substructure_ec"] = ec_data["ec_breakdown"][0]["total_ec"]
-    ec_by_building_system["superstructure_ec"] = ec_data["ec_breakdown"][1]["total_ec"]
+    ec_by_building_system["substructure_ec"] = substructure_ec
+    ec_by_building_system["superstructure_ec"] = superstructure_ec
     logger.info(
-        f"Breakdown by category: Substructure EC: {ec_data['ec_breakdown'][0]['total_ec']}, Superstructure EC: {ec_data['ec_breakdown'][1]['total_ec']}"
+        f"Breakdown by category: Substructure EC: {substructure_ec}, Superstructure EC: {superstructure_ec}"
     )
     ec_data["missing_materials"] = all_missing_materials
 
@@ -4111,18 +3059,29 @@ def calculate_embodied_carbon(
         all_missing_materials=all_missing_materials,
         all_matched_materials=all_matched_materials,
     )
-    print("CLEANED THE MISSING MATERIALS")
+    missing_counts = {
+        ifc_type: len(entries) for ifc_type, entries in all_missing_materials.items()
+    }
     logger.info(
-        f"Elements with missing/unknown materials/missing volume: {all_missing_materials}"
+        f"Elements with missing/unknown materials/missing volume: {missing_counts}"
     )
     ec_data["element_type_skipped"] = element_type_skipped
-    logger.info(f"Elements skippsed: {element_type_skipped}")
+    logger.info(f"Elements skipped: {len(element_type_skipped)}")
+    # Issues of the elements, counted per category
+    ec_data["diagnostics"] = issues.summary()
     # print(ec_data)
     logger.info(f"Breakdown by elements: {ec_by_elements}")
 
-    ec_by_materials = get_ec_by_material_category(ec_data)
+    ec_by_materials = summaries["by_material"]
     logger.info(f"Breakdown by materials: {ec_by_materials}\n")
 
+    # EC and mass by storey, category, IFC type and material family
+    ec_data["ec_cube"] = summaries["cube"]
+    # Number of breakdown entries of each material
+    ec_data["material_counts"] = summaries["material_counts"]
+    # Version of the material catalog the EC factors were taken from
+    ec_data["material_catalog_version"] = calculator_utils.MaterialCatalogVersion
+
     summary = {}
     summary["by_building_system"] = ec_by_building_system
     summary["by_material"] = ec_by_materials
@@ -4135,6 +3094,14 @@ def calculate_embodied_carbon(
 
 
 def categorize_material(material_name):
+    """Return the family of a material, "Others" for a material without a name"""
+    if not material_name:
+        return "Others"
+    return _categorize_material(material_name)
+
+
+@lru_cache(maxsize=None)
+def _categorize_material(material_name):
     material_name = material_name.lower()
     if "concrete" in material_name:
         return "Concrete"
@@ -4158,26 +3125,9 @@ def categorize_material(material_name):
         return "Others"
 
 
-def get_ec_by_material_category(breakdowns):
-    ec_by_material = {}
-
-    for category in breakdowns.get("ec_breakdown", []):
-        for element in category.get("elements", []):
-            for material in element.get("materials", []):
-                material_name = material.get("material", "")
-                ec = material.get("ec", 0)
-                material_category = categorize_material(material_name)
-
-                if material_category not in ec_by_material:
-                    ec_by_material[material_category] = 0
-                ec_by_material[material_category] += ec
-
-    return ec_by_material
-
-
 def calculate_gfa(filepath):
-
-    ifc_file = ifcopenshell.open(filepath)
+    """Sum the GrossFloorArea of all spaces. Accepts a file path or a parsed model"""
+    ifc_file = calculator_utils.open_ifc(filepath)
     spaces = ifc_file.by_type("IfcSpace")
     logger.info(f"Total spaces found {len(spaces)}")
 
@@ -4186,11 +3136,12 @@ def calculate_gfa(filepath):
         return 0
 
     total_area = 0
+    index = element_index.get_model_index(ifc_file)
 
     for space in spaces:
         # Get the area from quantities
         # total_area += calculator_utils.get_element_area(space)
-        psets = get_psets(space)
+        psets = index.get_psets(space)
         qto = psets.get("Qto_SpaceBaseQuantities")
         if not qto:
             logger.error(
@@ -4218,12 +3169,13 @@ if __name__ == "__main__":
         logger.error(f"File not found: {ifcpath}")
         sys.exit(1)
 
+    ifc_file = calculator_utils.open_ifc(ifcpath)
     total_ec, ec_data, summary, excel_data, all_matched_materials = (
         calculate_embodied_carbon(
-            ifcpath, enable_ai_material_matcher=True, with_breakdown=True
+            ifc_file, enable_ai_material_matcher=True, with_breakdown=True
         )
     )
-    total_gfa = calculate_gfa(ifcpath)
+    total_gfa = calculate_gfa(ifc_file)
     print(summary)
 
     if total_gfa > 0:
@@ -1,17 +1,21 @@
 import ifcopenshell
 import numpy as np
-from numpy import abs as np_abs
-from ifcopenshell.util.element import get_psets
 from loguru import logger
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import os
 import pandas as pd
-from pprint import pprint
 from pymongo import MongoClient
 import boto3
 import dotenv
+import hashlib
 import io
+import json
+import time
+
+from . import element_index
+from . import embedding_cache
+from . import geometry
+from .material_store import MaterialStore
 
 dotenv.load_dotenv()
 
@@ -26,9 +30,37 @@ MaterialList = {}
 _db_client = None
 _db = None
 
+# The material catalog is kept in memory between jobs and only reloaded when
+# the version counter in catalog_versions changes (the API bumps it on every
+# material upload/delete), or once it is older than this many seconds in case
+# the collection was edited without bumping the counter
+MATERIAL_CATALOG_MAX_AGE = float(os.environ.get("MATERIAL_CATALOG_MAX_AGE", 3600))
+# Version of the catalog in MaterialList, None until it is loaded
+MaterialCatalogVersion = None
+_catalog_loaded_at = None
+
 # File paths for material database
 MATERIAL_CSV_S3_PATH = f"material_database.csv"
 EMBEDDING_NPY_S3_PATH = f"material_embeddings.npy"
+# Points to the CSV and embeddings of the current database version. The
+# fixed paths above are only read while no version has been published: a
+# bucket from before versions were published is loaded from them, and the
+# first flush publishes that database with the added materials as its first
+# version. The fixed files are left in place but no longer updated.
+MATERIAL_MANIFEST_S3_PATH = "material_database.json"
+MATERIAL_VERSIONS_S3_PREFIX = "material_database"
+# Times a flush rebases its materials on versions published by other jobs
+# while it was uploading before giving up until the next flush
+MATERIAL_FLUSH_ATTEMPTS = int(os.environ.get("MATERIAL_FLUSH_ATTEMPTS", 3))
+
+# Materials added to the database are uploaded once this many are pending,
+# or once the oldest has been pending this many seconds, and at the end of
+# every calculation
+MATERIAL_FLUSH_SIZE = int(os.environ.get("MATERIAL_FLUSH_SIZE", 100))
+MATERIAL_FLUSH_INTERVAL = float(os.environ.get("MATERIAL_FLUSH_INTERVAL", 300))
+
+# Descriptions encoded per batch by match_materials
+MATERIAL_MATCH_BATCH_SIZE = int(os.environ.get("MATERIAL_MATCH_BATCH_SIZE", 64))
 
 
 def get_s3_client():
@@ -135,12 +167,34 @@ def get_db():
     return _db
 
 
-def refresh_materials_list():
-    """Refresh the materials list from MongoDB"""
-    global MaterialList
+def get_catalog_version(db):
+    """Return the current version of the material catalog in MongoDB"""
+    counter = db.catalog_versions.find_one({"_id": "materials"})
+    return counter.get("version", 0) if counter else 0
+
+
+def refresh_materials_list(force=False):
+    """Refresh the materials list from MongoDB if the catalog changed.
+
+    Returns the cached MaterialList while its version matches the catalog's
+    and it is younger than MATERIAL_CATALOG_MAX_AGE seconds.
+    """
+    global MaterialList, MaterialCatalogVersion, _catalog_loaded_at
 
     db = get_db()
-    cursor = db.materials.find({})
+    version = get_catalog_version(db)
+    if (
+        not force
+        and version == MaterialCatalogVersion
+        and time.monotonic() - _catalog_loaded_at < MATERIAL_CATALOG_MAX_AGE
+    ):
+        logger.info(f"Using cached material catalog version {version}")
+        return MaterialList
+
+    cursor = db.materials.find(
+        {},
+        {"specified_material": 1, "embodied_carbon": 1, "density": 1, "unit": 1},
+    )
 
     # Convert MongoDB results to the required dictionary format
     materials_dict = {}
@@ -163,7 +217,9 @@ def refresh_materials_list():
 
     # Update the global variable
     MaterialList = materials_dict
-    pprint(MaterialList)
+    MaterialCatalogVersion = version
+    _catalog_loaded_at = time.monotonic()
+    logger.info(f"Loaded {len(MaterialList)} materials, catalog version {version}")
     return MaterialList
 
 
@@ -171,63 +227,36 @@ MaterialsToIgnore = ["Travertine", "<Unnamed>"]
 
 
 # Globals for material embedding functionality
+EMBEDDING_MODEL_NAME = "sentence-transformers/msmarco-MiniLM-L-6-v3"
 embedding_model = None
-material_embeddings = None
-material_data_df = None
+# MaterialStore of the embedding database, None until it is loaded
+material_store = None
 
+# add_material_to_database calls queued by defer_material_additions, or None
+_deferred_additions = None
 
-def get_element_area(element):
-    settings = ifcopenshell.geom.settings()
-    try:
-        shape = ifcopenshell.geom.create_shape(settings, element)
-        vertices = np.array(shape.geometry.verts).reshape((-1, 3))
-        faces = np.array(shape.geometry.faces).reshape(-1, 3)
-
-        # Get all triangle vertices at once
-        v1 = vertices[faces[:, 0]]
-        v2 = vertices[faces[:, 1]]
-        v3 = vertices[faces[:, 2]]
-
-        # Calculate area using cross product method
-        # Area of a triangle = magnitude of cross product / 2
-        cross_products = np.cross(v2 - v1, v3 - v1)
-        # Calculate magnitude of cross products
-        areas = np.sqrt(np.sum(cross_products**2, axis=1)) / 2.0
-
-        # Sum all triangle areas
-        total_area = np.sum(areas)
-        return np.abs(total_area)
-
-    except RuntimeError as e:
-        print(f"Error processing geometry: {e}")
-        return None
-    return area
-
-
-def get_element_volume(element):
-    settings = ifcopenshell.geom.settings()
+# Version of the material database in memory, None for the unversioned files
+MaterialDatabaseVersion = None
+# (record, embedding) of the materials added since the last upload
+_pending_materials = []
+_pending_since = None
 
-    try:
-        shape = ifcopenshell.geom.create_shape(settings, element)
-        vertices = np.array(shape.geometry.verts).reshape((-1, 3))
-        faces = np.array(shape.geometry.faces).reshape(-1, 3)
+# Best database match of the descriptions searched by match_materials:
+# (element type, description) -> (material name, similarity)
+material_matches = {}
+# element_data of the find_similar_material calls recorded by
+# collect_material_queries, or None
+_material_queries = None
 
-        # Get all triangle vertices at once
-        v1 = vertices[faces[:, 0]]
-        v2 = vertices[faces[:, 1]]
-        v3 = vertices[faces[:, 2]]
 
-        # Calculate volume using cross product method
-        # Volume = sum(v1 · (v2 × v3)) / 6
-        cross_products = np.cross(v2, v3)
-        dot_products = np.sum(v1 * cross_products, axis=1)
-        volume = np.sum(dot_products) / 6.0
+def get_element_area(element):
+    """Return the surface area of an element's geometry, or None"""
+    return geometry.get_area(element)
 
-        return np_abs(volume)
 
-    except RuntimeError as e:
-        print(f"Error processing geometry: {e}")
-        return None
+def get_element_volume(element):
+    """Return the volume of an element's geometry, or None"""
+    return geometry.get_volume(element)
 
 
 def initialize_embedding_model():
@@ -236,9 +265,7 @@ def initialize_embedding_model():
 
     if embedding_model is None:
         try:
-            embedding_model = SentenceTransformer(
-                "sentence-transformers/msmarco-MiniLM-L-6-v3"
-            )
+            embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
             logger.info("Loaded embedding model for material matching")
         except Exception as e:
             logger.error(f"Error loading embedding model: {e}")
@@ -247,74 +274,151 @@ def initialize_embedding_model():
     return embedding_model
 
 
+def encode_descriptions(descriptions, batch_size=32):
+    """Return the embeddings of material descriptions, one row each.
+
+    Descriptions are looked up in the embedding cache first; the model is only
+    loaded and run for the ones it hasn't seen. Returns None if the model is
+    needed but can't be loaded.
+    """
+    return embedding_cache.encode(
+        EMBEDDING_MODEL_NAME, descriptions, initialize_embedding_model, batch_size
+    )
+
+
+def get_material_manifest():
+    """Return the manifest of the current material database version and its
+    ETag, or (None, None) when no version has been published"""
+    s3_client = get_s3_client()
+    if not s3_client:
+        return None, None
+    try:
+        response = s3_client.get_object(
+            Bucket=S3_BUCKET_NAME, Key=MATERIAL_MANIFEST_S3_PATH
+        )
+        return json.load(response["Body"]), response["ETag"]
+    except s3_client.exceptions.NoSuchKey:
+        return None, None
+    except ValueError as e:
+        logger.error(f"Invalid material database manifest: {e}")
+    except Exception as e:
+        logger.error(f"Error downloading the material database manifest: {e}")
+    return None, None
+
+
+def switch_material_manifest(manifest, etag):
+    """Upload the manifest unless another job switched it since it was read.
+
+    etag is that of the manifest that was read, None when there was none.
+    Returns True once switched, False when the manifest changed in between
+    and None when the upload failed.
+    """
+    s3_client = get_s3_client()
+    if not s3_client:
+        return None
+    condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    try:
+        s3_client.put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=MATERIAL_MANIFEST_S3_PATH,
+            Body=json.dumps(manifest).encode(),
+            ContentType="application/json",
+            **condition,
+        )
+    except s3_client.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in (
+            "PreconditionFailed",
+            "ConditionalRequestConflict",
+        ):
+            return False
+        logger.error(f"Error uploading the material database manifest: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Error uploading the material database manifest: {e}")
+        return None
+    logger.info(f"Switched the material database to version {manifest['version']}")
+    return True
+
+
+def prune_material_versions(previous_version):
+    """Delete the files of the versions published before previous_version.
+
+    The previous version is kept for the jobs still loading it. Versions
+    start with their time, so the files of versions being uploaded by other
+    jobs sort after it and are never deleted.
+    """
+    s3_client = get_s3_client()
+    if not s3_client or not previous_version:
+        return
+    try:
+        keys = [
+            {"Key": item["Key"]}
+            for page in s3_client.get_paginator("list_objects_v2").paginate(
+                Bucket=S3_BUCKET_NAME, Prefix=f"{MATERIAL_VERSIONS_S3_PREFIX}/"
+            )
+            for item in page.get("Contents", [])
+            if os.path.splitext(os.path.basename(item["Key"]))[0] < previous_version
+        ]
+        # delete_objects takes up to 1000 keys
+        for start in range(0, len(keys), 1000):
+            s3_client.delete_objects(
+                Bucket=S3_BUCKET_NAME,
+                Delete={"Objects": keys[start : start + 1000], "Quiet": True},
+            )
+    except Exception as e:
+        logger.error(f"Error deleting old material database versions: {e}")
+        return
+    if keys:
+        logger.info(f"Deleted {len(keys)} files of old material database versions")
+
+
 def load_material_database():
     """Load material database from S3 if they exist"""
-    global material_embeddings, material_data_df
+    global material_store, MaterialDatabaseVersion
+
+    if material_store is not None:
+        return True
+
+    csv_path, npy_path = MATERIAL_CSV_S3_PATH, EMBEDDING_NPY_S3_PATH
+    manifest, _ = get_material_manifest()
+    if manifest:
+        csv_path, npy_path = manifest["csv"], manifest["embeddings"]
+        MaterialDatabaseVersion = manifest["version"]
 
     # Initialize with empty dataframe if nothing exists yet
-    if material_data_df is None:
-        try:
-            if check_s3_file_exists(MATERIAL_CSV_S3_PATH):
-                # Download CSV from S3 to memory
-                csv_buffer = download_from_s3(MATERIAL_CSV_S3_PATH)
-                if csv_buffer:
-                    material_data_df = pd.read_csv(csv_buffer)
-                    logger.info(
-                        f"Loaded {len(material_data_df)} material records from S3: {MATERIAL_CSV_S3_PATH}"
-                    )
-            else:
-                # Create an empty DataFrame with the required columns
-                material_data_df = pd.DataFrame(
-                    columns=[
-                        "material_name",
-                        "element_type",
-                        "material_type",
-                        "volume",
-                        "area",
-                        "layer_count",
-                        "material_description",
-                        "ec_per_kg",
-                        "density",
-                    ]
-                )
+    material_data_df = MaterialStore().to_dataframe()
+    try:
+        if check_s3_file_exists(csv_path):
+            # Download CSV from S3 to memory
+            csv_buffer = download_from_s3(csv_path)
+            if csv_buffer:
+                material_data_df = pd.read_csv(csv_buffer)
                 logger.info(
-                    f"Created new material database (no existing file found in S3)"
+                    f"Loaded {len(material_data_df)} material records from S3: {csv_path}"
                 )
-        except Exception as e:
-            logger.error(f"Error loading material database CSV from S3: {e}")
-            material_data_df = pd.DataFrame(
-                columns=[
-                    "material_name",
-                    "element_type",
-                    "material_type",
-                    "volume",
-                    "area",
-                    "layer_count",
-                    "material_description",
-                    "ec_per_kg",
-                    "density",
-                ]
-            )
+        else:
+            logger.info(f"Created new material database (no existing file found in S3)")
+    except Exception as e:
+        logger.error(f"Error loading material database CSV from S3: {e}")
 
     # Load embeddings if available
-    if material_embeddings is None:
-        try:
-            if check_s3_file_exists(EMBEDDING_NPY_S3_PATH):
-                # Download NPY from S3 to memory
-                npy_buffer = download_from_s3(EMBEDDING_NPY_S3_PATH)
-                if npy_buffer:
-                    material_embeddings = np.load(npy_buffer)
-                    logger.info(
-                        f"Loaded {len(material_embeddings)} material embeddings from S3: {EMBEDDING_NPY_S3_PATH}"
-                    )
-            else:
-                material_embeddings = np.array([])
-                logger.info(f"No existing embeddings found in S3")
-        except Exception as e:
-            logger.error(f"Error loading embeddings from S3: {e}")
-            material_embeddings = np.array([])
+    material_embeddings = np.array([])
+    try:
+        if check_s3_file_exists(npy_path):
+            # Download NPY from S3 to memory
+            npy_buffer = download_from_s3(npy_path)
+            if npy_buffer:
+                material_embeddings = np.load(npy_buffer)
+                logger.info(
+                    f"Loaded {len(material_embeddings)} material embeddings from S3: {npy_path}"
+                )
+        else:
+            logger.info(f"No existing embeddings found in S3")
+    except Exception as e:
+        logger.error(f"Error loading embeddings from S3: {e}")
 
-    return material_data_df is not None and material_embeddings is not None
+    material_store = MaterialStore.from_dataframe(material_data_df, material_embeddings)
+    return True
 
 
 def create_material_description(element_info):
@@ -359,9 +463,10 @@ def create_material_description(element_info):
     return " ".join(desc_parts)
 
 
-def extract_element_metadata(element, existing_data=None):
+def extract_element_metadata(element, existing_data=None, index=None):
     """Extract comprehensive metadata about an element for material matching"""
     element_data = existing_data or {}
+    index = element_index.get_index([element], index)
 
     # Basic element info
     element_data["element_id"] = element.id()
@@ -369,7 +474,7 @@ def extract_element_metadata(element, existing_data=None):
     element_data["element_name"] = element.Name if hasattr(element, "Name") else None
 
     # Get property sets
-    psets = get_psets(element)
+    psets = index.get_psets(element)
 
     # Extract dimensions from property sets
     dimensions = psets.get("Dimensions", {})
@@ -378,27 +483,19 @@ def extract_element_metadata(element, existing_data=None):
             element_data[f"dimension_{key.lower()}"] = value
 
     # Extract quantities
-    if hasattr(element, "IsDefinedBy"):
-        for definition in element.IsDefinedBy:
-            if definition.is_a("IfcRelDefinesByProperties"):
-                property_def = definition.RelatingPropertyDefinition
-                if property_def.is_a("IfcElementQuantity"):
-                    quantity_set_name = property_def.Name
-
-                    # Different elements use different quantity sets
-                    if "BaseQuantities" in quantity_set_name:
-                        for quantity in property_def.Quantities:
-                            # Extract volume
-                            if (
-                                quantity.is_a("IfcQuantityVolume")
-                                and quantity.Name == "NetVolume"
-                            ):
-                                element_data["volume"] = quantity.VolumeValue
-
-                            # Extract areas
-                            elif quantity.is_a("IfcQuantityArea"):
-                                area_type = quantity.Name.lower().replace("area", "")
-                                element_data[f"area_{area_type}"] = quantity.AreaValue
+    for quantity_set_name, quantities in index.get_quantity_sets(element).items():
+        # Different elements use different quantity sets
+        if "BaseQuantities" not in quantity_set_name:
+            continue
+        for quantity in quantities:
+            # Extract volume
+            if quantity.is_a("IfcQuantityVolume") and quantity.Name == "NetVolume":
+                element_data["volume"] = quantity.VolumeValue
+
+            # Extract areas
+            elif quantity.is_a("IfcQuantityArea"):
+                area_type = quantity.Name.lower().replace("area", "")
+                element_data[f"area_{area_type}"] = quantity.AreaValue
 
     # Rebar information
     rebar_set = psets.get("Rebar Set")
@@ -411,47 +508,29 @@ def extract_element_metadata(element, existing_data=None):
     return element_data
 
 
-def extract_element_materials(element, element_data=None):
+def extract_element_materials(element, element_data=None, index=None):
     """Extract material information from an element"""
     if element_data is None:
         element_data = {}
+    index = element_index.get_index([element], index)
 
     element_data["material_name"] = None
     element_data["material_type"] = None
     element_data["layer_materials"] = []
     element_data["layer_thicknesses"] = []
 
-    if not hasattr(element, "HasAssociations"):
-        return element_data
-
-    for association in element.HasAssociations:
-        if not association.is_a("IfcRelAssociatesMaterial"):
-            continue
-
-        material = association.RelatingMaterial
-
+    for material in index.get_materials(element):
         # Handle single material
-        if material.is_a("IfcMaterial"):
-            element_data["material_name"] = material.Name
+        if material.kind == "IfcMaterial":
+            element_data["material_name"] = material.name
             element_data["material_type"] = "single"
             break
 
-        # Handle material layer set
-        elif material.is_a("IfcMaterialLayerSet") or material.is_a(
-            "IfcMaterialLayerSetUsage"
-        ):
+        # Handle material layer set, layers without a material are left out
+        elif material.kind in ("IfcMaterialLayerSet", "IfcMaterialLayerSetUsage"):
             element_data["material_type"] = "layered"
-
-            layer_set = (
-                material
-                if material.is_a("IfcMaterialLayerSet")
-                else material.ForLayerSet
-            )
-
-            for layer in layer_set.MaterialLayers:
-                if layer.Material:  # Some layers might not have a material defined
-                    element_data["layer_materials"].append(layer.Material.Name)
-                    element_data["layer_thicknesses"].append(layer.LayerThickness)
+            element_data["layer_materials"].extend(material.layer_names)
+            element_data["layer_thicknesses"].extend(material.layer_thicknesses)
 
             # For embedding purposes, use the predominant material
             if element_data["layer_materials"]:
@@ -462,12 +541,9 @@ def extract_element_materials(element, element_data=None):
             break
 
         # Handle material constituent set
-        elif material.is_a("IfcMaterialConstituentSet"):
+        elif material.kind == "IfcMaterialConstituentSet":
             element_data["material_type"] = "constituent"
-
-            for constituent in material.MaterialConstituents:
-                if constituent.Material:
-                    element_data["layer_materials"].append(constituent.Material.Name)
+            element_data["layer_materials"].extend(material.layer_names)
 
             # For embedding purposes, use the first constituent's material
             if element_data["layer_materials"]:
@@ -475,7 +551,7 @@ def extract_element_materials(element, element_data=None):
             break
 
     # Special case for windows and doors (using Reference from Psets)
-    psets = get_psets(element)
+    psets = index.get_psets(element)
     if element.is_a() == "IfcWindow" and "Pset_WindowCommon" in psets:
         if "Reference" in psets["Pset_WindowCommon"]:
             element_data["material_name"] = psets["Pset_WindowCommon"]["Reference"]
@@ -489,36 +565,52 @@ def extract_element_materials(element, element_data=None):
     return element_data
 
 
+def defer_material_additions():
+    """Queue add_material_to_database calls instead of applying them.
+
+    Used in calculator worker processes: each has its own copy of the database
+    and their uploads would overwrite each other. Returns the queue of
+    element_data, to be added by the parent process.
+    """
+    global _deferred_additions
+    _deferred_additions = []
+    return _deferred_additions
+
+
 def add_material_to_database(element_data):
-    """Add a material to our S3-based CSV and embedding database"""
-    global embedding_model, material_embeddings, material_data_df
+    """Add a material to our S3-based CSV and embedding database.
 
-    # Load the database if not loaded
-    if material_data_df is None:
-        load_material_database()
+    The material is searchable right away; the upload is left to
+    flush_material_database, which runs once MATERIAL_FLUSH_SIZE materials
+    are pending or the oldest is MATERIAL_FLUSH_INTERVAL seconds old.
+    """
+    global _pending_since
 
-    # Make sure embedding model is initialized
-    if not embedding_model:
-        embedding_model = initialize_embedding_model()
-        if not embedding_model:
-            return False
+    if _deferred_additions is not None:
+        _deferred_additions.append(element_data)
+        return True
+
+    # Load the database if not loaded
+    load_material_database()
 
     material_name = element_data.get("material_name")
     if not material_name or material_name in MaterialsToIgnore:
         return False
 
     # Skip if we already have this material in our database
-    if material_data_df is not None and not material_data_df.empty:
-        if material_name in material_data_df["material_name"].values:
-            # logger.debug(f"Material '{material_name}' already in database, skipping")
-            return True
+    if material_name in material_store:
+        # logger.debug(f"Material '{material_name}' already in database, skipping")
+        return True
 
     # Create description for this material
     description = create_material_description(element_data)
 
     try:
         # Generate embedding
-        embedding = embedding_model.encode([description])[0]
+        embeddings = encode_descriptions([description])
+        if embeddings is None:
+            return False
+        embedding = embeddings[0]
 
         if material_name == "Undefined":
             return False
@@ -547,107 +639,161 @@ def add_material_to_database(element_data):
             elif isinstance(prop, (int, float)):
                 record["ec_per_m2"] = prop
 
-        # Add to DataFrame
-        material_data_df = pd.concat(
-            [material_data_df, pd.DataFrame([record])], ignore_index=True
+        material_store.append(record, embedding)
+
+        # Queue the upload
+        _pending_materials.append((record, embedding))
+        if _pending_since is None:
+            _pending_since = time.monotonic()
+        logger.info(
+            f"Added material '{material_name}' to database, "
+            f"{len(_pending_materials)} pending upload"
         )
+    except Exception as e:
+        logger.error(f"Error adding material '{material_name}' to database: {e}")
+        return False
 
-        # Add to embeddings array
-        if material_embeddings is None or len(material_embeddings) == 0:
-            material_embeddings = np.array([embedding])
-        else:
-            material_embeddings = np.vstack([material_embeddings, embedding])
+    if (
+        len(_pending_materials) >= MATERIAL_FLUSH_SIZE
+        or time.monotonic() - _pending_since >= MATERIAL_FLUSH_INTERVAL
+    ):
+        flush_material_database()
+    return True
 
-        # Save to S3
-        # Save DataFrame to CSV in memory
-        csv_buffer = io.BytesIO()
-        material_data_df.to_csv(csv_buffer, index=False, encoding="utf-8")
-        csv_buffer.seek(0)
 
-        # Save numpy array to NPY in memory
-        npy_buffer = io.BytesIO()
-        np.save(npy_buffer, material_embeddings)
-        npy_buffer.seek(0)
+def flush_material_database():
+    """Upload the materials added since the last flush as a new database version.
 
-        # Upload both to S3
-        csv_upload_success = upload_to_s3(csv_buffer, MATERIAL_CSV_S3_PATH, "text/csv")
-        npy_upload_success = upload_to_s3(
-            npy_buffer, EMBEDDING_NPY_S3_PATH, "application/octet-stream"
-        )
+    The CSV and embeddings are written under keys of their own version and
+    the manifest is then switched to them with a single conditional upload,
+    so readers never get a CSV and embeddings of different versions. When
+    another job published a version since this one was loaded, or publishes
+    one during the upload, the pending materials are added on top of that
+    version instead of overwriting it. Pending materials are kept for the
+    next flush if an upload fails. Versions before the replaced one are
+    deleted once the manifest is switched.
+    """
+    global material_store, MaterialDatabaseVersion
+    global _pending_materials, _pending_since
+
+    if not _pending_materials:
+        return True
 
-        if csv_upload_success and npy_upload_success:
+    for _ in range(MATERIAL_FLUSH_ATTEMPTS):
+        manifest, etag = get_material_manifest()
+        if manifest and manifest["version"] != MaterialDatabaseVersion:
             logger.info(
-                f"Added material '{material_name}' to database and uploaded to S3"
+                f"Material database version {manifest['version']} was published "
+                f"since version {MaterialDatabaseVersion} was loaded, rebasing"
             )
-            return True
-        else:
-            logger.error(f"Failed to upload material '{material_name}' to S3")
-            return False
-    except Exception as e:
-        logger.error(f"Error adding material '{material_name}' to database: {e}")
+            material_store = None
+            load_material_database()
+            for record, embedding in _pending_materials:
+                if record["material_name"] not in material_store:
+                    material_store.append(record, embedding)
+
+        # Save the records to CSV and the embeddings to NPY in memory
+        csv_bytes = material_store.to_dataframe().to_csv(index=False).encode("utf-8")
+        npy_buffer = io.BytesIO()
+        np.save(npy_buffer, material_store.embeddings)
+        npy_bytes = npy_buffer.getvalue()
+
+        # Versions sort by time, the digest keeps concurrent flushes apart
+        digest = hashlib.sha1(csv_bytes + npy_bytes).hexdigest()[:12]
+        version = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{digest}"
+        manifest = {
+            "version": version,
+            "csv": f"{MATERIAL_VERSIONS_S3_PREFIX}/{version}.csv",
+            "embeddings": f"{MATERIAL_VERSIONS_S3_PREFIX}/{version}.npy",
+            "materials": len(material_store),
+            "previous_version": MaterialDatabaseVersion,
+        }
+
+        uploaded = upload_to_s3(
+            io.BytesIO(csv_bytes), manifest["csv"], "text/csv"
+        ) and upload_to_s3(
+            io.BytesIO(npy_bytes), manifest["embeddings"], "application/octet-stream"
+        )
+        switched = switch_material_manifest(manifest, etag) if uploaded else None
+        if switched is not False:
+            break
+        # The files of this attempt are deleted with the older versions
+        logger.info(
+            f"Material database manifest changed while uploading version "
+            f"{version}, rebasing"
+        )
+    if not switched:
+        logger.error(
+            f"Failed to upload material database version {version}, "
+            f"keeping {len(_pending_materials)} materials pending"
+        )
         return False
 
+    prune_material_versions(MaterialDatabaseVersion)
+    logger.info(
+        f"Uploaded {len(_pending_materials)} new materials as material database "
+        f"version {version}"
+    )
+    MaterialDatabaseVersion = version
+    _pending_materials = []
+    _pending_since = None
+    return True
+
+
+def _search_materials(element_type, query_embeddings):
+    """Return the row and similarity of the best match of each query embedding.
+
+    Only materials of element_type are searched, or the whole database when
+    there are none.
+    """
+    if element_type and element_type not in material_store.partitions:
+        logger.warning(
+            f"No materials found for element type '{element_type}', falling back to full database"
+        )
+        element_type = None
+
+    # If no element_type specified, use all materials
+    rows, scores = material_store.search(query_embeddings, element_type or None)
+    return rows[:, 0].tolist(), scores[:, 0]
+
 
 def find_similar_material(element_data, min_similarity=0.5):
-    """Find the most similar material in our database with element_type filtering"""
-    global embedding_model, material_embeddings, material_data_df
+    """Find the most similar material in our database with element_type filtering.
+
+    Descriptions already searched by match_materials are answered from
+    material_matches without running the model.
+    """
+    if _material_queries is not None:
+        _material_queries.append(element_data)
+        return None, 0
 
     # Load database if not loaded
-    if material_data_df is None or material_embeddings is None:
-        if not load_material_database():
-            logger.error("Could not load material database for similarity search")
-            return None, 0
+    if not load_material_database():
+        logger.error("Could not load material database for similarity search")
+        return None, 0
 
     # If database is empty, return None
-    if material_data_df.empty or len(material_embeddings) == 0:
+    if len(material_store) == 0:
         logger.warning("Material database is empty, cannot find similar materials")
         return None, 0
 
     # Get the element type for filtering
     query_element_type = element_data.get("element_type", None)
 
-    # Filter the database by element_type if specified
-    if query_element_type:
-        # Get indices of materials with matching element_type
-        filtered_indices = material_data_df[
-            material_data_df["element_type"] == query_element_type
-        ].index.tolist()
-
-        if not filtered_indices:
-            logger.warning(
-                f"No materials found for element type '{query_element_type}', falling back to full database"
-            )
-            filtered_indices = material_data_df.index.tolist()
-    else:
-        # If no element_type specified, use all materials
-        filtered_indices = material_data_df.index.tolist()
-
-    # Filter embeddings to only include those matching the element type
-    filtered_embeddings = material_embeddings[filtered_indices]
-
-    # Make sure embedding model is initialized
-    if not embedding_model:
-        embedding_model = initialize_embedding_model()
-        if not embedding_model:
-            return None, 0
-
-    # Create description and generate embedding for the query
+    # Create description for the query
     description = create_material_description(element_data)
 
     try:
-        query_embedding = embedding_model.encode([description])[0]
-
-        # Calculate similarity with filtered embeddings
-        similarities = cosine_similarity([query_embedding], filtered_embeddings)[0]
-
-        # Find the most similar material
-        best_local_idx = np.argmax(similarities)
-        best_score = similarities[best_local_idx]
+        match = material_matches.get((query_element_type, description))
+        if match is None:
+            query_embedding = encode_descriptions([description])
+            if query_embedding is None:
+                return None, 0
+            rows, scores = _search_materials(query_element_type, query_embedding)
+            match = (material_store.material_name(rows[0]), float(scores[0]))
+        best_match, best_score = match
 
         if best_score >= min_similarity:
-            # Convert local index back to global index
-            best_idx = filtered_indices[best_local_idx]
-            best_match = material_data_df.iloc[best_idx]["material_name"]
             logger.info(
                 f"Found similar material '{best_match}' (score: {best_score:.3f}) with matching element type"
             )
@@ -663,6 +809,82 @@ def find_similar_material(element_data, min_similarity=0.5):
         return None, 0
 
 
+def collect_material_queries():
+    """Record find_similar_material calls instead of answering them.
+
+    The calls find no match. Returns the list their element_data is appended
+    to, to be passed to match_materials, which also stops the recording,
+    before the elements are calculated again.
+    """
+    global _material_queries
+    _material_queries = []
+    return _material_queries
+
+
+def match_materials(queries):
+    """Search the best matches of many find_similar_material queries at once.
+
+    The distinct descriptions of the queries are encoded in batches of
+    MATERIAL_MATCH_BATCH_SIZE and searched with one similarity matrix per
+    element type. The matches replace material_matches, where
+    find_similar_material looks them up.
+    """
+    global material_matches, _material_queries
+
+    _material_queries = None
+    material_matches = {}
+    if not queries:
+        return material_matches
+
+    if not load_material_database() or len(material_store) == 0:
+        return material_matches
+
+    # element type -> distinct descriptions, in query order
+    descriptions = {}
+    for element_data in queries:
+        descriptions.setdefault(element_data.get("element_type", None), {})[
+            create_material_description(element_data)
+        ] = None
+
+    try:
+        texts = list({d: None for by_type in descriptions.values() for d in by_type})
+        embeddings = encode_descriptions(texts, batch_size=MATERIAL_MATCH_BATCH_SIZE)
+        if embeddings is None:
+            return material_matches
+        embedding_rows = {text: row for row, text in enumerate(texts)}
+
+        for element_type, by_type in descriptions.items():
+            by_type = list(by_type)
+            rows, scores = _search_materials(
+                element_type, embeddings[[embedding_rows[d] for d in by_type]]
+            )
+            for description, row, score in zip(by_type, rows, scores.tolist()):
+                material_matches[(element_type, description)] = (
+                    material_store.material_name(row),
+                    score,
+                )
+    except Exception as e:
+        logger.error(f"Error matching materials: {e}")
+        return material_matches
+
+    logger.info(
+        f"Matched {len(texts)} distinct material descriptions for "
+        f"{len(queries)} elements"
+    )
+    return material_matches
+
+
+def has_material_match(element_data, min_similarity=0.5):
+    """Whether match_materials found a match for a query of find_similar_material"""
+    match = material_matches.get(
+        (
+            element_data.get("element_type", None),
+            create_material_description(element_data),
+        )
+    )
+    return match is not None and match[1] >= min_similarity
+
+
 def remove_matched_from_missing(all_missing_materials, all_matched_materials):
     """
     Remove elements that were successfully matched from the missing materials dictionary.
@@ -739,14 +961,17 @@ def initialize_material_database(ifc_file=None):
         }
 
         materials_found = 0
+        index = element_index.get_model_index(ifc_file)
 
         for type_name, elements in element_types.items():
             logger.debug(f"Extracting materials from {len(elements)} {type_name}")
 
             for element in elements:
                 # Extract element metadata and materials
-                element_data = extract_element_metadata(element)
-                element_data = extract_element_materials(element, element_data)
+                element_data = extract_element_metadata(element, index=index)
+                element_data = extract_element_materials(
+                    element, element_data, index=index
+                )
 
                 # Add to database only if it has a valid material that's also in MaterialList
                 material_name = element_data.get("material_name")
@@ -770,35 +995,64 @@ def initialize_material_database(ifc_file=None):
         logger.info(
             f"Found and added {materials_found} materials from IFC file to database"
         )
+        flush_material_database()
 
     logger.info(
-        f"Material database initialized with {len(material_data_df) if material_data_df is not None else 0} materials"
+        f"Material database initialized with {len(material_store) if material_store is not None else 0} materials"
     )
     return success
 
 
-def get_substructure_elements(ifc_file_path):
-    """Returns all elements associated with substructure levels (Level 0 or any Basement)."""
-    model = ifcopenshell.open(ifc_file_path)
+def open_ifc(ifc_file):
+    """Return a parsed IFC model, opening it first if given a file path.
+
+    Lets callers parse a model once and pass the same handle to every
+    calculation step instead of re-reading the file for each one.
+    """
+    if isinstance(ifc_file, ifcopenshell.file):
+        return ifc_file
+    logger.info(f"Opening IFC file {ifc_file}")
+    model = ifcopenshell.open(ifc_file)
+    # Lets calculator worker processes open their own copy
+    model.source_path = ifc_file
+    # Identifies the file contents for the geometry cache
+    model.content_hash = hash_file(ifc_file)
+    return model
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_substructure_elements(ifc_file):
+    """Returns all elements associated with substructure levels (Level 0 or any Basement).
+
+    Args:
+        ifc_file: Parsed ifcopenshell model or path to an IFC file
+    """
+    model = open_ifc(ifc_file)
+    index = element_index.get_model_index(model)
 
     # Find ALL target storeys
-    storeys = model.by_type("IfcBuildingStorey")
-    substructure_storeys = [
-        s for s in storeys if s.Name == "Level 0" or "Basement" in s.Name
-    ]
+    substructure_storeys = index.substructure_storeys()
 
     if not substructure_storeys:
         logger.warning("No substructure levels (Level 0 or Basement) found.")
         return []
 
     # Collect elements assigned to ANY substructure storey
-    elements = []
-    for rel in model.by_type("IfcRelContainedInSpatialStructure"):
-        if rel.RelatingStructure in substructure_storeys:
-            for elem in rel.RelatedElements:
-                elements.append(elem)
+    elements = [
+        model.by_id(element_id)
+        for storey_id in substructure_storeys
+        for element_id in index.storey_elements[storey_id]
+    ]
 
-    substructure_names = [s.Name for s in substructure_storeys]
+    substructure_names = [index.storey_names[s] for s in substructure_storeys]
     logger.info(
         f"Total elements found in substructure levels {substructure_names}: {len(elements)}"
     )
@@ -0,0 +1,151 @@
+import os
+from collections import Counter
+
+from loguru import logger
+
+# Per-element issues found by the calculators (missing quantities, unknown
+# materials, ...), counted per (category, issue) instead of logged one line
+# per element. Only the first occurrences of each issue are logged.
+DIAGNOSTICS_SAMPLE_SIZE = int(os.environ.get("DIAGNOSTICS_SAMPLE_SIZE", 10))
+DIAGNOSTICS_LOG_LIMIT = int(os.environ.get("DIAGNOSTICS_LOG_LIMIT", 3))
+
+
+class Diagnostics:
+    """Issue counts per (category, issue) with a few sample element ids each"""
+
+    def __init__(self, track_elements=False):
+        self.counts = Counter()
+        self.samples = {}
+        self.levels = {}
+        # (element id, key) of every report, kept by collectors whose issues
+        # of some elements may have to be forgotten
+        self.element_reports = [] if track_elements else None
+
+    @classmethod
+    def from_summary(cls, summary):
+        """Make a collector holding the issues of a summary(), e.g. a stored one"""
+        collector = cls()
+        for entry in summary:
+            key = (entry["category"], entry["issue"])
+            collector.counts[key] = entry["count"]
+            collector.levels[key] = entry["level"]
+            collector.samples[key] = list(entry["sample_ids"])
+        return collector
+
+    def report(self, category, issue, element=None, detail=None, level="WARNING"):
+        """Count an issue of an element, given as an entity or its id"""
+        key = (category, issue)
+        element_id = (
+            element if element is None or isinstance(element, int) else element.id()
+        )
+        self.counts[key] += 1
+        self.levels.setdefault(key, level)
+        samples = self.samples.setdefault(key, [])
+        if (
+            element_id is not None
+            and len(samples) < DIAGNOSTICS_SAMPLE_SIZE
+            and element_id not in samples
+        ):
+            samples.append(element_id)
+        if self.element_reports is not None and element_id is not None:
+            self.element_reports.append((element_id, key))
+
+        if self.counts[key] <= DIAGNOSTICS_LOG_LIMIT:
+            logger.log(
+                level,
+                "{}: {} (element {}{})",
+                category,
+                issue,
+                element_id if element_id is not None else "-",
+                "" if detail is None else f", {detail}",
+            )
+        elif self.counts[key] == DIAGNOSTICS_LOG_LIMIT + 1:
+            logger.log(level, "{}: {}, further occurrences are only counted", *key)
+
+    def merge(self, other):
+        """Add the issues collected by another collector, e.g. in a worker"""
+        if self.element_reports is not None and other.element_reports is not None:
+            self.element_reports.extend(other.element_reports)
+        for key, count in other.counts.items():
+            self.counts[key] += count
+            self.levels.setdefault(key, other.levels[key])
+            samples = self.samples.setdefault(key, [])
+            for element_id in other.samples[key]:
+                if len(samples) >= DIAGNOSTICS_SAMPLE_SIZE:
+                    break
+                if element_id not in samples:
+                    samples.append(element_id)
+        return self
+
+    def forget(self, element_ids):
+        """Remove the issues reported for elements, e.g. ones calculated again"""
+        kept = []
+        for element_id, key in self.element_reports:
+            if element_id not in element_ids:
+                kept.append((element_id, key))
+                continue
+            self.counts[key] -= 1
+            if element_id in self.samples[key]:
+                self.samples[key].remove(element_id)
+            if not self.counts[key]:
+                del self.counts[key], self.samples[key], self.levels[key]
+        self.element_reports = kept
+        return self
+
+    def element_issues(self):
+        """Return {element id: [[category, issue, level], ...]} of the reports"""
+        issues = {}
+        for element_id, key in self.element_reports:
+            issues.setdefault(element_id, []).append([*key, self.levels[key]])
+        return issues
+
+    def summary(self):
+        """Return [{category, issue, level, count, sample_ids}, ...], most frequent first"""
+        return [
+            {
+                "category": category,
+                "issue": issue,
+                "level": self.levels[(category, issue)],
+                "count": count,
+                "sample_ids": self.samples[(category, issue)],
+            }
+            for (category, issue), count in self.counts.most_common()
+        ]
+
+    def log_summary(self):
+        for entry in self.summary():
+            logger.log(
+                entry["level"],
+                "{}: {} x{}, e.g. elements {}",
+                entry["category"],
+                entry["issue"],
+                entry["count"],
+                entry["sample_ids"],
+            )
+
+
+# Collector of the calculation in progress
+_current = Diagnostics()
+
+
+def collect(track_elements=False):
+    """Start collecting into a new collector and return it"""
+    global _current
+    _current = Diagnostics(track_elements)
+    return _current
+
+
+def current():
+    """Return the collector issues are currently recorded with"""
+    return _current
+
+
+def resume(collector):
+    """Record issues with an earlier collector again"""
+    global _current
+    _current = collector
+
+
+def report(category, issue, element=None, detail=None, level="WARNING"):
+    """Record an issue of an element with the current collector"""
+    _current.report(category, issue, element, detail, level)
@@ -0,0 +1,516 @@
+import json
+from array import array
+from collections import defaultdict
+
+import numpy as np
+from loguru import logger
+
+from . import diagnostics
+
+# How the quantity of a takeoff line is turned into EC and mass
+VOLUME = 0  # m³ of a material given as [EC per kg, density]
+AREA = 1  # m² of a material given as EC per m²
+
+# Reinforcement isn't part of the material catalog, it always uses these factors
+REBAR = "Rebar"
+REBAR_EC_PER_KG = 2.510
+REBAR_DENSITY = 7850
+
+# Unit of the quantity column in the excel export, "kg" for everything else
+EXCEL_UNITS = {"Window": "m2", "Door": "m2"}
+
+# Storey of elements that aren't contained in a building storey
+NO_STOREY = "Unassigned"
+
+# Dimensions of the EC cube, in the order of its cell keys
+CUBE_DIMENSIONS = ("storey", "category", "ifc_type", "material_family")
+
+# Bump when the stored takeoff format changes
+TAKEOFF_VERSION = 2
+
+# Columns of the table and the array typecodes they are stored with
+ELEMENT_COLUMNS = {
+    "element_ids": "q",
+    "element_types": "i",
+    "element_categories": "i",
+    "substructure": "b",
+    "rebar_volumes": "d",
+    "element_storeys": "i",
+}
+LINE_COLUMNS = {
+    "line_elements": "q",
+    "line_materials": "i",
+    "quantities": "d",
+    "bases": "b",
+}
+COLUMNS = {**ELEMENT_COLUMNS, **LINE_COLUMNS}
+
+
+class ECTable:
+    """Embodied carbon takeoff of a model in columnar form.
+
+    The category calculators only resolve materials and quantities. Each
+    element they report becomes one row (id, IFC type, category, substructure
+    flag, rebar volume) and each of its materials one line (element row,
+    material, quantity, basis). evaluate() then computes the EC and mass of
+    every line in one vectorized pass, and the breakdown, excel rows and
+    summaries are built from the resulting arrays.
+
+    Columns are typed arrays rather than lists, so a row or line costs a few
+    bytes per column instead of a Python object per value, and tables pickle
+    as raw buffers between workers.
+    """
+
+    def __init__(self, substructure_ids=()):
+        self.substructure_ids = set(substructure_ids)
+
+        # Interned strings, referenced by index from the columns below
+        self.materials = []
+        self.categories = []
+        self.ifc_types = []
+        self.storeys = []
+        self._material_codes = {}
+        self._category_codes = {}
+        self._ifc_type_codes = {}
+        self._storey_codes = {}
+
+        # One entry per element (ELEMENT_COLUMNS) and per material line
+        # (LINE_COLUMNS)
+        for column, typecode in COLUMNS.items():
+            setattr(self, column, array(typecode))
+
+        self.evaluated = False
+
+    @staticmethod
+    def _intern(names, codes, value):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(names)
+            names.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.element_ids)
+
+    def add_element(self, element, category, substructure=None, rebar_volume=0.0):
+        """Add an element row and return its row number for add_line.
+
+        substructure defaults to whether the element is one of the model's
+        substructure elements.
+        """
+        if substructure is None:
+            substructure = element.id() in self.substructure_ids
+        self.element_ids.append(element.id())
+        self.element_types.append(
+            self._intern(self.ifc_types, self._ifc_type_codes, element.is_a())
+        )
+        self.element_categories.append(
+            self._intern(self.categories, self._category_codes, category)
+        )
+        self.substructure.append(bool(substructure))
+        self.rebar_volumes.append(rebar_volume or 0.0)
+        self.element_storeys.append(
+            self._intern(self.storeys, self._storey_codes, NO_STOREY)
+        )
+        self.evaluated = False
+        return len(self.element_ids) - 1
+
+    def assign_storeys(self, storeys):
+        """Set the storey of every row from {element id: storey name}"""
+        self.storeys = []
+        self._storey_codes = {}
+        self.element_storeys = array(
+            ELEMENT_COLUMNS["element_storeys"],
+            (
+                self._intern(
+                    self.storeys,
+                    self._storey_codes,
+                    storeys.get(element_id) or NO_STOREY,
+                )
+                for element_id in self.element_ids
+            ),
+        )
+
+    def extend(self, other):
+        """Append the rows and lines of another table, e.g. one built in a worker"""
+        materials = [
+            self._intern(self.materials, self._material_codes, name)
+            for name in other.materials
+        ]
+        categories = [
+            self._intern(self.categories, self._category_codes, name)
+            for name in other.categories
+        ]
+        ifc_types = [
+            self._intern(self.ifc_types, self._ifc_type_codes, name)
+            for name in other.ifc_types
+        ]
+        storeys = [
+            self._intern(self.storeys, self._storey_codes, name)
+            for name in other.storeys
+        ]
+
+        offset = len(self)
+        self.element_ids.extend(other.element_ids)
+        self.element_types.extend(ifc_types[code] for code in other.element_types)
+        self.element_categories.extend(
+            categories[code] for code in other.element_categories
+        )
+        self.substructure.extend(other.substructure)
+        self.rebar_volumes.extend(other.rebar_volumes)
+        self.element_storeys.extend(storeys[code] for code in other.element_storeys)
+
+        self.line_elements.extend(row + offset for row in other.line_elements)
+        self.line_materials.extend(materials[code] for code in other.line_materials)
+        self.quantities.extend(other.quantities)
+        self.bases.extend(other.bases)
+        self.evaluated = False
+        return self
+
+    def take(self, rows):
+        """Return a table of the given rows, in that order, with their lines"""
+        table = ECTable(self.substructure_ids)
+        for names, codes in (
+            ("materials", "_material_codes"),
+            ("categories", "_category_codes"),
+            ("ifc_types", "_ifc_type_codes"),
+            ("storeys", "_storey_codes"),
+        ):
+            setattr(table, names, list(getattr(self, names)))
+            setattr(table, codes, dict(getattr(self, codes)))
+
+        for column, typecode in ELEMENT_COLUMNS.items():
+            values = getattr(self, column)
+            setattr(table, column, array(typecode, (values[row] for row in rows)))
+
+        positions = {row: position for position, row in enumerate(rows)}
+        lines = sorted(
+            (positions[row], line)
+            for line, row in enumerate(self.line_elements)
+            if row in positions
+        )
+        for column, typecode in LINE_COLUMNS.items():
+            values = getattr(self, column)
+            if column == "line_elements":
+                values = [position for position, _ in lines]
+            else:
+                values = [values[line] for _, line in lines]
+            setattr(table, column, array(typecode, values))
+        return table
+
+    def add_line(self, row, material, quantity, basis=VOLUME):
+        """Add a material quantity to an element row"""
+        self.line_elements.append(row)
+        self.line_materials.append(
+            self._intern(self.materials, self._material_codes, material)
+        )
+        # A missing quantity is stored as NaN, evaluate() reports it and
+        # leaves the line out of the totals
+        self.quantities.append(np.nan if quantity is None else quantity)
+        self.bases.append(basis)
+        self.evaluated = False
+
+    def takeoffs(self):
+        """Return [category, rebar volume, [[material, quantity, basis], ...]] per row"""
+        takeoffs = [
+            [self.categories[self.element_categories[row]], self.rebar_volumes[row], []]
+            for row in range(len(self))
+        ]
+        for line, row in enumerate(self.line_elements):
+            takeoffs[row][2].append(
+                [
+                    self.materials[self.line_materials[line]],
+                    self.quantities[line],
+                    self.bases[line],
+                ]
+            )
+        return takeoffs
+
+    def add_takeoff(self, element, takeoff, substructure=None):
+        """Add an element row from an entry of takeoffs()"""
+        category, rebar_volume, lines = takeoff
+        row = self.add_element(element, category, substructure, rebar_volume)
+        for material, quantity, basis in lines:
+            self.add_line(row, material, quantity, basis)
+        return row
+
+    def material_factors(self, material_list):
+        """Return the EC per kg, density and EC per m² arrays of the table's materials"""
+        ec_per_kg = np.zeros(len(self.materials))
+        density = np.zeros(len(self.materials))
+        ec_per_m2 = np.zeros(len(self.materials))
+
+        for code, name in enumerate(self.materials):
+            data = material_list.get(name)
+            if isinstance(data, (int, float)):
+                ec_per_m2[code] = data
+            elif data is not None and len(data) >= 2:
+                ec_per_kg[code], density[code] = data[0], data[1]
+            else:
+                logger.warning(f"No EC data for material '{name}', counting it as 0")
+        return ec_per_kg, density, ec_per_m2
+
+    def evaluate(self, material_list):
+        """Compute the EC and mass of every line and element"""
+        ec_per_kg, density, ec_per_m2 = self.material_factors(material_list)
+
+        materials = np.asarray(self.line_materials, dtype=np.intp)
+        # A copy, missing quantities stay missing in the table
+        quantities = np.array(self.quantities, dtype=float)
+        for line in np.flatnonzero(~np.isfinite(quantities)).tolist():
+            row = self.line_elements[line]
+            diagnostics.report(
+                self.categories[self.element_categories[row]],
+                "No quantity, left out of the EC",
+                self.element_ids[row],
+                self.materials[self.line_materials[line]],
+                level="ERROR",
+            )
+            quantities[line] = 0
+        by_volume = np.asarray(self.bases, dtype=np.int8) == VOLUME
+
+        self.line_ec = np.where(
+            by_volume,
+            ec_per_kg[materials] * density[materials] * quantities,
+            ec_per_m2[materials] * quantities,
+        )
+        self.line_mass = np.where(
+            by_volume, density[materials] * quantities, quantities
+        )
+
+        rebar_volumes = np.asarray(self.rebar_volumes, dtype=float)
+        self.rebar_ec = rebar_volumes * REBAR_EC_PER_KG * REBAR_DENSITY
+        self.rebar_mass = rebar_volumes * REBAR_DENSITY
+
+        line_elements = np.asarray(self.line_elements, dtype=np.intp)
+        self.element_ec = (
+            np.bincount(line_elements, weights=self.line_ec, minlength=len(self))
+            + self.rebar_ec
+        )
+
+        # Entries are the material lines plus the rebar of every reinforced
+        # element, ordered by element with the rebar after the element's lines
+        rebar_rows = np.flatnonzero(rebar_volumes > 0)
+        rows = np.concatenate([line_elements, rebar_rows])
+        order = np.argsort(rows, kind="stable")
+        self.entry_rows = rows[order]
+        self.entry_materials = np.concatenate(
+            [materials, np.full(len(rebar_rows), len(self.materials), dtype=np.intp)]
+        )[order]
+        self.entry_ec = np.concatenate([self.line_ec, self.rebar_ec[rebar_rows]])[order]
+        self.entry_mass = np.concatenate([self.line_mass, self.rebar_mass[rebar_rows]])[
+            order
+        ]
+        self.evaluated = True
+        return self
+
+    def _check_evaluated(self):
+        if not self.evaluated:
+            raise RuntimeError("ECTable.evaluate() has to be called first")
+
+    def total_ec(self):
+        self._check_evaluated()
+        return float(self.element_ec.sum())
+
+    def summarize(self, categorize):
+        """Return the summaries of the table, all from one reduction of its entries.
+
+        The entries of the table (see evaluate) are reduced to EC, mass and count per building
+        system, storey, category, IFC type and material in one bincount pass,
+        and each summary is read off those cells. Materials are grouped into
+        families with categorize(name), called once per material.
+
+        Returns a dict with
+            by_building_system: (substructure EC, superstructure EC)
+            by_category: {category: EC}
+            by_material: {material family: EC}
+            material_counts: {material: number of breakdown entries}
+            cube: [{storey, category, ifc_type, material_family, ec, mass}, ...]
+        """
+        self._check_evaluated()
+        materials = self.materials + [REBAR]
+        rows = self.entry_rows
+
+        names = (self.storeys, self.categories, self.ifc_types, materials)
+        shape = (2,) + tuple(max(len(n), 1) for n in names)
+        keys = np.ravel_multi_index(
+            (
+                np.asarray(self.substructure, dtype=np.intp)[rows],
+                np.asarray(self.element_storeys, dtype=np.intp)[rows],
+                np.asarray(self.element_categories, dtype=np.intp)[rows],
+                np.asarray(self.element_types, dtype=np.intp)[rows],
+                self.entry_materials,
+            ),
+            shape,
+        )
+        cells, cell_of_entry = np.unique(keys, return_inverse=True)
+        cell_ec = np.bincount(
+            cell_of_entry, weights=self.entry_ec, minlength=len(cells)
+        )
+        cell_mass = np.bincount(
+            cell_of_entry, weights=self.entry_mass, minlength=len(cells)
+        )
+        cell_count = np.bincount(cell_of_entry, minlength=len(cells))
+
+        building_systems = [0.0, 0.0]
+        by_category = dict.fromkeys(self.categories, 0.0)
+        by_material = {}
+        material_counts = {}
+        cube = {}
+        for (substructure, storey, category, ifc_type, material), e, m, n in zip(
+            zip(*np.unravel_index(cells, shape)),
+            cell_ec.tolist(),
+            cell_mass.tolist(),
+            cell_count.tolist(),
+        ):
+            name = materials[material]
+            family = categorize(name)
+            building_systems[substructure] += e
+            by_category[self.categories[category]] += e
+            by_material[family] = by_material.get(family, 0.0) + e
+            material_counts[name] = material_counts.get(name, 0) + n
+
+            key = (
+                self.storeys[storey],
+                self.categories[category],
+                self.ifc_types[ifc_type],
+                family,
+            )
+            cell = cube.get(key)
+            if cell is None:
+                cell = cube[key] = dict(zip(CUBE_DIMENSIONS, key), ec=0.0, mass=0.0)
+            cell["ec"] += e
+            cell["mass"] += m
+
+        return {
+            "by_building_system": (building_systems[1], building_systems[0]),
+            "by_category": by_category,
+            "by_material": by_material,
+            "material_counts": material_counts,
+            "cube": list(cube.values()),
+        }
+
+    def _entries(self):
+        """Return the entries as lists: rows, material names, EC and mass"""
+        self._check_evaluated()
+        materials = self.materials + [REBAR]
+        return (
+            self.entry_rows.tolist(),
+            [materials[code] for code in self.entry_materials.tolist()],
+            self.entry_ec.tolist(),
+            self.entry_mass.tolist(),
+        )
+
+    def breakdown(self, substructure):
+        """Return the ec_breakdown element entries of one building system"""
+        rows, materials, ec, mass = self._entries()
+        # Entries of row r are entries[starts[r]:starts[r + 1]]
+        starts = np.searchsorted(self.entry_rows, np.arange(len(self) + 1)).tolist()
+        element_ec = self.element_ec.tolist()
+        elements = []
+        for row in range(len(self)):
+            if bool(self.substructure[row]) != substructure:
+                continue
+            elements.append(
+                {
+                    "element": self.categories[self.element_categories[row]],
+                    "element_id": self.element_ids[row],
+                    "ifc_type": self.ifc_types[self.element_types[row]],
+                    "storey": self.storeys[self.element_storeys[row]],
+                    "ec": element_ec[row],
+                    "materials": [
+                        {
+                            "material": materials[i],
+                            "material_mass": mass[i],
+                            "ec": ec[i],
+                        }
+                        for i in range(starts[row], starts[row + 1])
+                    ],
+                }
+            )
+        return elements
+
+    def excel_rows(self):
+        """Return one excel export row per entry"""
+        rows, materials, ec, mass = self._entries()
+        element_ids = self.element_ids
+        ifc_types = [self.ifc_types[code] for code in self.element_types]
+        categories = [self.categories[code] for code in self.element_categories]
+        return [
+            [
+                element_ids[row],  # Element ID
+                ifc_types[row],  # IFC Type
+                categories[row],  # Element Type
+                material,  # Material
+                material_ec,  # Material EC
+                material_mass,  # Material mass
+                EXCEL_UNITS.get(categories[row], "kg"),
+            ]
+            for row, material, material_ec, material_mass in zip(
+                rows, materials, ec, mass
+            )
+        ]
+
+
+def save_takeoff(takeoff, file):
+    """Write a takeoff as a compressed npz file.
+
+    The table columns are stored as typed arrays and its strings once each;
+    the other takeoff entries (missing and matched materials, skipped
+    elements, ...) as JSON.
+    """
+    table = takeoff["table"]
+    extra = {key: value for key, value in takeoff.items() if key != "table"}
+    np.savez_compressed(
+        file,
+        version=np.array(TAKEOFF_VERSION),
+        materials=np.array(table.materials, dtype=str),
+        categories=np.array(table.categories, dtype=str),
+        ifc_types=np.array(table.ifc_types, dtype=str),
+        storeys=np.array(table.storeys, dtype=str),
+        **{column: np.asarray(getattr(table, column)) for column in COLUMNS},
+        extra=np.frombuffer(json.dumps(extra, default=float).encode(), dtype=np.uint8),
+    )
+
+
+def _as_tuples(entries):
+    return [tuple(entry) if isinstance(entry, list) else entry for entry in entries]
+
+
+def load_takeoff(file):
+    """Read a takeoff written by save_takeoff"""
+    with np.load(file, allow_pickle=False) as data:
+        if int(data["version"]) != TAKEOFF_VERSION:
+            raise ValueError(f"Unsupported takeoff version {int(data['version'])}")
+
+        table = ECTable()
+        for names, codes in (
+            ("materials", "_material_codes"),
+            ("categories", "_category_codes"),
+            ("ifc_types", "_ifc_type_codes"),
+            ("storeys", "_storey_codes"),
+        ):
+            setattr(table, names, data[names].tolist())
+            setattr(
+                table, codes, {name: i for i, name in enumerate(getattr(table, names))}
+            )
+        for column, typecode in COLUMNS.items():
+            values = array(typecode)
+            values.frombytes(
+                data[column].astype(np.dtype(typecode), copy=False).tobytes()
+            )
+            setattr(table, column, values)
+        extra = json.loads(data["extra"].tobytes().decode())
+
+    takeoff = dict(extra, table=table)
+    # JSON turned the tuples of these entries into lists
+    takeoff["missing_materials"] = defaultdict(
+        list,
+        {
+            ifc_type: _as_tuples(entries)
+            for ifc_type, entries in extra["missing_materials"].items()
+        },
+    )
+    takeoff["matched_materials"] = defaultdict(list, extra["matched_materials"])
+    takeoff["element_type_skipped"] = _as_tuples(extra["element_type_skipped"])
+    return takeoff
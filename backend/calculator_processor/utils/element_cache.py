@@ -0,0 +1,123 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+
+from loguru import logger
+
+# Local cache of per-element calculator results, keyed by GlobalId. Each entry
+# carries a fingerprint of the element's inputs so that a new version of a
+# model only recomputes the elements that were added or changed.
+ELEMENT_CACHE_ENABLED = (
+    os.environ.get("ELEMENT_CACHE_ENABLED", "true").lower() == "true"
+)
+ELEMENT_CACHE_DIR = os.environ.get(
+    "ELEMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ec_element_cache")
+)
+# Upper bound on cached elements; least recently used entries are evicted first
+ELEMENT_CACHE_MAX_ENTRIES = int(os.environ.get("ELEMENT_CACHE_MAX_ENTRIES", 2_000_000))
+
+# SQLite limits the number of parameters of a statement
+_QUERY_CHUNK = 500
+
+
+def _connect():
+    os.makedirs(ELEMENT_CACHE_DIR, exist_ok=True)
+    connection = sqlite3.connect(
+        os.path.join(ELEMENT_CACHE_DIR, "elements.sqlite3"), timeout=30
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS elements ("
+        "context TEXT NOT NULL, global_id TEXT NOT NULL, fingerprint TEXT NOT NULL, "
+        "record TEXT NOT NULL, last_used REAL NOT NULL, "
+        "PRIMARY KEY (context, global_id))"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS elements_last_used ON elements (last_used)"
+    )
+    return connection
+
+
+def load(context, fingerprints):
+    """Return the cached records of elements whose fingerprint is unchanged.
+
+    Args:
+        context: Key of everything besides the element that the results depend on
+        fingerprints: {GlobalId: fingerprint} of the current model
+
+    Returns:
+        dict: GlobalId -> record
+    """
+    if not ELEMENT_CACHE_ENABLED or not fingerprints:
+        return {}
+
+    global_ids = list(fingerprints)
+    records = {}
+    try:
+        with closing(_connect()) as connection, connection:
+            for start in range(0, len(global_ids), _QUERY_CHUNK):
+                chunk = global_ids[start : start + _QUERY_CHUNK]
+                rows = connection.execute(
+                    "SELECT global_id, fingerprint, record FROM elements "
+                    f"WHERE context = ? AND global_id IN ({', '.join('?' * len(chunk))})",
+                    (context, *chunk),
+                ).fetchall()
+                for global_id, fingerprint, record in rows:
+                    if fingerprints[global_id] == fingerprint:
+                        records[global_id] = json.loads(record)
+
+            now = time.time()
+            connection.executemany(
+                "UPDATE elements SET last_used = ? WHERE context = ? AND global_id = ?",
+                [(now, context, global_id) for global_id in records],
+            )
+    except sqlite3.Error as e:
+        logger.warning(f"Error reading element cache: {e}")
+        return {}
+
+    logger.info(f"Found {len(records)} unchanged elements in the element cache")
+    return records
+
+
+def store(context, results):
+    """Save {GlobalId: (fingerprint, record)} results and evict old entries"""
+    if not ELEMENT_CACHE_ENABLED or not results:
+        return False
+
+    now = time.time()
+    try:
+        with closing(_connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO elements VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        context,
+                        global_id,
+                        fingerprint,
+                        json.dumps(record, default=float),
+                        now,
+                    )
+                    for global_id, (fingerprint, record) in results.items()
+                ],
+            )
+            _evict(connection)
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        logger.warning(f"Error writing element cache: {e}")
+        return False
+    return True
+
+
+def _evict(connection):
+    """Drop least recently used entries until the cache is within its size limit"""
+    (total,) = connection.execute("SELECT COUNT(*) FROM elements").fetchone()
+    if total > ELEMENT_CACHE_MAX_ENTRIES:
+        connection.execute(
+            "DELETE FROM elements WHERE rowid IN "
+            "(SELECT rowid FROM elements ORDER BY last_used LIMIT ?)",
+            (total - ELEMENT_CACHE_MAX_ENTRIES,),
+        )
+        logger.info(
+            f"Evicted {total - ELEMENT_CACHE_MAX_ENTRIES} cached element results"
+        )
@@ -0,0 +1,330 @@
+import hashlib
+from collections import namedtuple
+
+from ifcopenshell.util.element import get_property_definition
+from loguru import logger
+
+# Property and quantity sets read through get_psets; everything else is
+# skipped during the sweep
+INDEXED_PSETS = (
+    "Dimensions",
+    "Rebar Set",
+    "Pset_WindowCommon",
+    "Pset_DoorCommon",
+    "Qto_SpaceBaseQuantities",
+)
+
+# One resolved IfcRelAssociatesMaterial entry.
+# kind is the RelatingMaterial class, name its own Name (None for usages),
+# layer_names/layer_thicknesses the layers or constituents in file order.
+MaterialAssociation = namedtuple(
+    "MaterialAssociation", ["kind", "name", "layer_names", "layer_thicknesses"]
+)
+
+
+def quantity_key(quantity):
+    """Return (name, value) of a quantity, with the sub-quantities of complex ones"""
+    if quantity.is_a("IfcPhysicalComplexQuantity"):
+        return quantity.Name, [quantity_key(q) for q in quantity.HasQuantities]
+    if quantity.is_a("IfcPhysicalSimpleQuantity"):
+        return quantity.Name, quantity[3]
+    return quantity.Name, None
+
+
+def resolve_material(material):
+    """Flatten a RelatingMaterial into a MaterialAssociation"""
+    kind = material.is_a()
+    layer_names = []
+    layer_thicknesses = []
+
+    if kind == "IfcMaterialLayerSetUsage":
+        layers = material.ForLayerSet.MaterialLayers
+    elif kind == "IfcMaterialLayerSet":
+        layers = material.MaterialLayers
+    elif kind == "IfcMaterialConstituentSet":
+        layers = material.MaterialConstituents or []
+    else:
+        layers = []
+
+    for layer in layers:
+        if layer.Material is None:
+            continue
+        layer_names.append(layer.Material.Name)
+        layer_thicknesses.append(getattr(layer, "LayerThickness", None))
+
+    return MaterialAssociation(
+        kind, getattr(material, "Name", None), layer_names, layer_thicknesses
+    )
+
+
+# Index of the last model passed to get_model_index, until release_model_index
+_last_index = None
+
+
+def is_substructure_storey(name):
+    """Whether a storey belongs to the substructure (Level 0 or any Basement)"""
+    return name == "Level 0" or "Basement" in (name or "")
+
+
+def partition(elements, ids):
+    """Split elements into those whose id is in ids and the rest, keeping order"""
+    inside, outside = [], []
+    for element in elements:
+        (inside if element.id() in ids else outside).append(element)
+    return inside, outside
+
+
+class ElementIndex:
+    """Per-model lookup tables for quantities, materials, property sets and
+    spatial containment.
+
+    Built with one sweep over IfcRelDefinesByProperties, IfcRelDefinesByType,
+    IfcRelAssociatesMaterial, IfcRelContainedInSpatialStructure and the roof
+    aggregations so the category calculators never walk the inverse
+    attributes of individual elements.
+    """
+
+    def __init__(self, ifc_file, pset_names=INDEXED_PSETS):
+        self.ifc_file = ifc_file
+        self.pset_names = set(pset_names)
+
+        # element id -> {qto name: [IfcPhysicalQuantity, ...]}
+        self.quantity_sets = {}
+        # element id -> {qto name: {quantity name: value}}, first value wins
+        self.quantity_values = {}
+        # element id -> {pset name: {property name: value}}
+        self.psets = {}
+        # element id -> [MaterialAssociation, ...]
+        self.materials = {}
+        # element id -> [MaterialAssociation, ...] inherited from the element type
+        self.type_materials = {}
+        # storey id -> storey Name
+        self.storey_names = {}
+        # storey id -> [element id, ...] contained in the storey, in file order
+        self.storey_elements = {}
+        # element id -> id of the storey containing it, directly or through
+        # the element it is a part of
+        self.element_storey = {}
+        # element id -> name of its storey
+        self.element_storey_names = {}
+        # ids of the elements aggregated into a roof
+        self.roof_parts = set()
+
+        self._build()
+        self._build_spatial()
+
+    def _build(self):
+        ifc_file = self.ifc_file
+
+        resolved_materials = {}
+        for rel in ifc_file.by_type("IfcRelAssociatesMaterial"):
+            material = rel.RelatingMaterial
+            key = material.id()
+            if key not in resolved_materials:
+                resolved_materials[key] = resolve_material(material)
+            association = resolved_materials[key]
+            for obj in rel.RelatedObjects:
+                self.materials.setdefault(obj.id(), []).append(association)
+
+        # Type psets come first so that occurrence psets override them,
+        # matching ifcopenshell.util.element.get_psets
+        for rel in ifc_file.by_type("IfcRelDefinesByType"):
+            type_obj = rel.RelatingType
+            type_psets = {}
+            for definition in getattr(type_obj, "HasPropertySets", None) or []:
+                if definition.Name in self.pset_names:
+                    type_psets.setdefault(definition.Name, {}).update(
+                        get_property_definition(definition)
+                    )
+            type_materials = self.materials.get(type_obj.id(), [])
+            for obj in rel.RelatedObjects:
+                if type_psets:
+                    element_psets = self.psets.setdefault(obj.id(), {})
+                    for name, props in type_psets.items():
+                        element_psets[name] = dict(props)
+                if type_materials:
+                    self.type_materials[obj.id()] = type_materials
+
+        resolved_psets = {}
+        for rel in ifc_file.by_type("IfcRelDefinesByProperties"):
+            definition = rel.RelatingPropertyDefinition
+            if definition.is_a("IfcPropertySetDefinitionSet"):
+                definitions = definition.wrappedValue
+            else:
+                definitions = (definition,)
+
+            for definition in definitions:
+                if definition.is_a("IfcElementQuantity"):
+                    self._add_quantities(rel.RelatedObjects, definition)
+                if definition.Name in self.pset_names:
+                    key = definition.id()
+                    if key not in resolved_psets:
+                        resolved_psets[key] = get_property_definition(definition)
+                    for obj in rel.RelatedObjects:
+                        self.psets.setdefault(obj.id(), {}).setdefault(
+                            definition.Name, {}
+                        ).update(resolved_psets[key])
+
+        logger.info(
+            f"Indexed {len(self.quantity_sets)} elements with quantities, "
+            f"{len(self.materials)} with materials, {len(self.psets)} with psets"
+        )
+
+    def _build_spatial(self):
+        ifc_file = self.ifc_file
+
+        for storey in ifc_file.by_type("IfcBuildingStorey"):
+            self.storey_names[storey.id()] = storey.Name
+            self.storey_elements[storey.id()] = []
+
+        for rel in ifc_file.by_type("IfcRelContainedInSpatialStructure"):
+            storey_id = rel.RelatingStructure.id()
+            if storey_id not in self.storey_elements:
+                continue
+            element_ids = [elem.id() for elem in rel.RelatedElements]
+            self.storey_elements[storey_id].extend(element_ids)
+            for element_id in element_ids:
+                self.element_storey.setdefault(element_id, storey_id)
+
+        # Parts (e.g. stair flights of a stair) are on the storey of their
+        # whole; repeated for parts of parts
+        aggregates = [
+            (rel.RelatingObject.id(), [part.id() for part in rel.RelatedObjects])
+            for rel in ifc_file.by_type("IfcRelAggregates")
+        ]
+        changed = True
+        while changed:
+            changed = False
+            for whole_id, part_ids in aggregates:
+                storey_id = self.element_storey.get(whole_id)
+                if storey_id is None:
+                    continue
+                for part_id in part_ids:
+                    if part_id not in self.element_storey:
+                        self.element_storey[part_id] = storey_id
+                        changed = True
+
+        self.element_storey_names = {
+            element_id: self.storey_names[storey_id]
+            for element_id, storey_id in self.element_storey.items()
+        }
+
+        for roof in ifc_file.by_type("IfcRoof"):
+            for rel in getattr(roof, "IsDecomposedBy", None) or []:
+                if rel.is_a("IfcRelAggregates"):
+                    self.roof_parts.update(part.id() for part in rel.RelatedObjects)
+
+    def _add_quantities(self, related_objects, definition):
+        quantities = list(definition.Quantities or [])
+        values = {}
+        for quantity in quantities:
+            # IfcPhysicalSimpleQuantity stores its value as the fourth attribute
+            if quantity.is_a("IfcPhysicalSimpleQuantity"):
+                values.setdefault(quantity.Name, quantity[3])
+
+        for obj in related_objects:
+            self.quantity_sets.setdefault(obj.id(), {}).setdefault(
+                definition.Name, []
+            ).extend(quantities)
+            element_values = self.quantity_values.setdefault(obj.id(), {}).setdefault(
+                definition.Name, {}
+            )
+            for name, value in values.items():
+                element_values.setdefault(name, value)
+
+    def get_quantity_sets(self, element):
+        """Return {quantity set name: quantities} of an element"""
+        return self.quantity_sets.get(element.id(), {})
+
+    def get_quantities(self, element, qto_name):
+        """Return the quantities of a named quantity set, in file order"""
+        return self.quantity_sets.get(element.id(), {}).get(qto_name, [])
+
+    def get_quantity(self, element, qto_name, quantity_name):
+        """Return the first value of a named quantity, or None"""
+        return (
+            self.quantity_values.get(element.id(), {})
+            .get(qto_name, {})
+            .get(quantity_name)
+        )
+
+    def get_psets(self, element):
+        """Return the indexed property and quantity sets of an element,
+        like ifcopenshell.util.element.get_psets"""
+        return self.psets.get(element.id(), {})
+
+    def get_materials(self, element):
+        """Return the resolved material associations of an element"""
+        return self.materials.get(element.id(), [])
+
+    def get_type_materials(self, element):
+        """Return the material associations inherited from the element type"""
+        return self.type_materials.get(element.id(), [])
+
+    def get_storey(self, element):
+        """Return the name of the storey containing an element, or None"""
+        return self.storey_names.get(self.element_storey.get(element.id()))
+
+    def substructure_storeys(self):
+        """Return the ids of the substructure storeys"""
+        return [
+            storey_id
+            for storey_id, name in self.storey_names.items()
+            if is_substructure_storey(name)
+        ]
+
+    def substructure_ids(self):
+        """Return the ids of the elements contained in substructure storeys"""
+        ids = set()
+        for storey_id in self.substructure_storeys():
+            ids.update(self.storey_elements[storey_id])
+        return ids
+
+    def fingerprint(self, element, *extra):
+        """Return a digest of what the calculators read about an element.
+
+        Covers its class and name, quantity sets, indexed property sets and
+        own and type materials, plus extra values such as its computed
+        geometry. Entity ids are left out, they change between exports.
+        """
+        quantities = {
+            name: [quantity_key(q) for q in quantities]
+            for name, quantities in self.quantity_sets.get(element.id(), {}).items()
+        }
+        psets = {
+            name: {k: v for k, v in props.items() if k != "id"}
+            for name, props in self.get_psets(element).items()
+        }
+        key = (
+            element.is_a(),
+            element.Name,
+            quantities,
+            psets,
+            self.get_materials(element),
+            self.get_type_materials(element),
+            extra,
+        )
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def get_model_index(ifc_file):
+    """Return the index of a model, reusing the last one built for the same model"""
+    global _last_index
+    if _last_index is None or _last_index.ifc_file != ifc_file:
+        _last_index = ElementIndex(ifc_file)
+    return _last_index
+
+
+def release_model_index():
+    """Drop the last index, and the model it holds, once a job is done with it"""
+    global _last_index
+    _last_index = None
+
+
+def get_index(elements, index=None):
+    """Return the given index, or the index of the model the elements belong to"""
+    if index is not None:
+        return index
+    for element in elements:
+        return get_model_index(element.file)
+    return None
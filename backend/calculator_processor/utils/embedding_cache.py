@@ -0,0 +1,173 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+import numpy as np
+from loguru import logger
+
+# Cache of material description embeddings, keyed by a hash of the model name
+# and the description text. Recently used embeddings are kept in memory, all
+# of them in a local SQLite store shared by the jobs of this machine.
+EMBEDDING_CACHE_ENABLED = (
+    os.environ.get("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+)
+EMBEDDING_CACHE_DIR = os.environ.get(
+    "EMBEDDING_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ec_embedding_cache")
+)
+# Embeddings kept in memory, least recently used are dropped first
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(
+    os.environ.get("EMBEDDING_CACHE_MEMORY_ENTRIES", 10_000)
+)
+# Upper bound on embeddings on disk, least recently used are evicted first
+EMBEDDING_CACHE_MAX_ENTRIES = int(
+    os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 1_000_000)
+)
+
+# SQLite limits the number of parameters of a statement
+_QUERY_CHUNK = 500
+
+# key -> embedding
+_memory = OrderedDict()
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+
+def _connect():
+    os.makedirs(EMBEDDING_CACHE_DIR, exist_ok=True)
+    connection = sqlite3.connect(
+        os.path.join(EMBEDDING_CACHE_DIR, "embeddings.sqlite3"), timeout=30
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS embeddings ("
+        "key TEXT PRIMARY KEY, embedding BLOB NOT NULL, last_used REAL NOT NULL)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+    )
+    return connection
+
+
+def _key(model_name, description):
+    return hashlib.sha256(f"{model_name}\0{description}".encode()).hexdigest()
+
+
+def _remember(key, embedding):
+    _memory[key] = embedding
+    _memory.move_to_end(key)
+    while len(_memory) > EMBEDDING_CACHE_MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def _load(keys):
+    """Return {key: embedding} of the keys found on disk"""
+    found = {}
+    try:
+        with closing(_connect()) as connection, connection:
+            for start in range(0, len(keys), _QUERY_CHUNK):
+                chunk = keys[start : start + _QUERY_CHUNK]
+                rows = connection.execute(
+                    "SELECT key, embedding FROM embeddings "
+                    f"WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, embedding in rows:
+                    found[key] = np.frombuffer(embedding, dtype=np.float32)
+
+            now = time.time()
+            connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+    except sqlite3.Error as e:
+        logger.warning(f"Error reading embedding cache: {e}")
+        return {}
+    return found
+
+
+def _store(embeddings):
+    """Save {key: embedding} and evict old entries"""
+    now = time.time()
+    try:
+        with closing(_connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [
+                    (key, np.asarray(embedding, dtype=np.float32).tobytes(), now)
+                    for key, embedding in embeddings.items()
+                ],
+            )
+            (total,) = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if total > EMBEDDING_CACHE_MAX_ENTRIES:
+                connection.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (total - EMBEDDING_CACHE_MAX_ENTRIES,),
+                )
+    except sqlite3.Error as e:
+        logger.warning(f"Error writing embedding cache: {e}")
+        return False
+    return True
+
+
+def encode(model_name, descriptions, get_model, batch_size=32):
+    """Return the embeddings of descriptions, one row each.
+
+    Only descriptions found neither in memory nor on disk are encoded, with
+    the model returned by get_model(), which isn't called when every
+    description is cached. Returns None if the model is needed but
+    get_model() returns None.
+    """
+    if not EMBEDDING_CACHE_ENABLED:
+        model = get_model()
+        if model is None:
+            return None
+        _stats["misses"] += len(descriptions)
+        return np.asarray(model.encode(descriptions, batch_size=batch_size))
+
+    keys = [_key(model_name, description) for description in descriptions]
+    embeddings = {}
+    for key in keys:
+        if key in _memory and key not in embeddings:
+            embeddings[key] = _memory[key]
+            _memory.move_to_end(key)
+            _stats["memory_hits"] += 1
+
+    missing = list(dict.fromkeys(key for key in keys if key not in embeddings))
+    if missing:
+        found = _load(missing)
+        _stats["disk_hits"] += len(found)
+        for key, embedding in found.items():
+            embeddings[key] = embedding
+            _remember(key, embedding)
+
+    texts = {}
+    for key, description in zip(keys, descriptions):
+        if key not in embeddings:
+            texts.setdefault(key, description)
+    if texts:
+        model = get_model()
+        if model is None:
+            return None
+        _stats["misses"] += len(texts)
+        encoded = model.encode(list(texts.values()), batch_size=batch_size)
+        new = {}
+        for key, embedding in zip(texts, encoded):
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embeddings[key] = new[key] = embedding
+            _remember(key, embedding)
+        _store(new)
+
+    return np.array([embeddings[key] for key in keys])
+
+
+def stats():
+    """Return the hit and miss counts of this process, for metrics"""
+    lookups = sum(_stats.values())
+    return {
+        **_stats,
+        "hit_rate": (lookups - _stats["misses"]) / lookups if lookups else None,
+        "memory_entries": len(_memory),
+    }
@@ -0,0 +1,510 @@
+import os
+
+import math
+from collections import Counter
+
+import ifcopenshell
+import ifcopenshell.geom
+import ifcopenshell.util.placement
+import ifcopenshell.util.unit
+import numpy as np
+from loguru import logger
+
+from . import diagnostics
+from . import geometry_cache
+
+# Threads used by the geometry iterator, defaults to every available core
+GEOMETRY_THREADS = int(os.environ.get("GEOMETRY_THREADS", os.cpu_count() or 1))
+
+# Results of the last prefetch, keyed by element id. None marks an element
+# that was tessellated but produced no usable geometry.
+_model = None
+_volumes = {}
+_areas = {}
+# Shape key (see shape_key) -> (volume, area), shared by instances of the same
+# representation map
+_shapes = {}
+
+_settings = None
+
+# Tolerance when testing extrusion directions and clipping planes for alignment
+ALIGNMENT_TOLERANCE = 1e-6
+
+
+def get_settings():
+    """Return the shared geometry settings"""
+    global _settings
+    if _settings is None:
+        _settings = ifcopenshell.geom.settings()
+    return _settings
+
+
+def mesh_quantities(geometry):
+    """Return (volume, surface area) of a triangulated geometry"""
+    vertices = np.array(geometry.verts).reshape((-1, 3))
+    faces = np.array(geometry.faces).reshape(-1, 3)
+
+    # Get all triangle vertices at once
+    v1 = vertices[faces[:, 0]]
+    v2 = vertices[faces[:, 1]]
+    v3 = vertices[faces[:, 2]]
+
+    # Volume = sum(v1 · (v2 × v3)) / 6
+    volume = np.sum(np.sum(v1 * np.cross(v2, v3), axis=1)) / 6.0
+    # Area of a triangle = magnitude of cross product / 2
+    cross_products = np.cross(v2 - v1, v3 - v1)
+    area = np.sum(np.sqrt(np.sum(cross_products**2, axis=1)) / 2.0)
+
+    return float(np.abs(volume)), float(np.abs(area))
+
+
+def _polyline_points(curve):
+    """Return the 2D points of a straight-segment curve, or None"""
+    if curve.is_a("IfcPolyline"):
+        return [point.Coordinates[:2] for point in curve.Points]
+
+    if curve.is_a("IfcIndexedPolyCurve"):
+        coordinates = curve.Points.CoordList
+        if not curve.Segments:
+            return [coordinates[i][:2] for i in range(len(coordinates))]
+        points = []
+        for segment in curve.Segments:
+            # Arc segments are left to the tessellator
+            if not segment.is_a("IfcLineIndex"):
+                return None
+            indices = segment.wrappedValue
+            if points:
+                indices = indices[1:]
+            points.extend(coordinates[i - 1][:2] for i in indices)
+        return points
+
+    return None
+
+
+def _polygon_quantities(curve):
+    """Return (area, perimeter) of a closed straight-segment curve, or None"""
+    points = _polyline_points(curve)
+    if not points or len(points) < 3:
+        return None
+    ring = np.array(points, dtype=float)
+    if np.allclose(ring[0], ring[-1]):
+        ring = ring[:-1]
+    x, y = ring[:, 0], ring[:, 1]
+    area = abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2.0
+    perimeter = np.sum(np.linalg.norm(ring - np.roll(ring, -1, axis=0), axis=1))
+    return float(area), float(perimeter)
+
+
+def _rounded_rectangle_quantities(x, y, radius):
+    """Return (area, perimeter) of a rectangle with rounded corners"""
+    radius = radius or 0
+    return (
+        x * y - (4 - math.pi) * radius**2,
+        2 * (x + y) - (8 - 2 * math.pi) * radius,
+    )
+
+
+def profile_quantities(profile):
+    """Return (area, perimeter) of a supported profile definition, or None"""
+    if profile.is_a("IfcRectangleHollowProfileDef"):
+        wall = profile.WallThickness
+        outer = _rounded_rectangle_quantities(
+            profile.XDim, profile.YDim, profile.OuterFilletRadius
+        )
+        inner = _rounded_rectangle_quantities(
+            profile.XDim - 2 * wall, profile.YDim - 2 * wall, profile.InnerFilletRadius
+        )
+        return outer[0] - inner[0], outer[1] + inner[1]
+
+    if profile.is_a("IfcRoundedRectangleProfileDef"):
+        return _rounded_rectangle_quantities(
+            profile.XDim, profile.YDim, profile.RoundingRadius
+        )
+
+    # Other subtypes are left to the tessellator
+    if profile.is_a() == "IfcRectangleProfileDef":
+        x, y = profile.XDim, profile.YDim
+        return x * y, 2 * (x + y)
+
+    if profile.is_a("IfcCircleHollowProfileDef"):
+        outer = profile.Radius
+        inner = outer - profile.WallThickness
+        return math.pi * (outer**2 - inner**2), 2 * math.pi * (outer + inner)
+
+    if profile.is_a("IfcCircleProfileDef"):
+        return math.pi * profile.Radius**2, 2 * math.pi * profile.Radius
+
+    # IFC2X3 derives IfcAsymmetricIShapeProfileDef from it, left to the tessellator
+    if profile.is_a() == "IfcIShapeProfileDef":
+        width = profile.OverallWidth
+        depth = profile.OverallDepth
+        web = profile.WebThickness
+        flange = profile.FlangeThickness
+        area = 2 * width * flange + (depth - 2 * flange) * web
+        perimeter = 4 * width - 2 * web + 2 * depth
+        fillet = profile.FilletRadius or 0
+        if fillet:
+            # Four web-to-flange fillets
+            area += 4 * fillet**2 * (1 - math.pi / 4)
+            perimeter += 4 * (math.pi / 2 - 2) * fillet
+        return area, perimeter
+
+    if profile.is_a("IfcArbitraryClosedProfileDef") and profile.ProfileType == "AREA":
+        outer = _polygon_quantities(profile.OuterCurve)
+        if outer is None:
+            return None
+        area, perimeter = outer
+        for curve in getattr(profile, "InnerCurves", None) or []:
+            inner = _polygon_quantities(curve)
+            if inner is None:
+                return None
+            area -= inner[0]
+            perimeter += inner[1]
+        return area, perimeter
+
+    return None
+
+
+def _extrusion_axis(solid):
+    """Return (origin, unit axis) of an extrusion in representation coordinates, or None"""
+    direction = np.array(solid.ExtrudedDirection.DirectionRatios, dtype=float)
+    direction /= np.linalg.norm(direction)
+    # Only extrusions perpendicular to their profile have a simple lateral area
+    if abs(abs(direction[2]) - 1) > ALIGNMENT_TOLERANCE:
+        return None
+    matrix = np.eye(4)
+    if solid.Position:
+        matrix = ifcopenshell.util.placement.get_axis2placement(solid.Position)
+    return matrix[:3, 3], matrix[:3, :3] @ direction
+
+
+def _clipped_interval(solid, half_space, interval):
+    """Narrow the kept [start, end] extrusion interval by a half space, or None"""
+    if half_space.is_a("IfcPolygonalBoundedHalfSpace"):
+        return None
+    surface = half_space.BaseSurface
+    if not surface.is_a("IfcPlane"):
+        return None
+
+    axis = _extrusion_axis(solid)
+    if axis is None:
+        return None
+    origin, direction = axis
+
+    plane = ifcopenshell.util.placement.get_axis2placement(surface.Position)
+    normal = plane[:3, 2]
+    along = float(np.dot(normal, direction))
+    # Planes that do not cut the extrusion square-on need real geometry
+    if abs(abs(along) - 1) > ALIGNMENT_TOLERANCE:
+        return None
+
+    # The half space material lies against the normal when AgreementFlag is
+    # true, so the difference keeps the side the normal points to
+    side = 1.0 if half_space.AgreementFlag else -1.0
+    offset = float(np.dot(normal, origin - plane[:3, 3]))
+    cut = -offset / along
+    start, end = interval
+    if side * along > 0:
+        start = max(start, cut)
+    else:
+        end = min(end, cut)
+    return start, max(start, end)
+
+
+def _solid_quantities(item):
+    """Return (volume, area) of a supported solid, in project units, or None"""
+    # Subtypes such as tapered extrusions are left to the tessellator
+    if item.is_a() == "IfcExtrudedAreaSolid":
+        profile = profile_quantities(item.SweptArea)
+        if profile is None or _extrusion_axis(item) is None:
+            return None
+        area, perimeter = profile
+        return area * item.Depth, 2 * area + perimeter * item.Depth
+
+    if item.is_a("IfcBooleanResult") and item.Operator == "DIFFERENCE":
+        # Walk nested clippings down to the extrusion they cut
+        half_spaces = []
+        operand = item
+        while operand.is_a("IfcBooleanResult"):
+            if operand.Operator != "DIFFERENCE":
+                return None
+            if not operand.SecondOperand.is_a("IfcHalfSpaceSolid"):
+                return None
+            half_spaces.append(operand.SecondOperand)
+            operand = operand.FirstOperand
+        if operand.is_a() != "IfcExtrudedAreaSolid":
+            return None
+        profile = profile_quantities(operand.SweptArea)
+        if profile is None:
+            return None
+
+        interval = (0.0, operand.Depth)
+        for half_space in half_spaces:
+            interval = _clipped_interval(operand, half_space, interval)
+            if interval is None:
+                return None
+        depth = interval[1] - interval[0]
+        if depth <= 0:
+            return 0.0, 0.0
+        area, perimeter = profile
+        return area * depth, 2 * area + perimeter * depth
+
+    if item.is_a("IfcCsgSolid"):
+        return _solid_quantities(item.TreeRootExpression)
+
+    if item.is_a("IfcBlock"):
+        x, y, z = item.XLength, item.YLength, item.ZLength
+        return x * y * z, 2 * (x * y + y * z + x * z)
+
+    if item.is_a("IfcBoundingBox"):
+        x, y, z = item.XDim, item.YDim, item.ZDim
+        return x * y * z, 2 * (x * y + y * z + x * z)
+
+    if item.is_a("IfcMappedItem"):
+        sx, sy, sz = mapping_scale(item.MappingTarget)
+        # Areas only scale simply under a uniform scale
+        if not math.isclose(sx, sy) or not math.isclose(sx, sz):
+            return None
+        volume = area = 0.0
+        for mapped in item.MappingSource.MappedRepresentation.Items:
+            quantities = _solid_quantities(mapped)
+            if quantities is None:
+                return None
+            volume += quantities[0]
+            area += quantities[1]
+        return volume * sx**3, area * sx**2
+
+    return None
+
+
+def mapping_scale(operator):
+    """Return the (x, y, z) scale factors of a cartesian transformation operator"""
+    scale = operator.Scale if operator.Scale is not None else 1.0
+    if operator.is_a("IfcCartesianTransformationOperator3DnonUniform"):
+        return (
+            scale,
+            operator.Scale2 if operator.Scale2 is not None else scale,
+            operator.Scale3 if operator.Scale3 is not None else scale,
+        )
+    if operator.is_a("IfcCartesianTransformationOperator2DnonUniform"):
+        return (
+            scale,
+            operator.Scale2 if operator.Scale2 is not None else scale,
+            1.0,
+        )
+    return scale, scale, scale
+
+
+def shape_key(element):
+    """Return a key shared by elements whose Body only instances representation maps.
+
+    Elements with the same representation maps at the same scales have the
+    same volume and area wherever they are placed. Returns None for elements
+    with their own geometry or with openings.
+    """
+    if getattr(element, "HasOpenings", None):
+        return None
+    items = _body_items(element)
+    if not items:
+        return None
+    key = []
+    for item in items:
+        if not item.is_a("IfcMappedItem"):
+            return None
+        key.append((item.MappingSource.id(), tuple(mapping_scale(item.MappingTarget))))
+    return tuple(sorted(key))
+
+
+def _body_items(element):
+    """Return the items of the element's Body representation, or None"""
+    if not element.Representation:
+        return None
+    for representation in element.Representation.Representations:
+        if representation.RepresentationIdentifier == "Body":
+            return representation.Items
+    return None
+
+
+def analytic_quantities(element, unit_scale=None):
+    """Compute (volume, area) from the element's solid parameters, or None.
+
+    Handles extrusions of rectangle, circle, I-shape and straight-edged
+    arbitrary profiles, extrusions clipped square-on by planes, and boxes.
+    Anything else, and any element with openings, needs tessellation.
+    """
+    if getattr(element, "HasOpenings", None):
+        return None
+    items = _body_items(element)
+    if not items:
+        return None
+
+    volume = area = 0.0
+    for item in items:
+        quantities = _solid_quantities(item)
+        if quantities is None:
+            return None
+        volume += quantities[0]
+        area += quantities[1]
+
+    if unit_scale is None:
+        unit_scale = ifcopenshell.util.unit.calculate_unit_scale(element.file)
+    return volume * unit_scale**3, area * unit_scale**2
+
+
+def reset():
+    """Drop the results of the previous prefetch"""
+    global _model
+    _model = None
+    _volumes.clear()
+    _areas.clear()
+    _shapes.clear()
+
+
+def preload(ifc_file, results):
+    """Serve get_volume and get_area from prefetch results of the same file,
+    e.g. computed in another process"""
+    global _model
+    reset()
+    _model = ifc_file
+    for key, (volume, area) in results.items():
+        _volumes[key], _areas[key] = volume, area
+
+
+def prefetch(ifc_file, elements, content_hash=None):
+    """Compute the volume and area of elements in one batch.
+
+    Elements with supported solids are computed analytically, the rest are
+    tessellated in one multi-threaded iterator run. Results are kept until
+    the next prefetch or reset, and are served by get_volume and get_area.
+
+    When the content hash of the IFC file is given, results of earlier runs
+    on the same file are read from the on-disk cache by GlobalId and only the
+    missing elements are computed.
+
+    Returns:
+        dict: element id -> (volume, area)
+    """
+    global _model
+    reset()
+    _model = ifc_file
+
+    elements = list({element.id(): element for element in elements}.values())
+    if not elements:
+        return {}
+
+    # GlobalIds shared by several elements can't be told apart in the cache
+    global_ids = Counter(element.GlobalId for element in elements)
+    cached = geometry_cache.load(content_hash)
+    if cached:
+        uncached = []
+        for element in elements:
+            if global_ids[element.GlobalId] == 1 and element.GlobalId in cached:
+                _volumes[element.id()], _areas[element.id()] = cached[element.GlobalId]
+            else:
+                uncached.append(element)
+        logger.info(
+            f"Reused cached geometry of {len(elements) - len(uncached)} elements"
+        )
+        elements = uncached
+
+    unit_scale = ifcopenshell.util.unit.calculate_unit_scale(ifc_file)
+    # Elements waiting on the tessellation of another instance of their shape
+    pending = {}
+    to_tessellate = []
+    for element in elements:
+        key = shape_key(element)
+        if key in pending:
+            pending[key].append(element)
+            continue
+        quantities = _shapes.get(key) if key else None
+        if quantities is None:
+            quantities = analytic_quantities(element, unit_scale)
+        if quantities is None:
+            to_tessellate.append(element)
+            quantities = (None, None)
+            if key:
+                pending[key] = []
+        elif key:
+            _shapes[key] = quantities
+        _volumes[element.id()], _areas[element.id()] = quantities
+
+    logger.info(
+        f"Computed {len(elements) - len(to_tessellate)} element volumes without tessellation"
+    )
+    if to_tessellate:
+        logger.info(
+            f"Tessellating {len(to_tessellate)} elements using {GEOMETRY_THREADS} threads"
+        )
+        iterator = ifcopenshell.geom.iterator(
+            get_settings(), ifc_file, GEOMETRY_THREADS, include=to_tessellate
+        )
+        try:
+            if iterator.initialize():
+                while True:
+                    shape = iterator.get()
+                    _volumes[shape.id], _areas[shape.id] = mesh_quantities(
+                        shape.geometry
+                    )
+                    if not iterator.next():
+                        break
+        except RuntimeError as e:
+            logger.error(f"Error processing geometry: {e}")
+
+        # Share each tessellated shape with the instances that were held back
+        for element in to_tessellate:
+            key = shape_key(element)
+            if key not in pending:
+                continue
+            quantities = (_volumes[element.id()], _areas[element.id()])
+            _shapes[key] = quantities
+            for instance in pending[key]:
+                _volumes[instance.id()], _areas[instance.id()] = quantities
+
+    failed = sum(1 for volume in _volumes.values() if volume is None)
+    if failed:
+        logger.warning(f"No geometry produced for {failed} elements")
+
+    if content_hash:
+        geometry_cache.store(
+            content_hash,
+            {
+                element.GlobalId: (_volumes[element.id()], _areas[element.id()])
+                for element in elements
+                if global_ids[element.GlobalId] == 1
+            },
+        )
+
+    return {key: (_volumes[key], _areas[key]) for key in _volumes}
+
+
+def _get_quantities(element):
+    if _model is not None and element.id() in _volumes and element.file == _model:
+        return _volumes[element.id()], _areas[element.id()]
+
+    # Not part of the prefetched batch, compute on its own
+    key = shape_key(element) if _model is not None and element.file == _model else None
+    if key in _shapes:
+        return _shapes[key]
+    quantities = analytic_quantities(element)
+    if quantities is None:
+        try:
+            shape = ifcopenshell.geom.create_shape(get_settings(), element)
+        except RuntimeError as e:
+            diagnostics.report(
+                "Geometry", "Error processing geometry", element, e, "ERROR"
+            )
+            return None, None
+        quantities = mesh_quantities(shape.geometry)
+    if key:
+        _shapes[key] = quantities
+    return quantities
+
+
+def get_volume(element):
+    """Return the volume of an element's geometry, or None"""
+    return _get_quantities(element)[0]
+
+
+def get_area(element):
+    """Return the surface area of an element's geometry, or None"""
+    return _get_quantities(element)[1]
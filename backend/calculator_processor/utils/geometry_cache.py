@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+
+from loguru import logger
+
+# Local cache of element volumes/areas, keyed by IFC content hash and GlobalId
+GEOMETRY_CACHE_ENABLED = (
+    os.environ.get("GEOMETRY_CACHE_ENABLED", "true").lower() == "true"
+)
+GEOMETRY_CACHE_DIR = os.environ.get(
+    "GEOMETRY_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ec_geometry_cache")
+)
+# Upper bound on cached element results; least recently used models are evicted first
+GEOMETRY_CACHE_MAX_ENTRIES = int(
+    os.environ.get("GEOMETRY_CACHE_MAX_ENTRIES", 2_000_000)
+)
+
+# Bump when the way volumes or areas are computed changes
+GEOMETRY_CACHE_VERSION = 1
+
+
+def _connect():
+    os.makedirs(GEOMETRY_CACHE_DIR, exist_ok=True)
+    connection = sqlite3.connect(
+        os.path.join(GEOMETRY_CACHE_DIR, "geometry.sqlite3"), timeout=30
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS models ("
+        "model_key TEXT PRIMARY KEY, last_used REAL NOT NULL, entries INTEGER NOT NULL)"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS quantities ("
+        "model_key TEXT NOT NULL, global_id TEXT NOT NULL, volume REAL, area REAL, "
+        "PRIMARY KEY (model_key, global_id))"
+    )
+    return connection
+
+
+def _model_key(content_hash):
+    return f"v{GEOMETRY_CACHE_VERSION}:{content_hash}"
+
+
+def load(content_hash):
+    """Return the cached {GlobalId: (volume, area)} of a model"""
+    if not GEOMETRY_CACHE_ENABLED or not content_hash:
+        return {}
+
+    model_key = _model_key(content_hash)
+    try:
+        with closing(_connect()) as connection, connection:
+            rows = connection.execute(
+                "SELECT global_id, volume, area FROM quantities WHERE model_key = ?",
+                (model_key,),
+            ).fetchall()
+            connection.execute(
+                "UPDATE models SET last_used = ? WHERE model_key = ?",
+                (time.time(), model_key),
+            )
+    except sqlite3.Error as e:
+        logger.warning(f"Error reading geometry cache: {e}")
+        return {}
+
+    logger.info(f"Loaded {len(rows)} cached element geometries")
+    return {global_id: (volume, area) for global_id, volume, area in rows}
+
+
+def store(content_hash, results):
+    """Add {GlobalId: (volume, area)} results of a model and evict old models"""
+    if not GEOMETRY_CACHE_ENABLED or not content_hash or not results:
+        return False
+
+    model_key = _model_key(content_hash)
+    try:
+        with closing(_connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO quantities VALUES (?, ?, ?, ?)",
+                [
+                    (model_key, global_id, volume, area)
+                    for global_id, (volume, area) in results.items()
+                ],
+            )
+            (entries,) = connection.execute(
+                "SELECT COUNT(*) FROM quantities WHERE model_key = ?", (model_key,)
+            ).fetchone()
+            connection.execute(
+                "INSERT OR REPLACE INTO models VALUES (?, ?, ?)",
+                (model_key, time.time(), entries),
+            )
+            _evict(connection, model_key)
+    except sqlite3.Error as e:
+        logger.warning(f"Error writing geometry cache: {e}")
+        return False
+    return True
+
+
+def _evict(connection, current_key):
+    """Drop least recently used models until the cache is within its size limit"""
+    (total,) = connection.execute(
+        "SELECT COALESCE(SUM(entries), 0) FROM models"
+    ).fetchone()
+    while total > GEOMETRY_CACHE_MAX_ENTRIES:
+        row = connection.execute(
+            "SELECT model_key, entries FROM models WHERE model_key != ? "
+            "ORDER BY last_used LIMIT 1",
+            (current_key,),
+        ).fetchone()
+        if row is None:
+            break
+        model_key, entries = row
+        connection.execute("DELETE FROM quantities WHERE model_key = ?", (model_key,))
+        connection.execute("DELETE FROM models WHERE model_key = ?", (model_key,))
+        logger.info(f"Evicted {entries} cached geometries of {model_key}")
+        total -= entries
@@ -0,0 +1,245 @@
+import os
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+try:
+    import hnswlib
+except ImportError:  # approximate search is optional, partitions stay exact
+    hnswlib = None
+
+# Columns of the material database CSV
+COLUMNS = [
+    "material_name",
+    "element_type",
+    "material_type",
+    "volume",
+    "area",
+    "layer_count",
+    "material_description",
+    "ec_per_kg",
+    "density",
+]
+
+# Rows allocated for the embeddings of a new store
+INITIAL_CAPACITY = 64
+
+# Partitions larger than this are searched with an approximate nearest
+# neighbour graph when hnswlib is installed, smaller ones exactly
+MATERIAL_ANN_THRESHOLD = int(os.environ.get("MATERIAL_ANN_THRESHOLD", 20_000))
+# Size of the candidate lists of the graph, higher is more accurate and slower
+MATERIAL_ANN_EF = int(os.environ.get("MATERIAL_ANN_EF", 64))
+
+
+def normalize(embeddings):
+    """Return float32 embeddings scaled to unit length, zero rows unchanged"""
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
+def _grown(buffer, used, needed):
+    """Return buffer, or a copy of its used rows with room for needed rows"""
+    capacity = len(buffer)
+    if needed <= capacity:
+        return buffer
+    while capacity < needed:
+        capacity *= 2
+    grown = np.empty((capacity,) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:used] = buffer[:used]
+    return grown
+
+
+class Partition:
+    """Normalized embeddings of a set of materials, for similarity search.
+
+    Cosine similarity is the dot product of the normalized embeddings. Up to
+    MATERIAL_ANN_THRESHOLD materials the best matches are found exactly;
+    above it a hnswlib graph is built once and then extended as materials are
+    added.
+    """
+
+    def __init__(self, dimension):
+        self.size = 0
+        # Store rows and normalized embeddings, one per material
+        self._rows = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        self._vectors = np.empty((INITIAL_CAPACITY, dimension), dtype=np.float32)
+        self._graph = None
+
+    def __len__(self):
+        return self.size
+
+    def add(self, rows, vectors):
+        """Add store rows with their normalized embeddings"""
+        start, end = self.size, self.size + len(rows)
+        self._rows = _grown(self._rows, start, end)
+        self._vectors = _grown(self._vectors, start, end)
+        self._rows[start:end] = rows
+        self._vectors[start:end] = vectors
+        self.size = end
+
+        if self._graph is not None:
+            if end > self._graph.get_max_elements():
+                self._graph.resize_index(len(self._vectors))
+            self._graph.add_items(vectors, np.arange(start, end))
+        elif hnswlib is not None and end > MATERIAL_ANN_THRESHOLD:
+            self._build_graph()
+
+    def _build_graph(self):
+        self._graph = hnswlib.Index(space="ip", dim=self._vectors.shape[1])
+        self._graph.init_index(max_elements=len(self._vectors))
+        self._graph.add_items(self._vectors[: self.size], np.arange(self.size))
+        logger.info(f"Built approximate search graph of {self.size} materials")
+
+    def search(self, queries, k=1):
+        """Return the store rows and similarities of the k best matches of
+        each normalized query, best first, as (queries, k) arrays"""
+        k = min(k, self.size)
+        if self._graph is not None:
+            self._graph.set_ef(max(MATERIAL_ANN_EF, k))
+            positions, distances = self._graph.knn_query(queries, k=k)
+            return self._rows[positions.astype(np.int64)], 1 - distances
+
+        similarities = queries @ self._vectors[: self.size].T
+        if k == 1:
+            positions = similarities.argmax(axis=1)[:, None]
+        else:
+            positions = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            order = np.take_along_axis(similarities, positions, axis=1)
+            positions = np.take_along_axis(positions, (-order).argsort(axis=1), axis=1)
+        return (
+            self._rows[positions],
+            np.take_along_axis(similarities, positions, axis=1),
+        )
+
+
+class MaterialStore:
+    """Materials of the embedding database and their embeddings.
+
+    Records are kept in an append-only list and embeddings in a NumPy buffer
+    whose capacity doubles when it is full, with a dict from material name to
+    row. Adding a material and checking for one are amortized O(1); a
+    DataFrame is only built to export the database.
+
+    Normalized copies of the embeddings are also kept in one Partition of all
+    materials and one per element type, which are extended as materials are
+    added, so a search only scans the materials it can match.
+    """
+
+    def __init__(self):
+        self.records = []
+        # material name -> row of its first record
+        self.rows = {}
+        self._buffer = None
+        self._all = None
+        # element type -> Partition of its materials
+        self.partitions = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, material_name):
+        return material_name in self.rows
+
+    @property
+    def embeddings(self):
+        """Embeddings of the records, a view of the filled rows of the buffer"""
+        if self._buffer is None:
+            return np.empty((0, 0))
+        return self._buffer[: len(self.records)]
+
+    def _reserve(self, count, dimension, dtype):
+        """Make room for count more embeddings, doubling the buffer as needed"""
+        needed = len(self.records) + count
+        if self._buffer is None:
+            self._buffer = np.empty(
+                (max(needed, INITIAL_CAPACITY), dimension), dtype=dtype
+            )
+            self._all = Partition(dimension)
+            return
+        self._buffer = _grown(self._buffer, len(self.records), needed)
+
+    def _index(self, start, records, embeddings):
+        """Add the normalized embeddings of records from row start to the
+        partitions"""
+        vectors = normalize(embeddings)
+        rows = np.arange(start, start + len(records))
+        self._all.add(rows, vectors)
+
+        by_type = {}
+        for position, record in enumerate(records):
+            by_type.setdefault(record.get("element_type"), []).append(position)
+        for element_type, positions in by_type.items():
+            if element_type not in self.partitions:
+                self.partitions[element_type] = Partition(vectors.shape[1])
+            self.partitions[element_type].add(rows[positions], vectors[positions])
+
+    def append(self, record, embedding):
+        """Add a material record with its embedding and return its row"""
+        embedding = np.asarray(embedding)
+        self._reserve(1, embedding.shape[-1], embedding.dtype)
+        row = len(self.records)
+        self._buffer[row] = embedding
+        self.records.append(record)
+        self.rows.setdefault(record.get("material_name"), row)
+        self._index(row, [record], embedding)
+        return row
+
+    def extend(self, records, embeddings):
+        """Add material records with their embeddings, one row each"""
+        if not records:
+            return
+        embeddings = np.asarray(embeddings)
+        self._reserve(len(records), embeddings.shape[-1], embeddings.dtype)
+        start = len(self.records)
+        self._buffer[start : start + len(records)] = embeddings
+        for row, record in enumerate(records, start):
+            self.records.append(record)
+            self.rows.setdefault(record.get("material_name"), row)
+        self._index(start, records, embeddings)
+
+    def search(self, query_embeddings, element_type=None, k=1):
+        """Return the rows and cosine similarities of the k best matches of
+        each query embedding, best first, as (queries, k) arrays.
+
+        Only materials of element_type are searched, or all of them when it
+        is None; an element type without materials has no matches.
+        """
+        if element_type is None:
+            partition = self._all
+        else:
+            partition = self.partitions.get(element_type)
+        queries = normalize(query_embeddings)
+        if partition is None or len(partition) == 0:
+            return (
+                np.empty((len(queries), 0), dtype=np.int64),
+                np.empty((len(queries), 0), dtype=np.float32),
+            )
+        return partition.search(queries, k)
+
+    def material_name(self, row):
+        return self.records[row].get("material_name")
+
+    @classmethod
+    def from_dataframe(cls, df, embeddings):
+        """Build a store from the database CSV and embeddings as loaded"""
+        store = cls()
+        records = df.to_dict("records")
+        if len(records) != len(embeddings):
+            logger.warning(
+                f"Material database has {len(records)} records but "
+                f"{len(embeddings)} embeddings, keeping the first "
+                f"{min(len(records), len(embeddings))}"
+            )
+            count = min(len(records), len(embeddings))
+            records, embeddings = records[:count], embeddings[:count]
+        store.extend(records, embeddings)
+        return store
+
+    def to_dataframe(self):
+        """Return the records as a DataFrame, for export"""
+        if not self.records:
+            return pd.DataFrame(columns=COLUMNS)
+        return pd.DataFrame(self.records)
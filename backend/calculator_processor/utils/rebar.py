@@ -0,0 +1,188 @@
+from functools import lru_cache
+
+import numpy as np
+from loguru import logger
+
+from . import diagnostics
+
+# Rebar volumes (m³) of the elements of a category, from the "Rebar Set" and
+# "Dimensions" property sets. Each distinct spec string is parsed once; the
+# volume formulas are evaluated over arrays of the whole category.
+
+# Bar positions of a beam: (top, bottom) pairs at the left, middle and right thirds
+BEAM_BARS = (
+    ("TopLeft", "BottomLeft"),
+    ("TopMiddle", "BottomMiddle"),
+    ("TopRight", "BottomRight"),
+)
+# Bar layers of a footing, given as diameter and spacing
+FOOTING_BARS = (
+    "BottomDistribution",
+    "BottomMain",
+    "TopDistribution",
+    "TopMain",
+    "SideBar",
+    "Stirrups",
+)
+# Concrete cover of footing bars, in m
+FOOTING_COVER = 50 / 1000
+
+
+@lru_cache(maxsize=None)
+def parse_bars(spec):
+    """Return (count, diameter in mm) of a bar spec such as "3H16", or None"""
+    try:
+        count, diameter = spec.split("H")
+        return int(count), int(diameter)
+    except (AttributeError, ValueError):
+        logger.error(f"Invalid rebar spec '{spec}'")
+        return None
+
+
+@lru_cache(maxsize=None)
+def parse_spacing(spec):
+    """Return (diameter in mm, spacing in mm) of a spec such as "H12-150", or None.
+
+    Stirrup specs carry a third part ("H10-200-2"), which is ignored.
+    """
+    try:
+        parts = spec.split("-")
+        return int(parts[0][1:3]), int(parts[1])
+    except (AttributeError, ValueError, IndexError):
+        logger.error(f"Invalid rebar spec '{spec}'")
+        return None
+
+
+def _dimension(category, element, dimensions, *names):
+    """Return the first given dimension in m, or NaN"""
+    for name in names:
+        value = dimensions.get(name)
+        if value is not None:
+            return value / 1000
+    diagnostics.report(category, "Dimension not found", element, names[0], "ERROR")
+    return np.nan
+
+
+def _rebar_sets(elements, index, category):
+    """Yield (position, element, Rebar Set, Dimensions) of the elements with a rebar set"""
+    for i, element in enumerate(elements):
+        psets = index.get_psets(element)
+        rebar_set = psets.get("Rebar Set")
+        if rebar_set is None:
+            diagnostics.report(category, "Rebar set not found", element, level="ERROR")
+        dimensions = psets.get("Dimensions")
+        if dimensions is None:
+            diagnostics.report(category, "Dimensions not found", element, level="ERROR")
+            dimensions = {}
+        if rebar_set:
+            yield i, element, rebar_set, dimensions
+
+
+def _volumes(volumes):
+    """Replace the volumes of elements with incomplete data by 0"""
+    return np.where(np.isfinite(volumes), volumes, 0.0)
+
+
+def beam_volumes(beams, index):
+    """Return the rebar volume of each beam, bars running a third of its length"""
+    lengths = np.full(len(beams), np.nan)
+    # Bar count and diameter of each position, as [third, top/bottom]
+    counts = np.full((len(beams), len(BEAM_BARS), 2), np.nan)
+    diameters = np.full((len(beams), len(BEAM_BARS), 2), np.nan)
+    for i, beam, rebar_set, dimensions in _rebar_sets(beams, index, "Beam"):
+        lengths[i] = _dimension("Beam", beam, dimensions, "Length")
+        for j, positions in enumerate(BEAM_BARS):
+            for k, position in enumerate(positions):
+                bars = parse_bars(rebar_set.get(position))
+                if bars:
+                    counts[i, j, k], diameters[i, j, k] = bars
+
+    areas = counts * 3.14 * ((diameters / 2000) ** 2)
+    third_areas = areas[:, :, 0] + areas[:, :, 1]
+    return _volumes((third_areas * (1 / 3) * lengths[:, None]).sum(axis=1))
+
+
+def _main_bar_volumes(elements, index, category, *length_names):
+    """Return the volume of MainRebar bars running the given dimension"""
+    lengths = np.full(len(elements), np.nan)
+    counts = np.full(len(elements), np.nan)
+    diameters = np.full(len(elements), np.nan)
+    for i, element, rebar_set, dimensions in _rebar_sets(elements, index, category):
+        spec = rebar_set.get("MainRebar")
+        if spec is None:
+            diagnostics.report(category, "MainRebar not found", element, level="ERROR")
+            continue
+        lengths[i] = _dimension(category, element, dimensions, *length_names)
+        bars = parse_bars(spec)
+        if bars:
+            counts[i], diameters[i] = bars
+
+    return _volumes(lengths * counts * 3.14 * ((diameters / 2000) ** 2))
+
+
+def column_volumes(columns, index):
+    """Return the rebar volume of each column, main bars over its height"""
+    return _main_bar_volumes(columns, index, "Column", "Height", "Length")
+
+
+def pile_volumes(piles, index):
+    """Return the rebar volume of each pile, main bars over its length"""
+    return _main_bar_volumes(piles, index, "Pile", "Length")
+
+
+def _bar_count(length, spacing):
+    """Number of bars at a spacing in mm over lengths in m"""
+    return np.floor(length / (spacing / 1000)) + 1
+
+
+def footing_volumes(footings, index):
+    """Return the rebar volume of each footing.
+
+    Bottom and top meshes, side bars and stirrups, all within the concrete
+    cover. Bar counts follow from the spacings.
+    """
+    size = np.full((len(footings), 3), np.nan)
+    diameters = np.full((len(footings), len(FOOTING_BARS)), np.nan)
+    spacings = np.full((len(footings), len(FOOTING_BARS)), np.nan)
+    for i, footing, rebar_set, dimensions in _rebar_sets(footings, index, "Footing"):
+        size[i] = (
+            _dimension("Footing", footing, dimensions, "Length"),
+            _dimension("Footing", footing, dimensions, "Width"),
+            _dimension("Footing", footing, dimensions, "Foundation Thickness"),
+        )
+        for j, name in enumerate(FOOTING_BARS):
+            bars = parse_spacing(rebar_set.get(name))
+            if bars:
+                diameters[i, j], spacings[i, j] = bars
+
+    length, breadth, height = (size - 2 * FOOTING_COVER).T
+    area = dict(zip(FOOTING_BARS, (3.14 * ((diameters / 2000) ** 2)).T))
+    spacing = dict(zip(FOOTING_BARS, spacings.T))
+
+    length_count = _bar_count(length, spacing["BottomDistribution"])
+    breadth_count = _bar_count(breadth, spacing["BottomMain"])
+    bottom_vol = (breadth_count * length * area["BottomDistribution"]) + (
+        length_count * breadth * area["BottomMain"]
+    )
+
+    length_count = _bar_count(length, spacing["TopDistribution"])
+    breadth_count = _bar_count(breadth, spacing["TopMain"])
+    top_vol = (breadth_count * length * area["TopDistribution"]) + (
+        length_count * breadth * area["TopMain"]
+    )
+
+    # Side bars on all four faces, along the top bars and up the height
+    height_count = _bar_count(height, spacing["SideBar"])
+    side_vol = (
+        (2 * (length_count * height * area["SideBar"]))
+        + (2 * (breadth_count * height * area["SideBar"]))
+        + (2 * (height_count * length * area["SideBar"]))
+        + (2 * (height_count * breadth * area["SideBar"]))
+    )
+
+    perimeter = (2 * breadth) + (2 * height)
+    stirrups_vol = (
+        _bar_count(length, spacing["Stirrups"]) * perimeter * area["Stirrups"]
+    )
+
+    return _volumes(top_vol + bottom_vol + side_vol + stirrups_vol)
@@ -16,7 +16,6 @@ import json
 from contextlib import contextmanager
 import tempfile
 import ifcopenshell
-from collections import Counter
 import io
 import openpyxl
 from openpyxl.utils import get_column_letter
@@ -161,6 +160,21 @@ class ProjectBreakdown(BaseModel):
     version: str
 
 
+# Fields of the ec_elements documents returned by the API, one document per
+# element row of an EC breakdown
+ELEMENT_FIELDS = {
+    "_id": 0,
+    "building_system": 1,
+    "element": 1,
+    "element_id": 1,
+    "ifc_type": 1,
+    "storey": 1,
+    "units": 1,
+    "ec": 1,
+    "materials": 1,
+}
+
+
 class ProjectBasicInfo(BaseModel):
     project_id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     project_name: str
@@ -214,6 +228,13 @@ class MaterialCreate(BaseModel):
     database_source: Literal["Custom", "System"] = "Custom"
 
 
+async def bump_material_catalog_version():
+    """Tell the calculator workers that their cached material catalog is outdated"""
+    await app.mongodb.catalog_versions.update_one(
+        {"_id": "materials"}, {"$inc": {"version": 1}}, upsert=True
+    )
+
+
 @contextmanager
 def temp_ifc_file(content: bytes):
     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".ifc")
@@ -291,6 +312,7 @@ async def upload_material_and_queue(
     result = await app.mongodb.materials.insert_one(
         new_material.dict(by_alias=True, exclude={"id"})
     )
+    await bump_material_catalog_version()
 
     # Retrieve created material
     created_material = await app.mongodb.materials.find_one({"_id": result.inserted_id})
@@ -437,25 +459,43 @@ async def get_building_elements(
             )
 
         # Get the EC breakdown data from MongoDB
-        ec_breakdown = await app.mongodb.ec_breakdown.find_one({"_id": ec_breakdown_id})
+        ec_breakdown = await app.mongodb.ec_breakdown.find_one(
+            {"_id": ec_breakdown_id}, {"element_count": 1, "excel_data": 1}
+        )
 
         if not ec_breakdown:
             raise HTTPException(status_code=404, detail="EC breakdown data not found")
 
-        # Extract the excel_data
-        excel_data_rows = ec_breakdown.get("excel_data", [])
+        if "element_count" in ec_breakdown:
+            # The excel rows are the element rows expanded per material
+            cursor = app.mongodb.ec_elements.find(
+                {"ec_breakdown_id": ec_breakdown_id}, ELEMENT_FIELDS
+            ).sort("position", 1)
+            rows = [
+                [
+                    element["element_id"],
+                    element["ifc_type"],
+                    element["element"],
+                    material["material"],
+                    material["ec"],
+                    material["material_mass"],
+                    element["units"],
+                ]
+                async for element in cursor
+                for material in element["materials"]
+            ]
+        else:
+            # Extract the excel_data
+            excel_data_rows = ec_breakdown.get("excel_data", [])
 
-        if (
-            not excel_data_rows or len(excel_data_rows) <= 1
-        ):  # Check if there's data beyond headers
+            # Skip the headers
+            rows = excel_data_rows[1:]
+
+        if not rows:  # Check if there's data beyond headers
             raise HTTPException(
                 status_code=404, detail="No building elements data found"
             )
 
-        # Get headers and content
-        headers = excel_data_rows[0]
-        rows = excel_data_rows[1:]
-
         # Get materials data
         materials_data = await app.mongodb.materials.find().to_list(1000)
 
@@ -1008,54 +1048,50 @@ async def get_materials(
         ec_breakdown_id = ifc_version.get("ec_breakdown_id")
         if not ec_breakdown_id:
             return []
-        # Get the breakdown document
+        # Get the material counts of the breakdown document
         breakdown = await app.mongodb.ec_breakdown.find_one(
-            {"_id": ObjectId(ec_breakdown_id)}
+            {"_id": ObjectId(ec_breakdown_id)}, {"material_counts": 1}
         )
         if not breakdown:
             return []  # Breakdown not found
 
-        if "material_counts" in breakdown and breakdown["material_counts"]:
-            material_counts = breakdown["material_counts"]
-
-            # Get all materials that are in the count dictionary
-            materials = await app.mongodb.materials.find(
-                {"specified_material": {"$in": list(material_counts.keys())}}
-            ).to_list(1000)
-
-            # Add counts to each material
-            for material in materials:
-                material["_id"] = str(material["_id"])
-                material_name = material["specified_material"]
-                material["count"] = material_counts.get(material_name, 0)
-
-            return materials
-        # Use Counter to track material frequencies
-        material_counter = Counter()
-
-        if "breakdown" in breakdown and "ec_breakdown" in breakdown["breakdown"]:
-            for category in breakdown["breakdown"]["ec_breakdown"]:
-                if "elements" in category:
-                    for element in category["elements"]:
-                        if "materials" in element:
-                            for material in element["materials"]:
-                                if "material" in material:
-                                    material_counter[material["material"]] += 1
-
-        if not material_counter:
-            return []  # No material IDs found in breakdown
+        material_counts = breakdown.get("material_counts")
+        if not material_counts:
+            # Breakdowns stored before the calculator counted materials:
+            # count the breakdown entries in MongoDB
+            cursor = await app.mongodb.ec_breakdown.aggregate(
+                [
+                    {"$match": {"_id": ObjectId(ec_breakdown_id)}},
+                    {"$unwind": "$breakdown.ec_breakdown"},
+                    {"$unwind": "$breakdown.ec_breakdown.elements"},
+                    {"$unwind": "$breakdown.ec_breakdown.elements.materials"},
+                    {
+                        "$group": {
+                            "_id": "$breakdown.ec_breakdown.elements.materials.material",
+                            "count": {"$sum": 1},
+                        }
+                    },
+                ]
+            )
+            material_counts = {
+                entry["_id"]: entry["count"]
+                for entry in await cursor.to_list(None)
+                if entry["_id"] is not None
+            }
 
-        print(dict(material_counter))
+        if not material_counts:
+            return []  # No materials found in breakdown
 
-        # Query for materials using the collected IDs
+        # Get all materials that are in the count dictionary
         materials = await app.mongodb.materials.find(
-            {"specified_material": {"$in": list(material_counter.keys())}}
+            {"specified_material": {"$in": list(material_counts.keys())}}
         ).to_list(1000)
 
-        # Convert ObjectId to string for each material and add count
+        # Add counts to each material
         for material in materials:
             material["_id"] = str(material["_id"])
-            material["count"] = material_counter[material["specified_material"]]
+            material_name = material["specified_material"]
+            material["count"] = material_counts.get(material_name, 0)
 
         return materials
 
@@ -1103,6 +1139,7 @@ async def upload_material(
     result = await app.mongodb.materials.insert_one(
         new_material.dict(by_alias=True, exclude={"id"})
     )
+    await bump_material_catalog_version()
 
     # Retrieve created material
     created_material = await app.mongodb.materials.find_one({"_id": result.inserted_id})
@@ -1142,6 +1179,8 @@ async def delete_material(
     if result.deleted_count == 0:
         raise HTTPException(status_code=500, detail="Failed to delete material")
 
+    await bump_material_catalog_version()
+
     return {
         "success": True,
         "message": f"Material '{material.get('specified_material')}' deleted successfully",
@@ -1313,18 +1352,19 @@ async def upload_ifc(
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
 
 
-# Get EC breakdown and ec value
-@app.get("/projects/{project_id}/get_breakdown", response_model=ProjectBreakdown)
-async def get_breakdown(
-    project_id: str,
-    version: str = None,
-    calculation_type: Optional[str] = Query(
-        "standard",
-        description="Type of calculation to retrieve: 'standard' or 'ai_enhanced'",
-    ),
+# Look up the completed calculation of a project version
+async def get_completed_version(
+    project_id: str, version: Optional[str], calculation_type: str, projection=None
 ):
-
-    project = await app.mongodb.projects.find_one({"_id": ObjectId(project_id)})
+    """
+    Return (project, version number, version document, EC breakdown id) of a
+    completed calculation, the current version's if version isn't given.
+    Raises the HTTPException to respond with when the project, version or
+    calculation doesn't exist or the calculation isn't completed.
+    """
+    project = await app.mongodb.projects.find_one(
+        {"_id": ObjectId(project_id)}, projection
+    )
 
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
@@ -1334,10 +1374,6 @@ async def get_breakdown(
         raise HTTPException(status_code=400, detail="Version not found")
     ifc_data = project["ifc_versions"].get(version_number, {})
 
-    # Retrieve stored EC values and breakdowns
-    total_ec = ifc_data.get("total_ec", 0)
-    gfa = ifc_data.get("gfa", 0)
-
     ec_breakdown_id = (
         ifc_data.get("ec_breakdown_id")
         if calculation_type == "standard"
@@ -1348,7 +1384,6 @@ async def get_breakdown(
         if calculation_type == "standard"
         else ifc_data.get("ai_calculation_status")
     )
-    print(ec_breakdown_id)
 
     if not ec_breakdown_id:
         raise HTTPException(
@@ -1361,23 +1396,237 @@ async def get_breakdown(
             status_code=400,
             detail=f"{calculation_type.capitalize()} calculation for version {version_number} is not completed. Current status: {calculation_status}",
         )
+
+    return project, version_number, ifc_data, ec_breakdown_id
+
+
+# Get EC breakdown and ec value
+@app.get("/projects/{project_id}/get_breakdown", response_model=ProjectBreakdown)
+async def get_breakdown(
+    project_id: str,
+    version: str = None,
+    calculation_type: Optional[str] = Query(
+        "standard",
+        description="Type of calculation to retrieve: 'standard' or 'ai_enhanced'",
+    ),
+    include_elements: bool = Query(
+        True,
+        description="Whether to include the element rows of each building system. "
+        "Use /projects/{project_id}/elements to page through them instead",
+    ),
+):
+
+    project, version_number, ifc_data, ec_breakdown_id = await get_completed_version(
+        project_id, version, calculation_type
+    )
+
+    # Retrieve stored EC values and breakdowns
+    total_ec = ifc_data.get("total_ec", 0)
+    gfa = ifc_data.get("gfa", 0)
+
     ec_breakdown_data = await app.mongodb.ec_breakdown.find_one(
-        {"_id": ec_breakdown_id}
+        {"_id": ec_breakdown_id}, {"summary": 1, "breakdown": 1, "element_count": 1}
     )
+    breakdown = ec_breakdown_data["breakdown"]
+    elements = {
+        building_system["category"]: building_system["elements"]
+        for building_system in breakdown["ec_breakdown"]
+    }
+    if not include_elements:
+        for building_system_elements in elements.values():
+            building_system_elements.clear()
+    elif "element_count" in ec_breakdown_data:
+        # Element rows are stored in their own collection
+        cursor = app.mongodb.ec_elements.find(
+            {"ec_breakdown_id": ec_breakdown_id}, ELEMENT_FIELDS
+        ).sort("position", 1)
+        async for element in cursor:
+            elements[element.pop("building_system")].append(element)
 
     print("ec breakdown summary is,", ec_breakdown_data["summary"])
-    print("ec_breakdown_data[breakdown] is,", ec_breakdown_data["breakdown"])
     return ProjectBreakdown(
         project_id=str(project["_id"]),
         gfa=gfa,
         summary=ec_breakdown_data["summary"],
-        ec_breakdown=ec_breakdown_data["breakdown"],
+        ec_breakdown=breakdown,
         # maybe add the matched material..
         last_calculated=project.get("last_calculated", datetime.now()),
         version=version_number,
     )
 
 
+# Get a page of the element rows of a calculation, filtered in MongoDB
+@app.get("/projects/{project_id}/elements", response_model=Dict[str, Any])
+async def get_elements(
+    project_id: str,
+    version: Optional[str] = Query(
+        None,
+        description="IFC version to analyze. If not provided, uses current version",
+    ),
+    calculation_type: Optional[str] = Query(
+        "standard",
+        description="Type of calculation to retrieve: 'standard' or 'ai_enhanced'",
+    ),
+    building_system: Optional[Literal["Substructure", "Superstructure"]] = Query(
+        None, description="Building system to include"
+    ),
+    category: Optional[List[str]] = Query(
+        None, description="Element categories to include, e.g. 'Slab'"
+    ),
+    ifc_type: Optional[List[str]] = Query(None, description="IFC types to include"),
+    storey: Optional[List[str]] = Query(None, description="Storeys to include"),
+    material: Optional[List[str]] = Query(
+        None, description="Only include elements with any of these materials"
+    ),
+    skip: int = Query(0, ge=0, description="Number of matching elements to skip"),
+    limit: int = Query(
+        100, ge=1, le=1000, description="Maximum number of elements to return"
+    ),
+):
+    """
+    Return the element rows of a calculation in breakdown order, one page at
+    a time. Filtering, counting and paging run in MongoDB.
+    """
+    _, version_number, _, ec_breakdown_id = await get_completed_version(
+        project_id, version, calculation_type, {"current_version": 1, "ifc_versions": 1}
+    )
+
+    ec_breakdown = await app.mongodb.ec_breakdown.find_one(
+        {"_id": ec_breakdown_id}, {"element_count": 1}
+    )
+    if not ec_breakdown or "element_count" not in ec_breakdown:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Element rows are not stored for version {version_number}, recalculate it to page through its elements",
+        )
+
+    query = {"ec_breakdown_id": ec_breakdown_id}
+    if building_system:
+        query["building_system"] = building_system
+    for field, values in (
+        ("element", category),
+        ("ifc_type", ifc_type),
+        ("storey", storey),
+        ("materials.material", material),
+    ):
+        if values:
+            query[field] = {"$in": values}
+
+    total = await app.mongodb.ec_elements.count_documents(query)
+    cursor = (
+        app.mongodb.ec_elements.find(query, ELEMENT_FIELDS)
+        .sort("position", 1)
+        .skip(skip)
+        .limit(limit)
+    )
+    elements = await cursor.to_list(None)
+
+    return {
+        "project_id": project_id,
+        "version": version_number,
+        "calculation_type": calculation_type,
+        "total": total,
+        "skip": skip,
+        "limit": limit,
+        "elements": elements,
+    }
+
+
+# Dimensions of the EC cube stored with each EC breakdown
+EC_CUBE_DIMENSIONS = ("storey", "category", "ifc_type", "material_family")
+
+
+# Get EC and mass sliced by storey, category, IFC type and material family
+@app.get("/projects/{project_id}/ec_cube", response_model=Dict[str, Any])
+async def get_ec_cube(
+    project_id: str,
+    version: Optional[str] = Query(
+        None,
+        description="IFC version to analyze. If not provided, uses current version",
+    ),
+    calculation_type: Optional[str] = Query(
+        "standard",
+        description="Type of calculation to retrieve: 'standard' or 'ai_enhanced'",
+    ),
+    storey: Optional[List[str]] = Query(None, description="Storeys to include"),
+    category: Optional[List[str]] = Query(
+        None, description="Element categories to include, e.g. 'Slab'"
+    ),
+    ifc_type: Optional[List[str]] = Query(None, description="IFC types to include"),
+    material_family: Optional[List[str]] = Query(
+        None, description="Material families to include, e.g. 'Concrete'"
+    ),
+    group_by: Optional[List[str]] = Query(
+        None,
+        description="Dimensions to aggregate by. If not provided, uses all of "
+        "storey, category, ifc_type and material_family",
+    ),
+):
+    """
+    Return the EC and mass of a calculation aggregated over the requested
+    dimensions, after filtering the cells of the EC cube.
+    The aggregation runs in MongoDB, the breakdown document is never loaded.
+    """
+    group_by = list(EC_CUBE_DIMENSIONS) if group_by is None else group_by
+    invalid = [
+        dimension for dimension in group_by if dimension not in EC_CUBE_DIMENSIONS
+    ]
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid group_by dimensions {invalid}, expected any of {list(EC_CUBE_DIMENSIONS)}",
+        )
+
+    _, version_number, _, ec_breakdown_id = await get_completed_version(
+        project_id, version, calculation_type, {"current_version": 1, "ifc_versions": 1}
+    )
+
+    filters = {
+        dimension: {"$in": values}
+        for dimension, values in (
+            ("storey", storey),
+            ("category", category),
+            ("ifc_type", ifc_type),
+            ("material_family", material_family),
+        )
+        if values
+    }
+    pipeline = [
+        {"$match": {"_id": ec_breakdown_id}},
+        {"$project": {"_id": 0, "ec_cube": 1}},
+        {"$unwind": "$ec_cube"},
+        {"$replaceRoot": {"newRoot": "$ec_cube"}},
+    ]
+    if filters:
+        pipeline.append({"$match": filters})
+    pipeline += [
+        {
+            "$group": {
+                "_id": {dimension: f"${dimension}" for dimension in group_by} or None,
+                "ec": {"$sum": "$ec"},
+                "mass": {"$sum": "$mass"},
+            }
+        },
+        {"$sort": {"ec": -1}},
+    ]
+
+    cursor = await app.mongodb.ec_breakdown.aggregate(pipeline)
+    cells = [
+        {**(cell["_id"] or {}), "ec": cell["ec"], "mass": cell["mass"]}
+        for cell in await cursor.to_list(None)
+    ]
+
+    return {
+        "project_id": project_id,
+        "version": version_number,
+        "calculation_type": calculation_type,
+        "group_by": group_by,
+        "total_ec": sum(cell["ec"] for cell in cells),
+        "total_mass": sum(cell["mass"] for cell in cells),
+        "cells": cells,
+    }
+
+
 @app.get("/projects/{project_id}/get_project_info", response_model=ProjectBasicInfo)
 async def get_project_info(project_id: str):
     project = await app.mongodb.projects.find_one({"_id": ObjectId(project_id)})
@@ -1,4 +1,8 @@
 import boto3
+import ifcopenshell.api.context
+import ifcopenshell.api.project
+import ifcopenshell.api.root
+import ifcopenshell.api.unit
 import pytest
 import dotenv
 import os
@@ -22,3 +26,33 @@ def s3_client():
         aws_secret_access_key=os.getenv("AWS_SECRET_KEY"),
     )
     return s3
+
+
+@pytest.fixture
+def ifc_model():
+    """
+    Fixture that provides an empty IFC4 model in metres
+    """
+    model = ifcopenshell.api.project.create_file(version="IFC4")
+    ifcopenshell.api.root.create_entity(model, ifc_class="IfcProject")
+    ifcopenshell.api.unit.assign_unit(
+        model, length={"is_metric": True, "raw": "METERS"}
+    )
+    return model
+
+
+@pytest.fixture
+def body_context(ifc_model):
+    """
+    Fixture that provides the Body representation context of ifc_model
+    """
+    model_context = ifcopenshell.api.context.add_context(
+        ifc_model, context_type="Model"
+    )
+    return ifcopenshell.api.context.add_context(
+        ifc_model,
+        context_type="Model",
+        context_identifier="Body",
+        target_view="MODEL_VIEW",
+        parent=model_context,
+    )
@@ -0,0 +1,245 @@
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+
+import main
+
+PROJECT_ID = ObjectId()
+BREAKDOWN_ID = ObjectId()
+AI_BREAKDOWN_ID = ObjectId()
+
+
+def field_values(document, field):
+    """Values of a dotted field, through arrays like MongoDB"""
+    values = [document]
+    for name in field.split("."):
+        found = []
+        for value in values:
+            value = value.get(name) if isinstance(value, dict) else None
+            found.extend(value if isinstance(value, list) else [value])
+        values = found
+    return values
+
+
+def matches(document, query):
+    for field, condition in query.items():
+        values = field_values(document, field)
+        if isinstance(condition, dict):
+            if not any(value in condition["$in"] for value in values):
+                return False
+        elif condition not in values:
+            return False
+    return True
+
+
+def project(document, projection):
+    """Apply an inclusion or exclusion projection"""
+    if not projection:
+        return dict(document)
+    inclusion = any(projection.values())
+    return {
+        field: value
+        for field, value in document.items()
+        if projection.get(field, int(field == "_id" or not inclusion))
+    }
+
+
+class FakeCursor:
+    def __init__(self, documents, projection=None):
+        self.documents = documents
+        self.projection = projection
+
+    def sort(self, field, direction):
+        self.documents.sort(key=lambda document: document[field])
+        if direction < 0:
+            self.documents.reverse()
+        return self
+
+    def skip(self, count):
+        self.documents = self.documents[count:]
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length):
+        return [project(document, self.projection) for document in self.documents]
+
+
+class FakeCollection:
+    """The part of an async pymongo collection the endpoints use"""
+
+    def __init__(self, documents=(), aggregated=()):
+        self.documents = list(documents)
+        # Result of any aggregation, the pipelines run are recorded
+        self.aggregated = list(aggregated)
+        self.pipelines = []
+
+    async def find_one(self, query, projection=None):
+        for document in self.documents:
+            if matches(document, query):
+                return project(document, projection)
+        return None
+
+    def find(self, query, projection=None):
+        return FakeCursor(
+            [document for document in self.documents if matches(document, query)],
+            projection,
+        )
+
+    async def count_documents(self, query):
+        return sum(1 for document in self.documents if matches(document, query))
+
+    async def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return FakeCursor(list(self.aggregated))
+
+
+def element(position, building_system, category, material, breakdown_id=BREAKDOWN_ID):
+    return {
+        "_id": ObjectId(),
+        "ec_breakdown_id": breakdown_id,
+        "position": position,
+        "building_system": building_system,
+        "element": category,
+        "element_id": 100 + position,
+        "ifc_type": f"Ifc{category}",
+        "storey": "Level 1",
+        "ec": 10.0 * position,
+        "materials": [{"material": material, "material_mass": 1.0, "ec": 1.0}],
+    }
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = SimpleNamespace(
+        projects=FakeCollection(
+            [
+                {
+                    "_id": PROJECT_ID,
+                    "current_version": 2,
+                    "ifc_versions": {
+                        "1": {
+                            "ec_breakdown_id": BREAKDOWN_ID,
+                            "calculation_status": "processing",
+                        },
+                        "2": {
+                            "ec_breakdown_id": BREAKDOWN_ID,
+                            "calculation_status": "completed",
+                            "ai_ec_breakdown_id": AI_BREAKDOWN_ID,
+                            "ai_calculation_status": "processing",
+                        },
+                    },
+                }
+            ]
+        ),
+        ec_breakdown=FakeCollection(
+            [{"_id": BREAKDOWN_ID, "element_count": 4}],
+            aggregated=[
+                {"_id": {"category": "Slab"}, "ec": 30.0, "mass": 3.0},
+                {"_id": {"category": "Wall"}, "ec": 10.0, "mass": 2.0},
+            ],
+        ),
+        ec_elements=FakeCollection(
+            [
+                element(3, "Superstructure", "Wall", "Brick"),
+                element(0, "Substructure", "Slab", "Concrete"),
+                element(2, "Superstructure", "Slab", "Concrete"),
+                element(1, "Superstructure", "Wall", "Concrete"),
+                element(0, "Superstructure", "Wall", "Brick", AI_BREAKDOWN_ID),
+            ]
+        ),
+    )
+    monkeypatch.setattr(main.app, "mongodb", db)
+    return db
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def test_elements(db, client):
+    response = client.get(f"/projects/{PROJECT_ID}/elements")
+
+    assert response.status_code == 200
+    result = response.json()
+    assert result["version"] == "2"
+    assert result["total"] == 4
+    assert [row["element_id"] for row in result["elements"]] == [100, 101, 102, 103]
+    assert set(result["elements"][0]) == set(main.ELEMENT_FIELDS) - {"_id", "units"}
+
+
+def test_elements_filters_and_pages(db, client):
+    response = client.get(
+        f"/projects/{PROJECT_ID}/elements",
+        params={
+            "building_system": "Superstructure",
+            "material": ["Concrete", "Steel"],
+            "skip": 1,
+            "limit": 1,
+        },
+    )
+
+    result = response.json()
+    assert result["total"] == 2
+    assert [row["element_id"] for row in result["elements"]] == [102]
+
+
+def test_elements_without_stored_rows(db, client):
+    db.ec_breakdown.documents[0].pop("element_count")
+
+    response = client.get(f"/projects/{PROJECT_ID}/elements")
+
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize(
+    "params",
+    [{"version": "3"}, {"version": "1"}, {"calculation_type": "ai_enhanced"}],
+)
+def test_incomplete_calculations(db, client, params):
+    for endpoint in ("elements", "ec_cube"):
+        response = client.get(f"/projects/{PROJECT_ID}/{endpoint}", params=params)
+        assert response.status_code == 400
+
+
+def test_unknown_project(db, client):
+    for endpoint in ("elements", "ec_cube"):
+        response = client.get(f"/projects/{ObjectId()}/{endpoint}")
+        assert response.status_code == 404
+
+
+def test_ec_cube(db, client):
+    response = client.get(
+        f"/projects/{PROJECT_ID}/ec_cube",
+        params={"group_by": "category", "storey": ["Level 1", "Level 2"]},
+    )
+
+    assert response.status_code == 200
+    result = response.json()
+    assert result["group_by"] == ["category"]
+    assert result["cells"] == [
+        {"category": "Slab", "ec": 30.0, "mass": 3.0},
+        {"category": "Wall", "ec": 10.0, "mass": 2.0},
+    ]
+    assert result["total_ec"] == 40.0
+    assert result["total_mass"] == 5.0
+
+    (pipeline,) = db.ec_breakdown.pipelines
+    assert pipeline[0] == {"$match": {"_id": BREAKDOWN_ID}}
+    assert {"$match": {"storey": {"$in": ["Level 1", "Level 2"]}}} in pipeline
+    (group,) = [stage["$group"] for stage in pipeline if "$group" in stage]
+    assert group["_id"] == {"category": "$category"}
+
+
+def test_ec_cube_invalid_group_by(db, client):
+    response = client.get(
+        f"/projects/{PROJECT_ID}/ec_cube", params={"group_by": "colour"}
+    )
+
+    assert response.status_code == 400
+    assert not db.ec_breakdown.pipelines
@@ -0,0 +1,159 @@
+from collections import OrderedDict
+from itertools import count
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import ifcopenshell.api.pset
+import ifcopenshell.api.root
+
+from calculator_processor.utils import (
+    element_cache,
+    element_index,
+    embedding_cache,
+    geometry_cache,
+)
+from calculator_processor.utils.element_index import ElementIndex
+
+
+@pytest.fixture(autouse=True)
+def cache_dirs(tmp_path, monkeypatch):
+    """Keep every cache in its own empty directory"""
+    for module, prefix in (
+        (element_cache, "ELEMENT_CACHE"),
+        (geometry_cache, "GEOMETRY_CACHE"),
+        (embedding_cache, "EMBEDDING_CACHE"),
+    ):
+        monkeypatch.setattr(module, f"{prefix}_ENABLED", True)
+        monkeypatch.setattr(module, f"{prefix}_DIR", str(tmp_path / prefix.lower()))
+    monkeypatch.setattr(embedding_cache, "_memory", OrderedDict())
+    monkeypatch.setattr(
+        embedding_cache, "_stats", {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+    )
+
+
+def tick(module, monkeypatch):
+    """Give each call of time.time() in a cache module a later time"""
+    monkeypatch.setattr(module, "time", SimpleNamespace(time=count().__next__))
+
+
+class FakeModel:
+    """Sentence encoder returning a fixed embedding per description"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, descriptions, batch_size=32):
+        self.encoded.extend(descriptions)
+        return np.array([[len(text), text.count("a")] for text in descriptions])
+
+
+def test_element_cache_hit_and_invalidation():
+    element_cache.store(
+        "context",
+        {"wall": ("fingerprint", {"ec": 1.5}), "slab": ("fingerprint", {"ec": 2.0})},
+    )
+
+    records = element_cache.load(
+        "context", {"wall": "fingerprint", "slab": "changed", "beam": "fingerprint"}
+    )
+    assert records == {"wall": {"ec": 1.5}}
+    # Results depend on the context too, e.g. the material database
+    assert element_cache.load("other context", {"wall": "fingerprint"}) == {}
+
+
+def test_element_cache_eviction(monkeypatch):
+    monkeypatch.setattr(element_cache, "ELEMENT_CACHE_MAX_ENTRIES", 2)
+    tick(element_cache, monkeypatch)
+    for global_id in ("a", "b", "c"):
+        element_cache.store("context", {global_id: ("fingerprint", {})})
+
+    records = element_cache.load(
+        "context", {global_id: "fingerprint" for global_id in "abc"}
+    )
+    assert set(records) == {"b", "c"}
+
+
+def test_element_cache_disabled(monkeypatch):
+    monkeypatch.setattr(element_cache, "ELEMENT_CACHE_ENABLED", False)
+    assert not element_cache.store("context", {"wall": ("fingerprint", {})})
+    assert element_cache.load("context", {"wall": "fingerprint"}) == {}
+
+
+def test_fingerprint_follows_quantities(ifc_model):
+    wall = ifcopenshell.api.root.create_entity(ifc_model, ifc_class="IfcWall")
+    qto = ifcopenshell.api.pset.add_qto(
+        ifc_model, product=wall, name="Qto_WallBaseQuantities"
+    )
+    ifcopenshell.api.pset.edit_qto(ifc_model, qto=qto, properties={"NetVolume": 1.0})
+    fingerprint = ElementIndex(ifc_model).fingerprint(wall)
+
+    assert ElementIndex(ifc_model).fingerprint(wall) == fingerprint
+    ifcopenshell.api.pset.edit_qto(ifc_model, qto=qto, properties={"NetVolume": 2.0})
+    assert ElementIndex(ifc_model).fingerprint(wall) != fingerprint
+
+
+def test_model_index_is_released(ifc_model):
+    index = element_index.get_model_index(ifc_model)
+    assert element_index.get_model_index(ifc_model) is index
+
+    element_index.release_model_index()
+
+    assert element_index._last_index is None
+    assert element_index.get_model_index(ifc_model) is not index
+    element_index.release_model_index()
+
+
+def test_geometry_cache_hit_and_invalidation(monkeypatch):
+    geometry_cache.store("hash", {"wall": (1.5, 7.0), "slab": (None, None)})
+
+    assert geometry_cache.load("hash") == {"wall": (1.5, 7.0), "slab": (None, None)}
+    assert geometry_cache.load("other hash") == {}
+    # Results of an older way of computing the geometry are not reused
+    monkeypatch.setattr(
+        geometry_cache,
+        "GEOMETRY_CACHE_VERSION",
+        geometry_cache.GEOMETRY_CACHE_VERSION + 1,
+    )
+    assert geometry_cache.load("hash") == {}
+
+
+def test_geometry_cache_evicts_models(monkeypatch):
+    monkeypatch.setattr(geometry_cache, "GEOMETRY_CACHE_MAX_ENTRIES", 3)
+    tick(geometry_cache, monkeypatch)
+    geometry_cache.store("old", {"a": (1.0, 1.0), "b": (1.0, 1.0)})
+    geometry_cache.store("new", {"a": (2.0, 2.0), "b": (2.0, 2.0)})
+
+    assert geometry_cache.load("old") == {}
+    assert geometry_cache.load("new") == {"a": (2.0, 2.0), "b": (2.0, 2.0)}
+
+
+def test_embedding_cache():
+    model = FakeModel()
+    descriptions = ["concrete slab", "brick wall", "concrete slab"]
+
+    embeddings = embedding_cache.encode("model", descriptions, lambda: model)
+    assert embeddings.tolist() == [[13, 1], [10, 1], [13, 1]]
+    assert model.encoded == ["concrete slab", "brick wall"]
+
+    embedding_cache.encode("model", descriptions[:2], lambda: model)
+    assert model.encoded == ["concrete slab", "brick wall"]
+    assert embedding_cache.stats()["memory_hits"] == 2
+
+    # Another process only finds the embeddings on disk
+    embedding_cache._memory.clear()
+    embeddings = embedding_cache.encode("model", ["brick wall"], lambda: None)
+    assert embeddings.tolist() == [[10, 1]]
+    assert embedding_cache.stats()["disk_hits"] == 1
+
+    # Embeddings of another model are not reused
+    assert embedding_cache.encode("other model", ["brick wall"], lambda: None) is None
+
+
+def test_embedding_cache_disabled(monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_ENABLED", False)
+    model = FakeModel()
+
+    embedding_cache.encode("model", ["brick wall"], lambda: model)
+    embedding_cache.encode("model", ["brick wall"], lambda: model)
+    assert model.encoded == ["brick wall", "brick wall"]
@@ -0,0 +1,104 @@
+from calculator_processor.utils import diagnostics
+from calculator_processor.utils.diagnostics import Diagnostics
+
+
+def test_report_counts_and_samples(monkeypatch):
+    monkeypatch.setattr(diagnostics, "DIAGNOSTICS_SAMPLE_SIZE", 2)
+    collector = Diagnostics()
+    for element_id in (1, 2, 2, 3):
+        collector.report("Wall", "No volume", element_id, level="ERROR")
+    collector.report("Slab", "Material not found", 4)
+
+    assert collector.summary() == [
+        {
+            "category": "Wall",
+            "issue": "No volume",
+            "level": "ERROR",
+            "count": 4,
+            "sample_ids": [1, 2],
+        },
+        {
+            "category": "Slab",
+            "issue": "Material not found",
+            "level": "WARNING",
+            "count": 1,
+            "sample_ids": [4],
+        },
+    ]
+
+
+def test_merge(monkeypatch):
+    monkeypatch.setattr(diagnostics, "DIAGNOSTICS_SAMPLE_SIZE", 3)
+    collector = Diagnostics()
+    collector.report("Wall", "No volume", 1)
+    collector.report("Wall", "No volume", 2)
+    worker = Diagnostics()
+    worker.report("Wall", "No volume", 2)
+    worker.report("Wall", "No volume", 3)
+    worker.report("Wall", "No volume", 4)
+    worker.report("Beam", "Rebar set not found", 5, level="ERROR")
+
+    assert collector.merge(worker) is collector
+    assert collector.counts == {
+        ("Wall", "No volume"): 5,
+        ("Beam", "Rebar set not found"): 1,
+    }
+    assert collector.samples[("Wall", "No volume")] == [1, 2, 3]
+    assert collector.levels[("Beam", "Rebar set not found")] == "ERROR"
+
+
+def test_forget():
+    collector = Diagnostics(track_elements=True)
+    collector.report("Wall", "No volume", 1)
+    collector.report("Wall", "No volume", 2)
+    collector.report("Wall", "Material not found", 2)
+
+    collector.forget({2})
+
+    assert collector.counts == {("Wall", "No volume"): 1}
+    assert collector.samples == {("Wall", "No volume"): [1]}
+    assert collector.element_reports == [(1, ("Wall", "No volume"))]
+
+
+def test_module_collector():
+    collector = diagnostics.collect()
+    diagnostics.report("Wall", "No volume", 1)
+    other = diagnostics.collect()
+    diagnostics.resume(collector)
+    diagnostics.report("Wall", "No volume", 2)
+
+    assert diagnostics.current() is collector
+    assert collector.counts[("Wall", "No volume")] == 2
+    assert not other.counts
+
+
+def test_element_issues():
+    collector = Diagnostics(track_elements=True)
+    collector.report("Wall", "No volume", 1, level="ERROR")
+    worker = Diagnostics(track_elements=True)
+    worker.report("Wall", "Material not found", 1)
+    worker.report("Slab", "Material not found", 2)
+
+    collector.merge(worker)
+
+    assert collector.element_issues() == {
+        1: [["Wall", "No volume", "ERROR"], ["Wall", "Material not found", "WARNING"]],
+        2: [["Slab", "Material not found", "WARNING"]],
+    }
+
+
+def test_from_summary():
+    collector = Diagnostics()
+    collector.report("Wall", "No volume", 1, level="ERROR")
+    collector.report("Wall", "No volume", 2, level="ERROR")
+    collector.report("Slab", "Material not found", 3)
+
+    restored = Diagnostics.from_summary(collector.summary())
+    restored.report("Wall", "No volume", 4)
+
+    assert restored.counts == {
+        ("Wall", "No volume"): 3,
+        ("Slab", "Material not found"): 1,
+    }
+    assert restored.samples[("Wall", "No volume")] == [1, 2, 4]
+    assert restored.levels[("Wall", "No volume")] == "ERROR"
@@ -0,0 +1,246 @@
+import pytest
+import ifcopenshell.api.root
+
+from calculator_processor.utils import diagnostics
+from calculator_processor.utils.ec_table import (
+    AREA,
+    ECTable,
+    REBAR_DENSITY,
+    REBAR_EC_PER_KG,
+    load_takeoff,
+    save_takeoff,
+)
+
+MATERIAL_LIST = {
+    "Concrete": [0.1, 2400],
+    "Brick": [0.2, 1800],
+    "Glass": 50,
+}
+
+
+def material_family(name):
+    return "Concrete" if name in ("Concrete", "Rebar") else "Other"
+
+
+@pytest.fixture
+def elements(ifc_model):
+    return [
+        ifcopenshell.api.root.create_entity(ifc_model, ifc_class=ifc_class)
+        for ifc_class in ("IfcSlab", "IfcWall", "IfcWindow")
+    ]
+
+
+@pytest.fixture
+def table(elements):
+    slab, wall, window = elements
+    table = ECTable(substructure_ids=[slab.id()])
+    row = table.add_element(slab, "Slab", rebar_volume=0.01)
+    table.add_line(row, "Concrete", 2.0)
+    row = table.add_element(wall, "Wall")
+    table.add_line(row, "Brick", 1.0)
+    table.add_line(row, "Concrete", 0.5)
+    row = table.add_element(window, "Window")
+    table.add_line(row, "Glass", 3.0, AREA)
+    table.assign_storeys({slab.id(): "Level 0", wall.id(): "Level 1"})
+    return table
+
+
+def test_evaluate(table):
+    table.evaluate(MATERIAL_LIST)
+
+    rebar_ec = 0.01 * REBAR_EC_PER_KG * REBAR_DENSITY
+    assert table.element_ec.tolist() == pytest.approx(
+        [0.1 * 2400 * 2 + rebar_ec, 0.2 * 1800 + 0.1 * 2400 * 0.5, 50 * 3]
+    )
+    assert table.total_ec() == pytest.approx(sum(table.element_ec))
+    # The rebar entry follows the lines of its element
+    assert table.entry_rows.tolist() == [0, 0, 1, 1, 2]
+
+
+def test_total_ec_requires_evaluate(table):
+    with pytest.raises(RuntimeError):
+        table.total_ec()
+
+
+def test_summarize(table):
+    table.evaluate(MATERIAL_LIST)
+    summary = table.summarize(material_family)
+    slab_ec, wall_ec, window_ec = table.element_ec.tolist()
+
+    # (substructure, superstructure)
+    assert summary["by_building_system"] == pytest.approx(
+        (slab_ec, wall_ec + window_ec)
+    )
+    assert summary["by_category"] == pytest.approx(
+        {"Slab": slab_ec, "Wall": wall_ec, "Window": window_ec}
+    )
+    assert summary["by_material"] == pytest.approx(
+        {
+            "Concrete": slab_ec + 0.1 * 2400 * 0.5,
+            "Other": 0.2 * 1800 + window_ec,
+        }
+    )
+    assert summary["material_counts"] == {
+        "Concrete": 2,
+        "Rebar": 1,
+        "Brick": 1,
+        "Glass": 1,
+    }
+
+    cube = {
+        (cell["storey"], cell["category"], cell["material_family"]): cell
+        for cell in summary["cube"]
+    }
+    assert cube[("Level 0", "Slab", "Concrete")]["ec"] == pytest.approx(slab_ec)
+    assert cube[("Unassigned", "Window", "Other")]["mass"] == pytest.approx(3)
+    assert sum(cell["ec"] for cell in summary["cube"]) == pytest.approx(
+        table.total_ec()
+    )
+
+
+def test_missing_quantity_is_reported(elements):
+    slab = elements[0]
+    table = ECTable()
+    row = table.add_element(slab, "Slab")
+    table.add_line(row, "Concrete", None)
+    table.add_line(row, "Brick", 1.0)
+
+    collector = diagnostics.collect()
+    table.evaluate(MATERIAL_LIST)
+
+    assert table.total_ec() == pytest.approx(0.2 * 1800)
+    assert collector.summary() == [
+        {
+            "category": "Slab",
+            "issue": "No quantity, left out of the EC",
+            "level": "ERROR",
+            "count": 1,
+            "sample_ids": [slab.id()],
+        }
+    ]
+
+
+def test_take(table, elements):
+    taken = table.take([2, 0])
+
+    assert taken.element_ids.tolist() == [elements[2].id(), elements[0].id()]
+    assert taken.line_elements.tolist() == [0, 1]
+    assert [taken.materials[code] for code in taken.line_materials] == [
+        "Glass",
+        "Concrete",
+    ]
+    table.evaluate(MATERIAL_LIST)
+    taken.evaluate(MATERIAL_LIST)
+    assert taken.element_ec.tolist() == pytest.approx(table.element_ec[[2, 0]])
+
+
+def test_extend(table, elements):
+    other = ECTable()
+    row = other.add_element(elements[1], "Wall")
+    other.add_line(row, "Glass", 1.0, AREA)
+
+    combined = ECTable().extend(table).extend(other)
+
+    assert len(combined) == 4
+    assert combined.line_elements.tolist() == [0, 1, 1, 2, 3]
+    combined.evaluate(MATERIAL_LIST)
+    table.evaluate(MATERIAL_LIST)
+    assert combined.total_ec() == pytest.approx(table.total_ec() + 50)
+
+
+def test_takeoff_round_trip(table, tmp_path):
+    path = tmp_path / "takeoff.npz"
+    save_takeoff(
+        {
+            "table": table,
+            "missing_materials": {"IfcWall": [(1, "Brick")]},
+            "matched_materials": {"Slab": ["Concrete"]},
+            "element_type_skipped": [("IfcRamp", 2)],
+        },
+        path,
+    )
+    takeoff = load_takeoff(path)
+    loaded = takeoff["table"]
+
+    assert loaded.takeoffs() == table.takeoffs()
+    assert loaded.element_ids == table.element_ids
+    assert loaded.storeys == table.storeys
+    assert loaded.element_storeys == table.element_storeys
+    assert takeoff["missing_materials"] == {"IfcWall": [(1, "Brick")]}
+    assert takeoff["matched_materials"] == {"Slab": ["Concrete"]}
+    assert takeoff["element_type_skipped"] == [("IfcRamp", 2)]
+
+    loaded.evaluate(MATERIAL_LIST)
+    table.evaluate(MATERIAL_LIST)
+    assert loaded.total_ec() == pytest.approx(table.total_ec())
+
+
+def test_evaluate_takeoff_reports_missing_quantity(elements, monkeypatch):
+    from calculator_processor.utils import calculator
+
+    monkeypatch.setattr(calculator, "MaterialList", MATERIAL_LIST)
+    slab = elements[0]
+    table = ECTable()
+    row = table.add_element(slab, "Slab")
+    table.add_line(row, "Concrete", None)
+    stored = diagnostics.Diagnostics()
+    stored.report("Slab", "Material not found", slab)
+    takeoff = {
+        "table": table,
+        "missing_materials": {"IfcSlab": []},
+        "matched_materials": {},
+        "element_type_skipped": [],
+        "diagnostics": stored.summary(),
+    }
+
+    for _ in range(2):
+        _, ec_data, *_ = calculator.evaluate_takeoff(takeoff, with_breakdown=True)
+        # Issues of evaluating the table are not added to the stored ones
+        assert {
+            (entry["issue"], entry["count"]) for entry in ec_data["diagnostics"]
+        } == {("Material not found", 1), ("No quantity, left out of the EC", 1)}
+
+
+def test_categorize_material():
+    from calculator_processor.utils import calculator
+
+    assert calculator.categorize_material("Concrete C30/37") == "Concrete"
+    assert calculator.categorize_material("Brick") == "Others"
+    assert calculator.categorize_material(None) == "Others"
+
+
+def test_deferred_elements_without_a_match_keep_their_results(elements, monkeypatch):
+    from calculator_processor.utils import calculator
+
+    slab, wall, window = elements
+    runs = []
+
+    def calculate_slabs(elements, index=None, table=None):
+        runs.append([element.id() for element in elements])
+        for element in elements:
+            row = table.add_element(element, "Slab")
+            # Materials are only found once the searches are answered
+            table.add_line(row, "Concrete", 1.0 if len(runs) > 1 else None)
+        return table, [], []
+
+    monkeypatch.setattr(
+        calculator.calculator_utils,
+        "has_material_match",
+        lambda element_data: element_data["element_id"] == slab.id(),
+    )
+    result = calculate_slabs(elements, table=ECTable())
+    queries = [{"element_id": slab.id()}, {"element_id": wall.id()}]
+
+    table, _, _ = calculator.calculate_deferred(
+        calculate_slabs,
+        elements,
+        result,
+        diagnostics.Diagnostics(True),
+        queries,
+        None,
+        [],
+    )
+
+    assert runs[1:] == [[slab.id()]]
+    assert table.element_ids.tolist() == [slab.id(), wall.id(), window.id()]
+    assert [quantity == 1.0 for quantity in table.quantities] == [True, False, False]
@@ -0,0 +1,161 @@
+import math
+
+import pytest
+import ifcopenshell
+import ifcopenshell.api.geometry
+import ifcopenshell.api.root
+import ifcopenshell.geom
+import ifcopenshell.guid
+
+from calculator_processor.utils import geometry
+
+PROFILES = {
+    "rectangle": ("IfcRectangleProfileDef", 0.3, 0.5),
+    "rounded_rectangle": ("IfcRoundedRectangleProfileDef", 0.3, 0.5, 0.05),
+    "rectangle_hollow": ("IfcRectangleHollowProfileDef", 0.3, 0.5, 0.01, 0.01, 0.02),
+    "rectangle_hollow_sharp": (
+        "IfcRectangleHollowProfileDef",
+        0.2,
+        0.2,
+        0.008,
+        None,
+        None,
+    ),
+    "circle": ("IfcCircleProfileDef", 0.25),
+    "circle_hollow": ("IfcCircleHollowProfileDef", 0.25, 0.02),
+    "i_shape": ("IfcIShapeProfileDef", 0.2, 0.4, 0.01, 0.015, 0.012),
+}
+
+
+def create_profile(model, ifc_class, *dimensions):
+    return model.create_entity(ifc_class, "AREA", None, None, *dimensions)
+
+
+def extrude(model, profile, depth=3.0):
+    return model.createIfcExtrudedAreaSolid(
+        profile, None, model.createIfcDirection((0.0, 0.0, 1.0)), depth
+    )
+
+
+def add_beam(model, context, *items):
+    beam = ifcopenshell.api.root.create_entity(model, ifc_class="IfcBeam")
+    representation = model.createIfcShapeRepresentation(
+        context, "Body", "SweptSolid", list(items)
+    )
+    ifcopenshell.api.geometry.assign_representation(
+        model, product=beam, representation=representation
+    )
+    return beam
+
+
+def tessellated_quantities(element):
+    shape = ifcopenshell.geom.create_shape(geometry.get_settings(), element)
+    return geometry.mesh_quantities(shape.geometry)
+
+
+def test_rectangle_profiles(ifc_model):
+    rectangle = create_profile(ifc_model, "IfcRectangleProfileDef", 0.3, 0.5)
+    assert geometry.profile_quantities(rectangle) == pytest.approx((0.15, 1.6))
+
+    rounded = create_profile(ifc_model, "IfcRoundedRectangleProfileDef", 0.3, 0.5, 0.05)
+    assert geometry.profile_quantities(rounded) == pytest.approx(
+        (0.15 - (4 - math.pi) * 0.05**2, 1.6 - (8 - 2 * math.pi) * 0.05)
+    )
+
+    hollow = create_profile(
+        ifc_model, "IfcRectangleHollowProfileDef", 0.2, 0.2, 0.008, None, None
+    )
+    assert geometry.profile_quantities(hollow) == pytest.approx(
+        (0.2**2 - 0.184**2, 4 * 0.2 + 4 * 0.184)
+    )
+
+
+def test_unsupported_profile(ifc_model, body_context):
+    profile = create_profile(ifc_model, "IfcTShapeProfileDef", 0.3, 0.5, 0.01, 0.015)
+    assert geometry.profile_quantities(profile) is None
+    beam = add_beam(ifc_model, body_context, extrude(ifc_model, profile))
+    assert geometry.analytic_quantities(beam) is None
+
+
+def test_asymmetric_i_shape_profile():
+    # A subtype of IfcIShapeProfileDef in IFC2X3 only
+    model = ifcopenshell.file(schema="IFC2X3")
+    profile = create_profile(
+        model, "IfcAsymmetricIShapeProfileDef", 0.2, 0.4, 0.01, 0.015, None, 0.1, 0.01
+    )
+    assert geometry.profile_quantities(profile) is None
+
+
+def test_tapered_extrusion(ifc_model, body_context):
+    solid = ifc_model.createIfcExtrudedAreaSolidTapered(
+        create_profile(ifc_model, "IfcRectangleProfileDef", 0.3, 0.5),
+        None,
+        ifc_model.createIfcDirection((0.0, 0.0, 1.0)),
+        3.0,
+        create_profile(ifc_model, "IfcRectangleProfileDef", 0.15, 0.25),
+    )
+    plane = ifc_model.createIfcPlane(
+        ifc_model.createIfcAxis2Placement3D(
+            ifc_model.createIfcCartesianPoint((0.0, 0.0, 2.0))
+        )
+    )
+    clipping = ifc_model.createIfcBooleanClippingResult(
+        "DIFFERENCE", solid, ifc_model.createIfcHalfSpaceSolid(plane, False)
+    )
+
+    assert (
+        geometry.analytic_quantities(add_beam(ifc_model, body_context, solid)) is None
+    )
+    assert (
+        geometry.analytic_quantities(add_beam(ifc_model, body_context, clipping))
+        is None
+    )
+
+
+@pytest.mark.parametrize("name", PROFILES)
+def test_extrusion_matches_tessellation(ifc_model, body_context, name):
+    profile = create_profile(ifc_model, *PROFILES[name])
+    beam = add_beam(ifc_model, body_context, extrude(ifc_model, profile))
+
+    volume, area = geometry.analytic_quantities(beam)
+    profile_area, perimeter = geometry.profile_quantities(profile)
+    assert volume == pytest.approx(profile_area * 3.0)
+    assert area == pytest.approx(2 * profile_area + perimeter * 3.0)
+
+    # Curved edges are tessellated into segments
+    tessellated_volume, tessellated_area = tessellated_quantities(beam)
+    assert volume == pytest.approx(tessellated_volume, rel=1e-2)
+    assert area == pytest.approx(tessellated_area, rel=1e-2)
+
+
+def test_clipped_extrusion(ifc_model, body_context):
+    solid = extrude(
+        ifc_model, create_profile(ifc_model, "IfcRectangleProfileDef", 0.3, 0.5)
+    )
+    plane = ifc_model.createIfcPlane(
+        ifc_model.createIfcAxis2Placement3D(
+            ifc_model.createIfcCartesianPoint((0.0, 0.0, 2.0))
+        )
+    )
+    clipping = ifc_model.createIfcBooleanClippingResult(
+        "DIFFERENCE", solid, ifc_model.createIfcHalfSpaceSolid(plane, False)
+    )
+    beam = add_beam(ifc_model, body_context, clipping)
+
+    volume, area = geometry.analytic_quantities(beam)
+    assert volume == pytest.approx(0.15 * 2.0)
+    assert area == pytest.approx(2 * 0.15 + 1.6 * 2.0)
+    assert (volume, area) == pytest.approx(tessellated_quantities(beam))
+
+
+def test_openings_need_tessellation(ifc_model, body_context):
+    profile = create_profile(ifc_model, "IfcRectangleProfileDef", 0.3, 0.5)
+    beam = add_beam(ifc_model, body_context, extrude(ifc_model, profile))
+    opening = ifcopenshell.api.root.create_entity(
+        ifc_model, ifc_class="IfcOpeningElement"
+    )
+    ifc_model.createIfcRelVoidsElement(
+        ifcopenshell.guid.new(), None, None, None, beam, opening
+    )
+
+    assert geometry.analytic_quantities(beam) is None
@@ -0,0 +1,162 @@
+import io
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from botocore.exceptions import ClientError
+
+from calculator_processor.utils import calculator_utils
+from calculator_processor.utils.material_store import MaterialStore
+
+
+class NoSuchKey(ClientError):
+    def __init__(self):
+        super().__init__({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+
+
+class FakeS3:
+    """The part of an S3 client the material database uses, with ETags"""
+
+    exceptions = SimpleNamespace(NoSuchKey=NoSuchKey, ClientError=ClientError)
+
+    def __init__(self):
+        self.objects = {}
+        self.etags = {}
+        # Called before a conditional put, e.g. to publish from another job
+        self.before_put = None
+
+    def write(self, key, body):
+        self.objects[key] = body
+        self.etags[key] = f'"{len(self.etags)}"'
+
+    def upload_fileobj(self, data, bucket, key, ExtraArgs=None):
+        self.write(key, data.read())
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise NoSuchKey()
+
+    def download_fileobj(self, bucket, key, buffer):
+        buffer.write(self.objects[key])
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise NoSuchKey()
+        return {"Body": io.BytesIO(self.objects[Key]), "ETag": self.etags[Key]}
+
+    def put_object(
+        self, Bucket, Key, Body, ContentType, IfMatch=None, IfNoneMatch=None
+    ):
+        if self.before_put:
+            before_put, self.before_put = self.before_put, None
+            before_put()
+        if (IfMatch and self.etags.get(Key) != IfMatch) or (
+            IfNoneMatch and Key in self.objects
+        ):
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "PutObject")
+        self.write(Key, Body)
+
+    def get_paginator(self, operation):
+        return SimpleNamespace(
+            paginate=lambda Bucket, Prefix: [
+                {
+                    "Contents": [
+                        {"Key": key} for key in self.objects if key.startswith(Prefix)
+                    ]
+                }
+            ]
+        )
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete["Objects"]:
+            del self.objects[item["Key"]]
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(calculator_utils, "get_s3_client", lambda: s3)
+    monkeypatch.setattr(calculator_utils, "material_store", None)
+    monkeypatch.setattr(calculator_utils, "MaterialDatabaseVersion", None)
+    monkeypatch.setattr(calculator_utils, "_pending_materials", [])
+    # Every flush gets a later version
+    times = iter(range(1, 100))
+    monkeypatch.setattr(
+        calculator_utils.time,
+        "gmtime",
+        lambda: calculator_utils.time.struct_time(
+            (2025, 1, 1, 0, 0, next(times), 0, 1, 0)
+        ),
+    )
+    return s3
+
+
+def add(name):
+    calculator_utils.load_material_database()
+    record = {"material_name": name, "element_type": "Wall"}
+    embedding = np.array([len(name), 1.0], dtype=np.float32)
+    calculator_utils.material_store.append(record, embedding)
+    calculator_utils._pending_materials.append((record, embedding))
+
+
+def published(s3):
+    manifest, _ = calculator_utils.get_material_manifest()
+    return pd.read_csv(io.BytesIO(s3.objects[manifest["csv"]]))[
+        "material_name"
+    ].tolist()
+
+
+def test_flush_publishes_legacy_database(s3):
+    s3.write(
+        calculator_utils.MATERIAL_CSV_S3_PATH,
+        b"material_name,element_type\nBrick,Wall\n",
+    )
+    buffer = io.BytesIO()
+    np.save(buffer, np.array([[5.0, 1.0]], dtype=np.float32))
+    s3.write(calculator_utils.EMBEDDING_NPY_S3_PATH, buffer.getvalue())
+
+    add("Glass")
+    assert calculator_utils.flush_material_database()
+
+    assert published(s3) == ["Brick", "Glass"]
+    manifest, _ = calculator_utils.get_material_manifest()
+    assert manifest["previous_version"] is None
+    assert calculator_utils.MaterialDatabaseVersion == manifest["version"]
+
+
+def test_flush_rebases_on_concurrent_publish(s3):
+    add("Glass")
+
+    def publish_other():
+        # Another job with its own copy of the database
+        state = (calculator_utils.material_store, calculator_utils._pending_materials)
+        calculator_utils.material_store = MaterialStore()
+        calculator_utils._pending_materials = []
+        add("Timber")
+        assert calculator_utils.flush_material_database()
+        calculator_utils.material_store, calculator_utils._pending_materials = state
+        calculator_utils.MaterialDatabaseVersion = None
+
+    s3.before_put = publish_other
+    assert calculator_utils.flush_material_database()
+
+    assert sorted(published(s3)) == ["Glass", "Timber"]
+    assert not calculator_utils._pending_materials
+
+
+def test_flush_prunes_old_versions(s3):
+    versions = []
+    for name in ("Brick", "Glass", "Timber"):
+        add(name)
+        assert calculator_utils.flush_material_database()
+        versions.append(calculator_utils.MaterialDatabaseVersion)
+
+    assert sorted(
+        key for key in s3.objects if key != calculator_utils.MATERIAL_MANIFEST_S3_PATH
+    ) == [
+        f"{calculator_utils.MATERIAL_VERSIONS_S3_PREFIX}/{version}.{extension}"
+        for version in versions[1:]
+        for extension in ("csv", "npy")
+    ]
+    assert published(s3) == ["Brick", "Glass", "Timber"]
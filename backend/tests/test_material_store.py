@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculator_processor.utils import material_store
+from calculator_processor.utils.material_store import MaterialStore
+
+RECORDS = [
+    {"material_name": "Concrete C30", "element_type": "Slab"},
+    {"material_name": "Concrete C40", "element_type": "Column"},
+    {"material_name": "Brick", "element_type": "Wall"},
+    {"material_name": "Timber", "element_type": "Slab"},
+]
+EMBEDDINGS = np.array(
+    [[1.0, 0.1, 0.0], [0.9, 0.2, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 2.0]],
+    dtype=np.float32,
+)
+
+
+@pytest.fixture
+def store():
+    return MaterialStore.from_dataframe(pd.DataFrame(RECORDS), EMBEDDINGS)
+
+
+def test_records(store):
+    assert len(store) == 4
+    assert "Brick" in store
+    assert "Steel" not in store
+    assert store.material_name(store.rows["Timber"]) == "Timber"
+    assert store.embeddings.tolist() == EMBEDDINGS.tolist()
+    assert store.to_dataframe().to_dict("records") == RECORDS
+
+
+def test_growth_keeps_rows(store, monkeypatch):
+    rng = np.random.default_rng(0)
+    embeddings = rng.random((200, 3), dtype=np.float32)
+    records = [
+        {"material_name": f"Material {i}", "element_type": "Wall"} for i in range(200)
+    ]
+    store.extend(records[:150], embeddings[:150])
+    for record, embedding in zip(records[150:], embeddings[150:]):
+        store.append(record, embedding)
+
+    assert len(store) == 204
+    assert np.array_equal(store.embeddings[4:], embeddings)
+    assert len(store.partitions["Wall"]) == 201
+
+
+def test_search_partitions(store):
+    query = [[1.0, 0.0, 0.0]]
+
+    rows, similarities = store.search(query)
+    assert store.material_name(rows[0, 0]) == "Concrete C30"
+
+    # Only the materials of the element type are searched
+    rows, similarities = store.search(query, "Wall")
+    assert store.material_name(rows[0, 0]) == "Brick"
+    assert similarities[0, 0] == pytest.approx(0.0)
+
+    rows, similarities = store.search(query, "Roof")
+    assert rows.shape == (1, 0)
+
+
+def test_search_best_first(store):
+    rows, similarities = store.search([[1.0, 0.15, 0.0], [0.0, 0.1, 1.0]], k=3)
+
+    assert [[store.material_name(row) for row in query] for query in rows] == [
+        ["Concrete C30", "Concrete C40", "Brick"],
+        ["Timber", "Brick", "Concrete C40"],
+    ]
+    assert np.all(np.diff(similarities, axis=1) <= 0)
+    # Cosine similarity, whatever the length of the embeddings
+    assert similarities[1, 0] == pytest.approx(1 / np.sqrt(1.01))
+
+
+def test_approximate_search_matches_exact(monkeypatch):
+    pytest.importorskip("hnswlib")
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(500, 16)).astype(np.float32)
+    records = [{"material_name": f"Material {i}"} for i in range(500)]
+    queries = embeddings[:20] + rng.normal(scale=0.01, size=(20, 16))
+
+    exact = MaterialStore()
+    exact.extend(records, embeddings)
+    monkeypatch.setattr(material_store, "MATERIAL_ANN_THRESHOLD", 100)
+    approximate = MaterialStore()
+    approximate.extend(records[:300], embeddings[:300])
+    approximate.extend(records[300:], embeddings[300:])
+
+    assert approximate._all._graph is not None
+    assert exact._all._graph is None
+    assert np.array_equal(approximate.search(queries)[0], exact.search(queries)[0])
@@ -0,0 +1,177 @@
+import math
+
+import pytest
+import ifcopenshell.api.material
+import ifcopenshell.api.pset
+import ifcopenshell.api.root
+
+from calculator_processor.utils import diagnostics, rebar
+from calculator_processor.utils.ec_table import REBAR_DENSITY
+from calculator_processor.utils.element_index import ElementIndex
+
+
+def bar_area(diameter):
+    return 3.14 * (diameter / 2000) ** 2
+
+
+def add_element(model, ifc_class, rebar_set=None, dimensions=None):
+    element = ifcopenshell.api.root.create_entity(model, ifc_class=ifc_class)
+    for name, properties in (("Rebar Set", rebar_set), ("Dimensions", dimensions)):
+        if properties is not None:
+            pset = ifcopenshell.api.pset.add_pset(model, product=element, name=name)
+            ifcopenshell.api.pset.edit_pset(model, pset=pset, properties=properties)
+    return element
+
+
+def test_parse_specs():
+    assert rebar.parse_bars("3H16") == (3, 16)
+    assert rebar.parse_bars("H16") is None
+    assert rebar.parse_bars(None) is None
+    assert rebar.parse_spacing("H12-150") == (12, 150)
+    assert rebar.parse_spacing("H10-200-2") == (10, 200)
+    assert rebar.parse_spacing("12") is None
+
+
+def test_beam_volumes(ifc_model):
+    bars = {
+        "TopLeft": "3H16",
+        "BottomLeft": "2H20",
+        "TopMiddle": "2H16",
+        "BottomMiddle": "4H20",
+        "TopRight": "3H16",
+        "BottomRight": "2H20",
+    }
+    beams = [
+        add_element(ifc_model, "IfcBeam", bars, {"Length": 6000.0}),
+        # Missing positions count as no bars
+        add_element(ifc_model, "IfcBeam", {"TopLeft": "2H12"}, {"Length": 3000.0}),
+        add_element(ifc_model, "IfcBeam"),
+    ]
+
+    collector = diagnostics.collect()
+    volumes = rebar.beam_volumes(beams, ElementIndex(ifc_model))
+
+    # Top and bottom bars of each third, over a third of the 6 m length
+    thirds = (
+        3 * bar_area(16) + 2 * bar_area(20),
+        2 * bar_area(16) + 4 * bar_area(20),
+        3 * bar_area(16) + 2 * bar_area(20),
+    )
+    expected = sum(third * 6 / 3 for third in thirds)
+    assert volumes.tolist() == pytest.approx([expected, 0.0, 0.0])
+    assert collector.counts[("Beam", "Rebar set not found")] == 1
+
+
+def test_column_and_pile_volumes(ifc_model):
+    columns = [
+        add_element(ifc_model, "IfcColumn", {"MainRebar": "8H25"}, {"Height": 3500.0}),
+        # Columns without a height fall back to their length
+        add_element(ifc_model, "IfcColumn", {"MainRebar": "4H20"}, {"Length": 3000.0}),
+        add_element(ifc_model, "IfcColumn", {"MainRebar": "4H20"}, {}),
+    ]
+    piles = [
+        add_element(ifc_model, "IfcPile", {"MainRebar": "6H16"}, {"Length": 12000.0})
+    ]
+    index = ElementIndex(ifc_model)
+
+    collector = diagnostics.collect()
+    assert rebar.column_volumes(columns, index).tolist() == pytest.approx(
+        [3.5 * 8 * bar_area(25), 3 * 4 * bar_area(20), 0.0]
+    )
+    assert rebar.pile_volumes(piles, index).tolist() == pytest.approx(
+        [12 * 6 * bar_area(16)]
+    )
+    assert collector.counts[("Column", "Dimension not found")] == 1
+
+
+def footing_volume(length, width, thickness, bars):
+    """Rebar volume of one footing, bar by bar"""
+    length, breadth, height = (
+        (dimension - 2 * 50) / 1000 for dimension in (length, width, thickness)
+    )
+
+    def layer(name):
+        diameter, spacing = rebar.parse_spacing(bars[name])
+        return bar_area(diameter), spacing / 1000
+
+    def count(extent, spacing):
+        return math.floor(extent / spacing) + 1
+
+    area, spacing = layer("BottomDistribution")
+    length_count = count(length, spacing)
+    bottom = count(breadth, layer("BottomMain")[1]) * length * area
+    bottom += length_count * breadth * layer("BottomMain")[0]
+
+    area, spacing = layer("TopDistribution")
+    length_count = count(length, spacing)
+    breadth_count = count(breadth, layer("TopMain")[1])
+    top = breadth_count * length * area + length_count * breadth * layer("TopMain")[0]
+
+    area, spacing = layer("SideBar")
+    height_count = count(height, spacing)
+    side = 2 * area * (length_count + breadth_count) * height
+    side += 2 * area * height_count * (length + breadth)
+
+    area, spacing = layer("Stirrups")
+    stirrups = count(length, spacing) * (2 * breadth + 2 * height) * area
+    return bottom + top + side + stirrups
+
+
+def test_footing_volumes(ifc_model):
+    bars = {
+        "BottomDistribution": "H12-200",
+        "BottomMain": "H16-150",
+        "TopDistribution": "H10-250",
+        "TopMain": "H12-200",
+        "SideBar": "H10-300",
+        "Stirrups": "H10-200-2",
+    }
+    dimensions = [(2100.0, 1500.0, 600.0), (3000.0, 3000.0, 900.0)]
+    footings = [
+        add_element(
+            ifc_model,
+            "IfcFooting",
+            bars,
+            {"Length": length, "Width": width, "Foundation Thickness": thickness},
+        )
+        for length, width, thickness in dimensions
+    ]
+    footings.append(add_element(ifc_model, "IfcFooting", bars, {"Length": 2000.0}))
+
+    volumes = rebar.footing_volumes(footings, ElementIndex(ifc_model))
+
+    assert volumes.tolist() == pytest.approx(
+        [footing_volume(*size, bars) for size in dimensions] + [0.0]
+    )
+
+
+def test_beam_concrete_mass_excludes_rebar(ifc_model, monkeypatch):
+    from calculator_processor.utils import calculator
+
+    monkeypatch.setattr(calculator, "MaterialList", {"Concrete": [0.1, 2400]})
+    monkeypatch.setattr(
+        calculator.calculator_utils, "add_material_to_database", lambda data: True
+    )
+    bars = {
+        f"{face}{third}": "2H16"
+        for face in ("Top", "Bottom")
+        for third in ("Left", "Middle", "Right")
+    }
+    beam = add_element(ifc_model, "IfcBeam", bars, {"Length": 6000.0})
+    qto = ifcopenshell.api.pset.add_qto(
+        ifc_model, product=beam, name="Qto_BeamBaseQuantities"
+    )
+    ifcopenshell.api.pset.edit_qto(ifc_model, qto=qto, properties={"NetVolume": 0.9})
+    concrete = ifcopenshell.api.material.add_material(ifc_model, name="Concrete")
+    ifcopenshell.api.material.assign_material(
+        ifc_model, products=[beam], material=concrete
+    )
+
+    table, missing, _ = calculator.calculate_beams([beam], ElementIndex(ifc_model))
+    table.evaluate(calculator.MaterialList)
+
+    rebar_volume = 4 * bar_area(16) * 6
+    assert not missing
+    assert table.entry_mass.tolist() == pytest.approx(
+        [2400 * (0.9 - rebar_volume), REBAR_DENSITY * rebar_volume]
+    )